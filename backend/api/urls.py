@@ -3,7 +3,9 @@ from django.urls import path, include
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
+
+from common.cache import cache_stats
 
 class ApiRoot(APIView):
     permission_classes = [AllowAny]
@@ -15,8 +17,17 @@ class ApiRoot(APIView):
             "pet":  reverse('pet:api-root',  request=request),  # → /pet/
         })
 
+class CacheStats(APIView):
+    """当前进程的两级缓存命中统计（各 worker 独立计数），供监控抓取"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(cache_stats())
+
+
 urlpatterns = [
     path('', ApiRoot.as_view(), name='api-root'),
+    path('cache-stats/', CacheStats.as_view(), name='cache-stats'),
     path('user/', include(('apps.user.urls', 'user'), namespace='user')),
     path('pet/',  include(('apps.pet.urls',  'pet'),  namespace='pet')),
 ]
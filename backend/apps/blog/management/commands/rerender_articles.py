@@ -0,0 +1,58 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from apps.blog.models import Article
+from apps.blog.rendering import RENDERER_VERSION, content_hash, render_many
+
+FIELDS = ['content_html', 'toc_html', 'content_hash']
+
+
+class Command(BaseCommand):
+    help = "Re-render stored article HTML/TOC (after bumping RENDERER_VERSION or upgrading Markdown extensions)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Render processes (1 = in-process)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Articles per worker task / bulk_update')
+        parser.add_argument('--force', action='store_true', help='Re-render even if content_hash is current')
+
+    def _stale(self, force):
+        batch = []
+        rows = Article.objects.order_by('pk').values_list('pk', 'content', 'content_hash').iterator(chunk_size=500)
+        for pk, content, digest in rows:
+            if force or digest != content_hash(content):
+                batch.append((pk, content))
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _save(self, rendered):
+        objs = [Article(pk=pk, content_html=html, toc_html=toc, content_hash=digest) for pk, html, toc, digest in rendered]
+        # bulk_update 不经过 save()，不会触发二次渲染
+        Article.objects.bulk_update(objs, FIELDS)
+        return len(objs)
+
+    def handle(self, *args, **options):
+        self.batch_size = max(1, options['batch_size'])
+        workers = max(1, options['workers'])
+        batches = self._stale(options['force'])
+        done = 0
+        if workers == 1:
+            for batch in batches:
+                done += self._save(render_many(batch))
+        else:
+            # 最多 2×workers 个批次在途，内容不会一次性全部读进内存
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                inflight = deque()
+                for batch in batches:
+                    inflight.append(pool.submit(render_many, batch))
+                    if len(inflight) >= workers * 2:
+                        done += self._save(inflight.popleft().result())
+                        self.stdout.write(f'  ... {done} articles')
+                while inflight:
+                    done += self._save(inflight.popleft().result())
+        self.stdout.write(self.style.SUCCESS(f'Re-rendered {done} articles (renderer v{RENDERER_VERSION})'))
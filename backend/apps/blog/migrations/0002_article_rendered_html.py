@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:59
+
+from django.db import migrations, models
+
+
+def render_existing(apps, schema_editor):
+    from apps.blog.rendering import render_many
+
+    Article = apps.get_model('blog', 'Article')
+    batch = []
+    for pk, content in Article.objects.values_list('pk', 'content').iterator(chunk_size=200):
+        batch.append((pk, content))
+        if len(batch) >= 200:
+            _save(Article, render_many(batch))
+            batch = []
+    _save(Article, render_many(batch))
+
+
+def _save(Article, rendered):
+    objs = [Article(pk=pk, content_html=html, toc_html=toc, content_hash=digest) for pk, html, toc, digest in rendered]
+    Article.objects.bulk_update(objs, ['content_html', 'toc_html', 'content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='content hash'),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='content_html',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='content html'),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='toc_html',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='toc html'),
+        ),
+        migrations.RunPython(render_existing, migrations.RunPython.noop),
+    ]
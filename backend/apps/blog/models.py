@@ -4,8 +4,9 @@ from django.utils.text import Truncator
 from django.utils.html import strip_tags
 from django.contrib.contenttypes.fields import GenericRelation
 from django.conf import settings
-from apps.user.models import ViewStatistics
+from apps.user.models import ViewStatistics, ViewTotal
 from apps.comment.models import Comment
+from . import rendering
 
 
 # Create your models here.
@@ -60,7 +61,13 @@ class Article(BaseModel):
         blank=True
     )
     view_count = GenericRelation(ViewStatistics, verbose_name="View Statistics")
+    # 每篇文章至多一行的浏览量汇总，排序/展示用它而不是对 view_count 做 SUM
+    view_totals = GenericRelation(ViewTotal, verbose_name="View Totals")
     comments = GenericRelation(Comment, verbose_name="comment")
+    # 渲染缓存：content 或渲染器版本变化时（content_hash 不一致）在 save 中重新生成
+    content_html = models.TextField('content html', blank=True, default="", editable=False)
+    toc_html = models.TextField('toc html', blank=True, default="", editable=False)
+    content_hash = models.CharField('content hash', max_length=64, blank=True, default="", editable=False)
 
     class Meta:
         verbose_name = 'Article'
@@ -76,25 +83,28 @@ class Article(BaseModel):
             self.description = strip_tags(
                 Truncator(self.content).chars(190)
             ).replace("\n", "").replace("\r", "").replace(" ", "")
+        if self.refresh_rendered():
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | {"content_html", "toc_html", "content_hash"}
         super().save(*args, **kwargs)
 
+    def refresh_rendered(self) -> bool:
+        """content 变化时重新渲染 HTML/TOC；返回是否重新渲染"""
+        digest = rendering.content_hash(self.content)
+        if digest == self.content_hash:
+            return False
+        self.content_html, self.toc_html = rendering.render(self.content)
+        self.content_hash = digest
+        return True
+
     def get_markdown(self):
-        markdown = self._get_markdown_obj()
-        return markdown.convert(self.content)
+        self.refresh_rendered()
+        return self.content_html
 
     def get_toc(self):
-        markdown = self._get_markdown_obj()
-        markdown.convert(self.content)
-        return markdown.toc
-
-    def _get_markdown_obj(self):
-        import markdown
-        markdown = markdown.Markdown(extensions=[
-            'markdown.extensions.extra',
-            'markdown.extensions.codehilite',
-            'markdown.extensions.toc',
-        ])
-        return markdown
+        self.refresh_rendered()
+        return self.toc_html
 
 
 class Tag(BaseModel):
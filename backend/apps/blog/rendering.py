@@ -0,0 +1,49 @@
+# apps/blog/rendering.py
+"""
+文章 Markdown 渲染：一次 convert 同时得到 HTML 与目录（TOC）。
+
+Markdown 实例按线程复用（reset() 后重用，扩展只初始化一次）。本模块不依赖 Django，
+rerender_articles 命令的进程池子进程直接调用 render_many。
+升级 Markdown/扩展或修改扩展配置后把 RENDERER_VERSION 加 1，再运行 rerender_articles。
+"""
+import hashlib
+import threading
+
+RENDERER_VERSION = 1
+
+MARKDOWN_EXTENSIONS = [
+    'markdown.extensions.extra',
+    'markdown.extensions.codehilite',
+    'markdown.extensions.toc',
+]
+
+_local = threading.local()
+
+
+def _markdown():
+    md = getattr(_local, 'md', None)
+    if md is None:
+        import markdown
+        md = _local.md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return md.reset()
+
+
+def content_hash(content: str) -> str:
+    """内容 + 渲染器版本的 sha256；任一变化都视为需要重新渲染"""
+    return hashlib.sha256(f'{RENDERER_VERSION}\0{content or ""}'.encode('utf-8')).hexdigest()
+
+
+def render(content: str):
+    """返回 (html, toc_html)"""
+    md = _markdown()
+    html = md.convert(content or '')
+    return html, md.toc
+
+
+def render_many(items):
+    """[(pk, content)] -> [(pk, html, toc, hash)]，供进程池按块调用"""
+    out = []
+    for pk, content in items:
+        html, toc = render(content)
+        out.append((pk, html, toc, content_hash(content)))
+    return out
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from .models import Article, Category, Tag
 from apps.user.models import ViewStatistics
 from apps.comment.models import Comment
+from apps.user.avatar_utils import default_avatar_url
 import re
 
 
@@ -33,7 +34,7 @@ class AuthorInfoSerializer(serializers.Serializer):
                 if request:
                     return request.build_absolute_uri(obj.profile.avatar.url)
                 return obj.profile.avatar.url
-        return None
+        return default_avatar_url(obj.id, self.context.get('request'))
 
 
 class ArticleSerializer(serializers.ModelSerializer):
@@ -175,6 +176,11 @@ class BlogCommentSerializer(serializers.ModelSerializer):
         fields = ['id', 'owner', 'content', 'parent', 'add_date', 'pub_date', 'content_type', 'object_id']
         read_only_fields = ('content_type', 'object_id', 'add_date', 'pub_date', 'id')
 
+    def validate_parent(self, parent):
+        # 超过最大层数 / path 长度的回复在这里拒绝（400），不留到数据库报错
+        Comment.check_reply_to(parent)
+        return parent
+
     def create(self, validated_data):
         """自定义create方法以支持content_object"""
         content_object = self.context.get('content_object')
@@ -199,10 +205,13 @@ class BlogCommentListSerializer(serializers.ModelSerializer):
     """博客评论列表序列化器 - 用于展示"""
     user = serializers.SerializerMethodField()
     replies = serializers.SerializerMethodField()
+    # 直接回复总数；replies 只展开一部分时，用 replies_next 游标调 comment_replies 接口继续加载
+    reply_count = serializers.IntegerField(read_only=True)
+    replies_next = serializers.CharField(source='_replies_next', read_only=True, default=None)
 
     class Meta:
         model = Comment
-        fields = ['id', 'user', 'content', 'add_date', 'pub_date', 'parent', 'replies']
+        fields = ['id', 'user', 'content', 'add_date', 'pub_date', 'parent', 'depth', 'replies', 'reply_count', 'replies_next']
 
     def get_user(self, obj):
         """返回用户信息，包括头像"""
@@ -229,14 +238,15 @@ class BlogCommentListSerializer(serializers.ModelSerializer):
                     user_data['avatar'] = avatar_url
                     logger.info(f"Avatar URL (no request) for {obj.owner.username}: {avatar_url}")
             else:
-                user_data['avatar'] = None
-                logger.warning(f"No avatar for {obj.owner.username}")
+                user_data['avatar'] = default_avatar_url(obj.owner.id, self.context.get('request'))
         else:
-            user_data['avatar'] = None
+            user_data['avatar'] = default_avatar_url(obj.owner.id, self.context.get('request'))
             logger.warning(f"No profile for {obj.owner.username}")
         return user_data
 
     def get_replies(self, obj):
-        # 获取该评论的所有回复
-        replies = Comment.objects.filter(parent=obj)
+        # 由 apps.comment.tree 预先组装好的子树；单条评论（如刚发布的回复）才回退到逐层查询
+        replies = getattr(obj, '_tree_replies', None)
+        if replies is None:
+            replies = Comment.objects.filter(parent=obj).select_related('owner', 'owner__profile')
         return BlogCommentListSerializer(replies, many=True, context=self.context).data
@@ -1,3 +1,192 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.user.models import ViewStatistics, ViewTotal
+from apps.user.view_counter import ViewCounter, rollup_view_totals
+from .models import Article, Category
+
+
+class ArticleViewTotalsTest(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='News')
+        self.a = Article.objects.create(title='A', content='a', category=category)
+        self.b = Article.objects.create(title='B', content='b', category=category)
+        self.ct = ContentType.objects.get_for_model(Article)
+
+    def _ids(self, ordering):
+        resp = self.client.get('/blog/article/', {'ordering': ordering})
+        self.assertEqual(resp.status_code, 200)
+        return [row['id'] for row in resp.data['results']]
+
+    def test_ordering_by_rolled_up_totals(self):
+        counter = ViewCounter(flush_interval=3600)
+        today = timezone.now().date()
+        for uid in ('u1', 'u2', 'u3'):
+            counter.record(uid, self.ct.id, self.a.id, today)
+        counter.record('u1', self.ct.id, self.b.id, today)
+        counter.flush()
+
+        self.assertEqual(ViewTotal.objects.get(object_id=self.a.id).total, 3)
+        self.assertEqual(self._ids('-count'), [self.a.id, self.b.id])
+        self.assertEqual(self._ids('count'), [self.b.id, self.a.id])
+        self.assertEqual(ViewStatistics.get_view_count(self.a), 3)
+
+    def test_malformed_ordering_falls_back_to_default(self):
+        default = self._ids('-add_date')
+        for ordering in ('--count', '-', '---add_date', 'nope'):
+            self.assertEqual(self._ids(ordering), default)
+
+    def test_rollup_slides_windows(self):
+        old = timezone.now().date() - timedelta(days=10)
+        ViewStatistics.objects.create(content_type=self.ct, object_id=self.b.id, count=5)
+        ViewStatistics.objects.filter(object_id=self.b.id).update(date=old)
+        rollup_view_totals(full=True)
+        row = ViewTotal.objects.get(object_id=self.b.id)
+        self.assertEqual((row.total, row.last_7d, row.last_30d), (5, 0, 5))
+
+        rollup_view_totals(today=old + timedelta(days=40))
+        row.refresh_from_db()
+        self.assertEqual((row.total, row.last_7d, row.last_30d), (5, 0, 0))
+
+
+class CommentTreeTest(APITestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from apps.comment.models import Comment
+
+        self.user = get_user_model().objects.create_user(username='commenter', password='pass')
+        category = Category.objects.create(name='Talk')
+        self.article = Article.objects.create(title='T', content='t', category=category)
+        ct = ContentType.objects.get_for_model(Article)
+
+        def add(parent=None):
+            return Comment.objects.create(
+                owner=self.user, content_type=ct, object_id=self.article.id, content='x', parent=parent,
+            )
+
+        self.roots = [add() for _ in range(3)]
+        self.child = add(self.roots[0])
+        self.grandchild = add(self.child)
+        self.many = [add(self.roots[1]) for _ in range(25)]
+
+    def _get(self, action, params=None):
+        return self.client.get(f'/blog/article/{self.article.id}/{action}/', params or {})
+
+    def test_tree_loaded_with_constant_queries(self):
+        with self.assertNumQueries(4):  # 文章、计数、顶层一页、全部回复
+            resp = self._get('comments')
+        self.assertEqual(resp.status_code, 200)
+        by_id = {c['id']: c for c in resp.data['results']}
+        first = by_id[self.roots[0].id]
+        self.assertEqual(first['reply_count'], 1)
+        self.assertEqual(first['replies'][0]['replies'][0]['id'], self.grandchild.id)
+
+        busy = by_id[self.roots[1].id]
+        self.assertEqual((busy['reply_count'], len(busy['replies'])), (25, 20))
+        more = self._get('comment_replies', {'parent': self.roots[1].id, 'cursor': busy['replies_next']})
+        self.assertEqual(len(more.data['results']), 5)
+        self.assertIsNone(more.data['next'])
+        seen = {r['id'] for r in busy['replies']} | {r['id'] for r in more.data['results']}
+        self.assertEqual(seen, {c.id for c in self.many})
+
+    def test_max_depth(self):
+        resp = self._get('comments', {'max_depth': 1})
+        first = {c['id']: c for c in resp.data['results']}[self.roots[0].id]
+        self.assertEqual(first['replies'][0]['replies'], [])
+        self.assertEqual(first['replies'][0]['reply_count'], 1)
+        self.assertEqual(self._get('comments', {'max_depth': 'x'}).status_code, 400)
+
+    def test_tree_load_is_capped(self):
+        with self.settings(COMMENT_TREE_MAX_NODES=10):
+            resp = self._get('comments')
+        busy = {c['id']: c for c in resp.data['results']}[self.roots[1].id]
+        # 层优先：第一层先取满 10 条的预算，剩下的用 replies_next 继续
+        self.assertLessEqual(len(busy['replies']), 10)
+        self.assertIsNotNone(busy['replies_next'])
+        with self.settings(COMMENT_TREE_MAX_DEPTH=1):
+            first = {c['id']: c for c in self._get('comments').data['results']}[self.roots[0].id]
+        self.assertEqual(first['replies'][0]['replies'], [])
+
+    def test_too_deep_reply_is_rejected(self):
+        from django.core.exceptions import ValidationError
+        from apps.comment.models import Comment
+
+        self.client.force_authenticate(self.user)
+        url = f'/blog/article/{self.article.id}/add_comment/'
+        with self.settings(COMMENT_MAX_DEPTH=2):
+            resp = self.client.post(url, {'content': 'deep', 'parent': self.grandchild.id}, format='json')
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn('parent', resp.data)
+            with self.assertRaises(ValidationError):
+                Comment.objects.create(owner=self.user, content_type=self.grandchild.content_type,
+                                       object_id=self.article.id, content='deep', parent=self.grandchild)
+        self.assertFalse(Comment.objects.filter(content='deep').exists())
+        self.assertEqual(Comment.objects.get(pk=self.grandchild.pk).reply_count, 0)
+
+    def test_path_depth_and_reply_count(self):
+        from apps.comment.models import Comment
+
+        root = Comment.objects.get(pk=self.roots[0].pk)
+        grandchild = Comment.objects.get(pk=self.grandchild.pk)
+        self.assertEqual(grandchild.depth, 2)
+        self.assertTrue(grandchild.path.startswith(root.path))
+        self.assertEqual(root.reply_count, 1)
+        self.assertEqual(Comment.objects.get(pk=self.roots[1].pk).reply_count, 25)
+        self.assertEqual(root.thread_size(), 2)
+
+        self.many[0].delete()
+        self.assertEqual(Comment.objects.get(pk=self.roots[1].pk).reply_count, 24)
+        root.delete()
+        self.assertFalse(Comment.objects.filter(pk__in=[self.child.pk, self.grandchild.pk]).exists())
+
+    def test_replies_to_me(self):
+        from django.contrib.auth import get_user_model
+        from apps.comment.models import Comment
+
+        other = get_user_model().objects.create_user(username='other', password='pass')
+        for _ in range(3):
+            Comment.objects.create(
+                owner=other, content_type=self.roots[2].content_type, object_id=self.article.id,
+                content='re', parent=self.roots[2],
+            )
+        self.client.force_authenticate(self.user)
+        # 计数、本页回复、两棵子树、文章
+        with self.assertNumQueries(5):
+            resp = self.client.get('/blog/article/replies_to_me/')
+        self.assertEqual(resp.data['count'], 3)
+        first = resp.data['results'][0]
+        self.assertEqual(first['parent_comment']['id'], self.roots[2].id)
+        self.assertEqual(first['article_id'], self.article.id)
+
+
+class ArticleRenderingTest(APITestCase):
+    def test_rendered_once_and_refreshed_on_change(self):
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from . import rendering
+
+        category = Category.objects.create(name='Docs')
+        article = Article.objects.create(title='R', content='# Title\n\nbody', category=category)
+        self.assertIn('<h1 id="title">Title</h1>', article.content_html)
+        self.assertIn('href="#title"', article.toc_html)
+
+        with mock.patch.object(rendering, 'render', wraps=rendering.render) as spy:
+            article.title = 'R2'
+            article.save()
+            self.assertEqual(article.get_toc(), article.toc_html)
+            spy.assert_not_called()
+            article.content = '## Other'
+            article.save(update_fields=['content'])
+            spy.assert_called_once()
+        article.refresh_from_db()
+        self.assertIn('Other</h2>', article.content_html)
+
+        with mock.patch.object(rendering, 'RENDERER_VERSION', rendering.RENDERER_VERSION + 1):
+            Article.objects.filter(pk=article.pk).update(content_html='')
+            call_command('rerender_articles', workers=1, stdout=StringIO())
+        article.refresh_from_db()
+        self.assertIn('Other</h2>', article.content_html)
@@ -3,6 +3,8 @@ from django.db.models.functions import ExtractYear, ExtractMonth
 from django_filters import rest_framework as filters
 from rest_framework import viewsets, mixins, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -11,6 +13,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from django.core.files.storage import default_storage
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 import os
 from apps.user.models import ViewStatistics
 from common import pagination
@@ -23,9 +26,10 @@ from .serializers import (
     BlogCommentSerializer,
     BlogCommentListSerializer
 )
-from django.db.models import Sum, F
+from django.db.models import F
 from django.db.models.functions import Coalesce
 from apps.comment.serializers import CommentSerializer, CommentListSerializer
+from apps.comment.tree import attach_replies, load_replies, with_authors
 
 
 class CategoryViewSet(mixins.ListModelMixin,
@@ -55,7 +59,7 @@ class ArticleViewSet(mixins.ListModelMixin,
         SearchFilter
     ]
     search_fields = ['title']
-    ordering_fields = ['add_date', 'pub_date', 'count']
+    ordering_fields = ['add_date', 'pub_date', 'count', 'views_7d', 'views_30d']
     ordering = ['-add_date']  # 默认排序
     filterset_fields = ['category', 'tags']
 
@@ -68,41 +72,32 @@ class ArticleViewSet(mixins.ListModelMixin,
             return ArticleCreateUpdateSerializer
         return super().get_serializer_class()
 
+    # 浏览量排序键（来自 ViewTotal 的注解）
+    VIEW_ORDERINGS = ('count', 'views_7d', 'views_30d')
+
     def get_queryset(self):
         queryset = super().get_queryset()
-        # 注解 count 字段用于排序和序列化
-        queryset = queryset.annotate(
-            count=Coalesce(Sum('view_count__count'), 0)
+        if self.action == 'archive':
+            return queryset
+        # 浏览量来自每篇至多一行的 ViewTotal（LEFT JOIN，无 GROUP BY）
+        return queryset.annotate(
+            count=Coalesce(F('view_totals__total'), 0),
+            views_7d=Coalesce(F('view_totals__last_7d'), 0),
+            views_30d=Coalesce(F('view_totals__last_30d'), 0),
         )
-        return queryset
-    
-    def list(self, request, *args, **kwargs):
-        ordering = request.query_params.get('ordering', '-add_date')
-        self.queryset = self.get_queryset()
-        
-        # 调试：打印前5篇文章的count值
-        print(f"DEBUG: ordering={ordering}")
-        for article in self.queryset[:5]:
-            print(f"DEBUG: Article {article.id} - {article.title} - count={article.count}")
-        
-        # 应用排序
-        if ordering == '-count':
-            self.queryset = self.queryset.order_by('-count', '-add_date')
-            print("DEBUG: Applied -count ordering")
-        elif ordering == 'count':
-            self.queryset = self.queryset.order_by('count', '-add_date')
-            print("DEBUG: Applied count ordering")
-        else:
-            self.queryset = self.queryset.order_by(ordering)
-        
-        # 再次打印排序后的前5篇
-        print("DEBUG: After ordering:")
-        for article in self.queryset[:5]:
-            print(f"DEBUG: Article {article.id} - {article.title} - count={article.count}")
-        
-        return super().list(request, *args, **kwargs)
-        
-        return super().list(request, *args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != 'list':
+            return queryset
+        ordering = self.request.query_params.get('ordering', '-add_date')
+        # 最多一个前导 '-'：'--count' 之类的非法值回落到默认排序，而不是在 order_by 里报错
+        key = ordering[1:] if ordering.startswith('-') else ordering
+        if key not in self.VIEW_ORDERINGS and key not in self.ordering_fields:
+            ordering, key = '-add_date', 'add_date'
+        # 浏览量排序时用发布时间做次序键，保证分页稳定
+        tiebreak = ['-add_date'] if key in self.VIEW_ORDERINGS else []
+        return queryset.order_by(ordering, *tiebreak)
 
     def retrieve(self, request, *args, **kwargs):
         obj = self.get_object()
@@ -158,15 +153,51 @@ class ArticleViewSet(mixins.ListModelMixin,
         serializer.save()
         return Response(serializer.data)
 
+    def _max_depth(self, request):
+        value = request.query_params.get('max_depth')
+        if value in (None, ''):
+            return None
+        try:
+            depth = int(value)
+        except ValueError:
+            depth = -1
+        if depth < 0:
+            raise ValidationError({'max_depth': 'must be a non-negative integer'})
+        return depth
+
     @action(detail=True, methods=['get'])
     def comments(self, request, pk=None):
+        """
+        顶层评论分页（页码；?pagination=cursor / ?cursor= 时按 (pub_date, id) 游标），
+        本页所有回复一条递归查询取回后组装成树；?max_depth= 限制展开层数。
+        """
         article = self.get_object()
-        comments = article.comments.filter(parent__isnull=True)
-        serializer = BlogCommentListSerializer(comments, many=True, context={'request': request})
-        paginator = pagination.PageNumberPagination()
-        page = paginator.paginate_queryset(serializer.data, request)
-        response = paginator.get_paginated_response(page)
-        return response
+        roots = with_authors(article.comments.filter(parent__isnull=True)).order_by('-pub_date', '-pk')
+        paginator = pagination.PageOrKeysetPagination()
+        paginator.keyset.ordering_field = 'pub_date'
+        page = paginator.paginate_queryset(roots, request, view=self)
+        attach_replies(page, max_depth=self._max_depth(request))
+        serializer = BlogCommentListSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def comment_replies(self, request, pk=None):
+        """“加载更多回复”：?parent=<评论id>&cursor=<replies_next>，返回该评论的下一页回复（带子树）"""
+        from apps.comment.models import Comment
+
+        article = self.get_object()
+        parent_id = request.query_params.get('parent', '')
+        if not parent_id.isdigit():
+            raise ValidationError({'parent': 'comment id is required'})
+        parent = get_object_or_404(
+            Comment, pk=int(parent_id),
+            content_type=ContentType.objects.get_for_model(Article), object_id=article.pk,
+        )
+        replies, next_cursor = load_replies(
+            parent, cursor=request.query_params.get('cursor'), max_depth=self._max_depth(request),
+        )
+        serializer = BlogCommentListSerializer(replies, many=True, context={'request': request})
+        return Response({'next': next_cursor, 'results': serializer.data})
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def my_articles(self, request):
@@ -220,58 +251,33 @@ class ArticleViewSet(mixins.ListModelMixin,
     def replies_to_me(self, request):
         """获取别人对我的评论的回复（不包括我自己回复自己）"""
         from apps.comment.models import Comment
-        
-        # 获取所有对当前用户评论的回复
-        # 1. 找到当前用户的所有评论
-        my_comments = Comment.objects.filter(owner=request.user).values_list('id', flat=True)
-        
-        # 2. 找到这些评论的所有回复，但排除当前用户自己的回复
-        replies = Comment.objects.filter(
-            parent_id__in=my_comments
-        ).exclude(
-            owner=request.user
-        ).order_by('-add_date').select_related('owner__profile')
-        
-        # 为每个回复添加所属文章和被回复评论的信息
+
+        # 一条 JOIN：父评论的作者是我、回复者不是我（parent_id 与 owner_id 均有索引）
+        replies = with_authors(
+            Comment.objects.filter(parent__owner=request.user).exclude(owner=request.user)
+        ).select_related('parent__owner__profile').order_by('-add_date')
+
+        paginator = pagination.PageNumberPagination()
+        page = paginator.paginate_queryset(replies, request)
+        # 本页回复与被回复评论的子树各一条查询；所属文章批量取
+        attach_replies(page)
+        attach_replies([reply.parent for reply in page])
+        article_ct = ContentType.objects.get_for_model(Article)
+        articles = Article.objects.only('id', 'title').in_bulk(
+            {r.parent.object_id for r in page if r.parent.content_type_id == article_ct.id}
+        )
+
         replies_data = []
-        
-        for reply in replies:
-            serializer = BlogCommentListSerializer(reply, context={'request': request})
-            data = serializer.data
-            
+        for reply in page:
+            data = BlogCommentListSerializer(reply, context={'request': request}).data
             # 添加被回复的评论信息（当前用户的评论）
-            if reply.parent:
-                parent_serializer = BlogCommentListSerializer(reply.parent, context={'request': request})
-                data['parent_comment'] = parent_serializer.data
-            
-            # 获取回复所属的文章 - 通过 parent.content_object
-            article_id = None
-            article_title = None
-            try:
-                # 回复评论本身没有 content_object，需要通过 parent 评论获取
-                if reply.parent:
-                    parent = reply.parent
-                    if parent.content_type_id and parent.object_id:
-                        try:
-                            from django.contrib.contenttypes.models import ContentType
-                            article_ct = ContentType.objects.get(app_label='blog', model='article')
-                            if parent.content_type_id == article_ct.id:
-                                article = Article.objects.get(id=parent.object_id)
-                                article_id = article.id
-                                article_title = article.title
-                        except Exception:
-                            pass
-            except Exception as e:
-                pass
-            
-            data['article_id'] = article_id
-            data['article_title'] = article_title
-            
+            data['parent_comment'] = BlogCommentListSerializer(reply.parent, context={'request': request}).data
+            # 回复所属的文章 - 通过 parent 评论获取
+            article = articles.get(reply.parent.object_id) if reply.parent.content_type_id == article_ct.id else None
+            data['article_id'] = article.id if article else None
+            data['article_title'] = article.title if article else None
             replies_data.append(data)
-        
-        paginator = pagination.PageNumberPagination()
-        page = paginator.paginate_queryset(replies_data, request)
-        return paginator.get_paginated_response(page)
+        return paginator.get_paginated_response(replies_data)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+BACKFILL_SQL = """
+WITH RECURSIVE tree(id, path, depth) AS (
+    SELECT id, lpad(id::text, 10, '0') || '/', 0 FROM comment_comment WHERE parent_id IS NULL
+    UNION ALL
+    SELECT c.id, t.path || lpad(c.id::text, 10, '0') || '/', t.depth + 1
+    FROM comment_comment c JOIN tree t ON c.parent_id = t.id
+)
+UPDATE comment_comment c SET path = tree.path, depth = tree.depth FROM tree WHERE c.id = tree.id;
+
+UPDATE comment_comment c SET reply_count = s.n
+FROM (SELECT parent_id, count(*) AS n FROM comment_comment WHERE parent_id IS NOT NULL GROUP BY parent_id) s
+WHERE c.id = s.parent_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comment', '0002_comment_root_index'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='depth'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1024, verbose_name='path'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='reply count'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['path'], name='comment_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
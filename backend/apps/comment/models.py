@@ -1,10 +1,42 @@
-from django.db import models
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth import get_user_model
+from django.db.models import F
 
 User = get_user_model()
 
+# path 中每段 id 的宽度：定宽保证按 path 字典序即树的先序
+PATH_STEP = 10
+
+
+PATH_MAX_LENGTH = 1024
+
+
+def path_segment(pk) -> str:
+    return f"{pk:0{PATH_STEP}d}/"
+
+
+def max_reply_depth() -> int:
+    """回复允许的最大 depth：COMMENT_MAX_DEPTH，且不超过 path 列能容纳的层数"""
+    by_path = PATH_MAX_LENGTH // (PATH_STEP + 1) - 1
+    return min(getattr(settings, "COMMENT_MAX_DEPTH", 30), by_path)
+
+
+class CommentQuerySet(models.QuerySet):
+    def subtree(self, comment, *, include_self=True, max_depth=None):
+        """comment 的整棵子树：path 前缀的索引范围扫描；max_depth 为相对 comment 的层数"""
+        if not comment.path:
+            raise ValueError("comment has no path yet")
+        qs = self.filter(path__startswith=comment.path)
+        if not include_self:
+            qs = qs.filter(depth__gt=comment.depth)
+        if max_depth is not None:
+            qs = qs.filter(depth__lte=comment.depth + max_depth)
+        return qs
+
 
 class Comment(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="author")
@@ -21,11 +53,66 @@ class Comment(models.Model):
         blank=True,
         verbose_name="parent comment"
     )
+    # 物化路径：祖先到自身的定宽 id 串，如 "0000000003/0000000017/"；创建后不再变化（回复不支持改挂父评论）
+    path = models.CharField("path", max_length=PATH_MAX_LENGTH, blank=True, default="", editable=False)
+    depth = models.PositiveSmallIntegerField("depth", default=0, editable=False)
+    # 直接回复数，随回复的创建/删除增减
+    reply_count = models.PositiveIntegerField("reply count", default=0, editable=False)
+
+    objects = CommentQuerySet.as_manager()
 
     class Meta:
         verbose_name = "comment"
         verbose_name_plural = "comments"
         ordering = ["-pub_date"]
+        indexes = [
+            # 按对象分页顶层评论（apps.comment.tree）
+            models.Index(
+                fields=["content_type", "object_id", "-pub_date", "-id"],
+                condition=models.Q(parent__isnull=True),
+                name="comment_root_idx",
+            ),
+            # 子树 / 线程规模：path LIKE 'prefix%' 走索引
+            models.Index(fields=["path"], name="comment_path_idx", opclasses=["varchar_pattern_ops"]),
+        ]
 
     def __str__(self):
         return self.content
+
+    @staticmethod
+    def check_reply_to(parent):
+        """回复 parent 会超过最大层数或 path 长度时抛 ValidationError（在插入前，而不是让数据库报错）"""
+        if parent is None:
+            return
+        # 新 id 按定宽段估算；超宽 id 由 save() 里按实际 path 再检查一次
+        if parent.depth + 1 > max_reply_depth() or len(parent.path) + PATH_STEP + 1 > PATH_MAX_LENGTH:
+            raise ValidationError("Reply thread is nested too deeply.", code="max_depth")
+
+    def save(self, *args, **kwargs):
+        creating = self._state.adding and not self.path
+        if not creating:
+            return super().save(*args, **kwargs)
+        if self.parent_id:
+            self.check_reply_to(self.parent)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # path 需要自身 id，插入后补写；父评论的回复数原子 +1
+            parent = Comment.objects.filter(pk=self.parent_id).values_list("path", "depth").first() if self.parent_id else None
+            self.path = (parent[0] if parent else "") + path_segment(self.pk)
+            if len(self.path) > PATH_MAX_LENGTH:
+                # 超宽 id 才会走到这里：回滚本次插入
+                raise ValidationError("Reply thread is nested too deeply.", code="max_depth")
+            self.depth = parent[1] + 1 if parent else 0
+            Comment.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+            if parent:
+                Comment.objects.filter(pk=self.parent_id).update(reply_count=F("reply_count") + 1)
+
+    def delete(self, *args, **kwargs):
+        # 整棵子树一次按 path 前缀收集，避免 CASCADE 逐层查询
+        if not self.path:
+            return super().delete(*args, **kwargs)
+        return Comment.objects.subtree(self).delete()
+
+    def thread_size(self) -> int:
+        """子树中的回复总数（不含自身）"""
+        return Comment.objects.subtree(self, include_self=False).count()
@@ -11,6 +11,11 @@ class CommentSerializer(CaptchaSerializer, serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('content_type', 'object_id', 'add_date', 'pub_date')
 
+    def validate_parent(self, parent):
+        # 超过最大层数 / path 长度的回复在这里拒绝（400），不留到数据库报错
+        Comment.check_reply_to(parent)
+        return parent
+
     def validate(self, attrs):
         attrs = super().validate(attrs)
         del attrs['captcha']
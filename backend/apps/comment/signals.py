@@ -1,11 +1,13 @@
 """
 评论相关信号处理器 - 自动创建通知
 """
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from .models import Comment
-from apps.user.models import Notification
+from apps.user.notifications import notify
 
 User = get_user_model()
 
@@ -22,13 +24,20 @@ def create_notification_on_reply(sender, instance, created, **kwargs):
     if instance.parent:
         parent_comment = instance.parent
         # 通知被回复的用户（除非是回复自己）
-        if parent_comment.owner != instance.owner:
-            # 创建通知
-            Notification.objects.create(
-                user=parent_comment.owner,
+        if parent_comment.owner_id != instance.owner_id:
+            # 提交后创建通知，不在评论写入路径上同步插入
+            notify(
+                [parent_comment.owner_id],
                 notification_type='reply',
                 comment=instance,
                 from_user=instance.owner,
                 title=f'{instance.owner.username} 回复了你的评论',
                 content=instance.content[:100]  # 前100个字符
             )
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_parent_reply_count(sender, instance, **kwargs):
+    """回复被删除时父评论回复数 -1（父评论同批被删时更新 0 行，无副作用）"""
+    if instance.parent_id:
+        Comment.objects.filter(pk=instance.parent_id).update(reply_count=Greatest(F('reply_count') - 1, 0))
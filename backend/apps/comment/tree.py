@@ -0,0 +1,104 @@
+# apps/comment/tree.py
+"""
+评论树加载：一页顶层评论 + 它们的全部回复，回复按物化路径 path 前缀一条查询取回，在内存里组装成树。
+
+- 每个节点最多展开 replies_limit 条直接回复（SQL 里按父评论开窗 ROW_NUMBER 截断，不取全部兄弟），
+  多出的给出 replies_next 游标，由 load_replies（“加载更多回复”接口）按 (pub_date, id) 继续往下翻；
+- max_depth 限制展开的回复层数，最多 COMMENT_TREE_MAX_DEPTH；每次最多取 COMMENT_TREE_MAX_NODES 条回复
+  （按层优先，浅层先取）。到达上限且仍有回复的节点只返回 reply_count / replies_next，由前端按需再取。
+"""
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from common.pagination import KeysetPagination
+from .models import Comment
+
+REPLIES_LIMIT = 20
+
+
+def tree_max_depth(requested=None) -> int:
+    """请求的展开层数，不超过 COMMENT_TREE_MAX_DEPTH"""
+    limit = getattr(settings, "COMMENT_TREE_MAX_DEPTH", 3)
+    return limit if requested is None else min(requested, limit)
+
+
+def with_authors(queryset):
+    """预取作者及其资料（头像）；回复数 reply_count 已是 Comment 上的字段"""
+    return queryset.select_related('owner', 'owner__profile')
+
+
+def _descendants_q(roots, max_depth=None):
+    """roots 各自子树（不含自身）的过滤条件：每个根一段 path 前缀范围，OR 在一起"""
+    parts = []
+    for root in roots:
+        depth = Q(depth__gt=root.depth)
+        if max_depth is not None:
+            depth &= Q(depth__lte=root.depth + max_depth)
+        parts.append(Q(path__startswith=root.path) & depth)
+    return reduce(or_, parts)
+
+
+def _sort_key(comment):
+    # 与 Comment.Meta.ordering 一致：新的在前
+    return comment.pub_date, comment.pk
+
+
+def attach_replies(roots, *, max_depth=None, replies_limit=REPLIES_LIMIT, max_nodes=None):
+    """
+    为 roots（已取出的评论列表）挂上回复子树，一条 SQL。
+    每个节点得到 _tree_replies（列表）与 _replies_next（游标或 None）。
+    """
+    roots = list(roots)
+    for root in roots:
+        root._tree_replies, root._replies_next = [], None
+    max_depth = tree_max_depth(max_depth)
+    if not roots or max_depth == 0:
+        return roots
+    max_nodes = max_nodes or getattr(settings, "COMMENT_TREE_MAX_NODES", 500)
+
+    # 每个父评论只取最新的 replies_limit + 1 条（多的一条用来判断是否还有下一页）
+    descendants = list(
+        with_authors(Comment.objects.filter(_descendants_q(roots, max_depth)))
+        .annotate(sibling_rank=Window(
+            RowNumber(), partition_by=[F("parent_id")], order_by=[F("pub_date").desc(), F("pk").desc()],
+        ))
+        .filter(sibling_rank__lte=replies_limit + 1)
+        .order_by("depth", "sibling_rank", "pk")[:max_nodes]
+    )
+    children = {}
+    for c in descendants:
+        c._tree_replies, c._replies_next = [], None
+        children.setdefault(c.parent_id, []).append(c)
+
+    for node in roots + descendants:
+        kids = sorted(children.get(node.pk, ()), key=_sort_key, reverse=True)
+        if len(kids) > replies_limit:
+            kids = kids[:replies_limit]
+        # 超过每节点条数，或被 max_nodes 截在半途：从最后一条继续翻
+        if kids and len(kids) < node.reply_count:
+            last = kids[-1]
+            node._replies_next = KeysetPagination.encode_cursor(last.pub_date, last.pk)
+        node._tree_replies = kids
+    return roots
+
+
+def load_replies(parent, *, cursor=None, limit=REPLIES_LIMIT, max_depth=None):
+    """
+    “加载更多回复”：parent 的下一页直接回复（各自带子树）。
+    返回 (replies, next_cursor)。
+    """
+    qs = with_authors(Comment.objects.filter(parent=parent)).order_by('-pub_date', '-pk')
+    if cursor:
+        ts, pk = KeysetPagination.decode_cursor(cursor)
+        qs = qs.filter(pub_date__lte=ts).exclude(pub_date=ts, pk__gte=pk)
+    rows = list(qs[:limit + 1])
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = KeysetPagination.encode_cursor(page[-1].pub_date, page[-1].pk)
+    child_depth = None if max_depth is None else max(max_depth - 1, 0)
+    return attach_replies(page, max_depth=child_depth, replies_limit=limit), next_cursor
@@ -5,7 +5,7 @@ from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user_model
 from .models import HolidayFamilyApplication
 from .serializers import HolidayFamilyApplicationSerializer
-from apps.user.models import Notification
+from apps.user.notifications import notify, staff_users
 
 User = get_user_model()
 
@@ -39,17 +39,15 @@ class HolidayFamilyApplicationViewSet(viewsets.ModelViewSet):
             # 保存时 serializer 会自动从 request 中获取 user
             application = serializer.save()
             
-            # 为所有管理员创建通知
-            admin_users = User.objects.filter(is_staff=True)
-            for admin_user in admin_users:
-                Notification.objects.create(
-                    user=admin_user,
-                    notification_type='holiday_family_apply',
-                    holiday_family_application=application,
-                    title=f'New Holiday Family Application from {application.full_name}',
-                    content=f'{application.full_name} has submitted a Holiday Family application.',
-                    from_user=request.user
-                )
+            # 为所有管理员创建通知（提交后批量写入）
+            notify(
+                staff_users(),
+                notification_type='holiday_family_apply',
+                holiday_family_application=application,
+                title=f'New Holiday Family Application from {application.full_name}',
+                content=f'{application.full_name} has submitted a Holiday Family application.',
+                from_user=request.user
+            )
             
             return Response(
                 {
@@ -87,8 +85,8 @@ class HolidayFamilyApplicationViewSet(viewsets.ModelViewSet):
             application.user.profile.save()
             
             # 创建通知给申请用户
-            Notification.objects.create(
-                user=application.user,
+            notify(
+                [application.user_id],
                 notification_type='holiday_family_approve',
                 holiday_family_application=application,
                 title='Your Holiday Family Application has been Approved!',
@@ -149,8 +147,8 @@ class HolidayFamilyApplicationViewSet(viewsets.ModelViewSet):
         
         # 创建通知给申请用户
         if application.user:
-            Notification.objects.create(
-                user=application.user,
+            notify(
+                [application.user_id],
                 notification_type='holiday_family_reject',
                 holiday_family_application=application,
                 title='Your Holiday Family Application has been Rejected',
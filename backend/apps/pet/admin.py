@@ -147,14 +147,11 @@ class DonationAdmin(admin.ModelAdmin):
 
 @admin.action(description="Review pass and create pet")
 def approve_and_create_pet(modeladmin, request, queryset):
-    ok, fail = 0, 0
-    for d in queryset:
-        try:
-            d.approve(reviewer=request.user, note="Approved in admin")
-            ok += 1
-        except Exception as e:
-            fail += 1
-    messages.info(request, f"Finish: Pass {ok} time(s); Fail {fail} time(s)")
+    # 每条捐赠独立事务，照片复制在事务外，多条并发处理
+    ok, errors = Donation.approve_many(
+        queryset.select_related("created_pet", "donor"), reviewer=request.user, note="Approved in admin", workers=4,
+    )
+    messages.info(request, f"Finish: Pass {ok} time(s); Fail {len(errors)} time(s)")
 
 
 @admin.action(description="Close donation (lock editing)")
@@ -0,0 +1,148 @@
+# apps/pet/clusters.py
+"""
+走失地图聚类。
+
+每条有坐标的 Lost 在 LostMapCluster 里对每个精度（geohash 前缀长度 1~6）各贡献一次
+(count +1, lat_sum +lat, lon_sum +lon)。地图缩放级别映射到精度，平移/缩放只需按
+(precision, cell_lat, cell_lon) 索引读出视口内的格子；缩放足够大时直接返回单点。
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, FloatField, Sum
+from django.db.models.functions import Cast, Substr
+
+from common.db import upsert_increment
+from common.geo import geohash_decode
+
+CLUSTER_PRECISIONS = (1, 2, 3, 4, 5, 6)
+# 缩放级别 >= POINTS_MIN_ZOOM 时返回单个点，不再聚类
+POINTS_MIN_ZOOM = 14
+MAX_POINTS = 500
+
+# 缩放级别 -> geohash 精度：让一屏大约覆盖几十个格子
+_ZOOM_PRECISION = ((3, 1), (5, 2), (7, 3), (10, 4), (12, 5), (POINTS_MIN_ZOOM, 6))
+
+
+def zoom_to_precision(zoom: int) -> int:
+    for max_zoom, precision in _ZOOM_PRECISION:
+        if zoom < max_zoom:
+            return precision
+    return CLUSTER_PRECISIONS[-1]
+
+
+def contribution(lost):
+    """Lost -> (status, geohash, lat, lon)；没有坐标时返回 None"""
+    addr = lost.address if lost.address_id else None
+    if addr is None or not addr.geohash or addr.latitude is None or addr.longitude is None:
+        return None
+    return lost.status, addr.geohash, float(addr.latitude), float(addr.longitude)
+
+
+def apply_contributions(added=(), removed=()):
+    """把若干 Lost 的贡献加到/减出聚类表；同一格子的增减先在内存里合并"""
+    deltas = defaultdict(lambda: [0, 0.0, 0.0])
+    for sign, items in ((1, added), (-1, removed)):
+        for item in items:
+            if not item:
+                continue
+            status, geohash, lat, lon = item
+            for p in CLUSTER_PRECISIONS:
+                d = deltas[(status, p, geohash[:p])]
+                d[0] += sign
+                d[1] += sign * lat
+                d[2] += sign * lon
+
+    rows = []
+    for (status, p, cell), (count, lat_sum, lon_sum) in deltas.items():
+        if count == 0 and abs(lat_sum) < 1e-9 and abs(lon_sum) < 1e-9:
+            continue
+        cell_lat, cell_lon = geohash_decode(cell)
+        rows.append({
+            "status": status, "precision": p, "cell": cell,
+            "count": count, "lat_sum": lat_sum, "lon_sum": lon_sum,
+            "cell_lat": cell_lat, "cell_lon": cell_lon,
+        })
+    if not rows:
+        return
+
+    from .models import LostMapCluster
+    with transaction.atomic():
+        upsert_increment(
+            LostMapCluster, rows,
+            key_fields=("status", "precision", "cell"),
+            increment_fields=("count", "lat_sum", "lon_sum"),
+            insert_only_fields=("cell_lat", "cell_lon"),
+        )
+        if any(r["count"] < 0 for r in rows):
+            LostMapCluster.objects.filter(count__lte=0).delete()
+
+
+def rebuild_clusters(*, lost_model=None, cluster_model=None):
+    """全量重建（也用于迁移回填）；返回写入的格子数"""
+    if lost_model is None or cluster_model is None:
+        from .models import Lost, LostMapCluster
+        lost_model, cluster_model = Lost, LostMapCluster
+
+    base = lost_model.objects.exclude(address__geohash="").filter(
+        address__latitude__isnull=False, address__longitude__isnull=False,
+    )
+    objs = []
+    for p in CLUSTER_PRECISIONS:
+        agg = (
+            base.annotate(cell=Substr("address__geohash", 1, p))
+            .values("status", "cell")
+            .annotate(
+                n=Count("id"),
+                lat_total=Sum(Cast("address__latitude", FloatField())),
+                lon_total=Sum(Cast("address__longitude", FloatField())),
+            )
+            .order_by()
+        )
+        for row in agg:
+            cell_lat, cell_lon = geohash_decode(row["cell"])
+            objs.append(cluster_model(
+                status=row["status"], precision=p, cell=row["cell"],
+                cell_lat=cell_lat, cell_lon=cell_lon,
+                count=row["n"], lat_sum=row["lat_total"], lon_sum=row["lon_total"],
+            ))
+    with transaction.atomic():
+        cluster_model.objects.all().delete()
+        cluster_model.objects.bulk_create(objs, batch_size=2000)
+    return len(objs)
+
+
+def _cell_margin(precision: int):
+    """格子半宽（度），视口过滤时放宽，避免边缘格子被切掉"""
+    lat_bits = (precision * 5) // 2
+    lon_bits = precision * 5 - lat_bits
+    return 90.0 / (1 << lat_bits), 180.0 / (1 << lon_bits)
+
+
+def clusters_in_bbox(zoom: int, bbox, statuses):
+    """视口内的聚类：[{cell, count, lat, lon}]；bbox = (min_lat, min_lon, max_lat, max_lon)"""
+    from .models import LostMapCluster
+
+    precision = zoom_to_precision(zoom)
+    min_lat, min_lon, max_lat, max_lon = bbox
+    dlat, dlon = _cell_margin(precision)
+    qs = LostMapCluster.objects.filter(
+        precision=precision,
+        cell_lat__gte=min_lat - dlat, cell_lat__lte=max_lat + dlat,
+        cell_lon__gte=min_lon - dlon, cell_lon__lte=max_lon + dlon,
+        count__gt=0,
+    )
+    if statuses:
+        qs = qs.filter(status__in=statuses)
+
+    # 多个状态落在同一格子时合并
+    merged = defaultdict(lambda: [0, 0.0, 0.0])
+    for cell, count, lat_sum, lon_sum in qs.values_list("cell", "count", "lat_sum", "lon_sum"):
+        m = merged[cell]
+        m[0] += count
+        m[1] += lat_sum
+        m[2] += lon_sum
+    return [
+        {"cell": cell, "count": n, "lat": round(lat_sum / n, 6), "lon": round(lon_sum / n, 6)}
+        for cell, (n, lat_sum, lon_sum) in merged.items()
+    ]
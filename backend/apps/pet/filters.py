@@ -1,12 +1,67 @@
 # apps/pet/filters.py
 import django_filters
 import django_filters as df
-from .models import Pet, Lost
+from .models import Pet, Lost, Shelter, PET_TRAIT_BITS, trait_mask
+from common.geo import bounding_box, distance_km_expression, parse_bbox, parse_point
 from django.db import models
-from django.db.models import Q
+from django.db.models import F, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework import filters
+from .search import search_pets
 
 
-class PetFilter(df.FilterSet):
+class GeoFilterSet(df.FilterSet):
+    """
+    地理过滤：?near=lat,lon&radius_km=5 按距离由近到远；?bbox=min_lon,min_lat,max_lon,max_lat 取视口内。
+    先用包围盒走 Address(latitude, longitude) 索引，再用 Haversine 精确过滤。
+    子类用 address_path 指明到 Address 的关系路径。
+    """
+    DEFAULT_RADIUS_KM = 10
+    MAX_RADIUS_KM = 500
+    address_path = "address"
+
+    near = df.CharFilter(method="filter_near", label="lat,lon")
+    radius_km = df.NumberFilter(method="filter_radius", label="Radius (km)")
+    bbox = df.CharFilter(method="filter_bbox", label="min_lon,min_lat,max_lon,max_lat")
+
+    def _coord_fields(self):
+        return f"{self.address_path}__latitude", f"{self.address_path}__longitude"
+
+    def _filter_box(self, qs, min_lat, min_lon, max_lat, max_lon):
+        lat_f, lon_f = self._coord_fields()
+        return qs.filter(**{
+            f"{lat_f}__gte": min_lat, f"{lat_f}__lte": max_lat,
+            f"{lon_f}__gte": min_lon, f"{lon_f}__lte": max_lon,
+        })
+
+    def filter_near(self, qs, name, value):
+        try:
+            lat, lon = parse_point(value)
+        except ValueError as exc:
+            raise ValidationError({"near": str(exc)})
+        radius = self.form.cleaned_data.get("radius_km") or self.DEFAULT_RADIUS_KM
+        radius = min(float(radius), self.MAX_RADIUS_KM)
+        qs = self._filter_box(qs, *bounding_box(lat, lon, radius))
+        lat_f, lon_f = self._coord_fields()
+        return (
+            qs.annotate(distance_km=distance_km_expression(lat_f, lon_f, lat, lon))
+            .filter(distance_km__lte=radius)
+            .order_by("distance_km")
+        )
+
+    def filter_radius(self, qs, name, value):
+        # 只作为 near 的参数，本身不过滤
+        return qs
+
+    def filter_bbox(self, qs, name, value):
+        try:
+            box = parse_bbox(value)
+        except ValueError as exc:
+            raise ValidationError({"bbox": str(exc)})
+        return self._filter_box(qs, *box)
+
+
+class PetFilter(GeoFilterSet):
     name    = df.CharFilter(field_name="name", lookup_expr="icontains")
     species = df.CharFilter(field_name="species", lookup_expr="icontains")
     breed   = df.CharFilter(field_name="breed", lookup_expr="icontains")
@@ -18,7 +73,10 @@ class PetFilter(df.FilterSet):
     age_min = df.NumberFilter(method="filter_age_min")
     age_max = df.NumberFilter(method="filter_age_max")
     
-    # 宠物特性过滤
+    # 宠物特性过滤：?traits=vaccinated,sterilized 表示同时具备；
+    # 单个布尔参数也会被合并成 traits 位图上的一个谓词（见 filter_queryset）
+    traits = df.CharFilter(method="filter_traits")
+    microchipped = df.BooleanFilter(field_name="microchipped")
     vaccinated = df.BooleanFilter(field_name="vaccinated")
     sterilized = df.BooleanFilter(field_name="sterilized")
     dewormed = df.BooleanFilter(field_name="dewormed")
@@ -33,9 +91,40 @@ class PetFilter(df.FilterSet):
 
     def filter_city(self, qs, name, v):
         """Filter by city - search in both address and shelter address"""
-        return qs.filter(
+        # 搜索文档的 city 列同时包含地址城市和收容所城市；icontains 编译为
+        # UPPER(city) LIKE UPPER(%v%)，由 UPPER(city) 上的 pg_trgm 表达式索引支撑（迁移 0016）。
+        # 文档行由 signal 异步维护，尚未生成文档的宠物退回按地址/收容所地址的城市名匹配
+        no_doc = Q(search_doc__isnull=True) & (
             Q(address__city__name__icontains=v) | Q(shelter__address__city__name__icontains=v)
         )
+        return qs.filter(Q(search_doc__city__icontains=v) | no_doc)
+
+    def filter_traits(self, qs, name, v):
+        names = [t.strip() for t in v.split(",") if t.strip()]
+        try:
+            mask = trait_mask(names)
+        except KeyError as exc:
+            raise ValidationError({"traits": f"unknown trait {exc.args[0]!r}"})
+        return self._filter_trait_mask(qs, mask, 0)
+
+    @staticmethod
+    def _filter_trait_mask(qs, required, forbidden):
+        """traits & (required|forbidden) = required：一次位运算同时表达“有”和“没有”"""
+        if not (required or forbidden):
+            return qs
+        return qs.alias(_trait_bits=F("traits").bitand(required | forbidden)).filter(_trait_bits=required)
+
+    def filter_queryset(self, queryset):
+        required = forbidden = 0
+        for name, value in self.form.cleaned_data.items():
+            if name in PET_TRAIT_BITS:
+                if value is True:
+                    required |= PET_TRAIT_BITS[name]
+                elif value is False:
+                    forbidden |= PET_TRAIT_BITS[name]
+                continue
+            queryset = self.filters[name].filter(queryset, value)
+        return self._filter_trait_mask(queryset, required, forbidden)
 
     def filter_age_min(self, qs, name, v):
         v = int(v); y, m = v // 12, v % 12
@@ -47,12 +136,29 @@ class PetFilter(df.FilterSet):
     
     class Meta:
         model = Pet
-        fields = ["name", "species", "breed", "status", "size", "sex", "city", "vaccinated", "sterilized", "dewormed", 
+        fields = ["name", "species", "breed", "status", "size", "sex", "city", "traits", "microchipped", "vaccinated", "sterilized", "dewormed", 
                   "child_friendly", "trained", "loves_play", "loves_walks", "good_with_dogs", 
-                  "good_with_cats", "affectionate", "needs_attention"]
+                  "good_with_cats", "affectionate", "needs_attention", "near", "radius_km", "bbox"]
+
+
+class DistanceAwareOrderingFilter(filters.OrderingFilter):
+    """没有显式 ?ordering= 时不套用视图默认排序，保留 ?near= 的按距离排序"""
+
+    def filter_queryset(self, request, queryset, view):
+        if "distance_km" in queryset.query.annotations and not request.query_params.get(self.ordering_param):
+            return queryset
+        return super().filter_queryset(request, queryset, view)
+
 
+class PetSearchFilter(filters.SearchFilter):
+    """?search= 走 PetSearchDocument 的全文索引，并按相关度排序（显式 ?ordering= 仍会覆盖）"""
 
-class LostFilter(df.FilterSet):
+    def filter_queryset(self, request, queryset, view):
+        value = request.query_params.get(self.search_param, "")
+        return search_pets(queryset, value)
+
+
+class LostFilter(GeoFilterSet):
     q = df.CharFilter(method='search', label='Search')
     pet_name = df.CharFilter(field_name='pet_name', lookup_expr='icontains')
     created_from = df.DateTimeFilter(field_name='created_at', lookup_expr='gte')
@@ -67,7 +173,8 @@ class LostFilter(df.FilterSet):
 
     class Meta:
         model = Lost
-        fields = ['species', 'breed', 'color', 'sex', 'size', 'status', 'country', 'region', 'city', 'pet_name']
+        fields = ['species', 'breed', 'color', 'sex', 'size', 'status', 'country', 'region', 'city', 'pet_name',
+                  'near', 'radius_km', 'bbox']
 
     def search(self, queryset, name, value):
         if not value:
@@ -81,3 +188,9 @@ class LostFilter(df.FilterSet):
             Q(color__icontains=value) |
             Q(breed__icontains=value)
         )
+
+
+class ShelterFilter(GeoFilterSet):
+    class Meta:
+        model = Shelter
+        fields = ["near", "radius_km", "bbox"]
@@ -0,0 +1,360 @@
+# apps/pet/geocoding.py
+"""
+批量地理编码。
+
+- 相同的规范化地址只查一次（批内去重 + GeocodeCache 持久化缓存）；
+- 查询在有界线程池中并发执行，每个服务商一个令牌桶限速（Nominatim 使用政策要求 ≤1 req/s）；
+- StubProvider 不发网络请求，用于离线压测整个流水线；
+- enqueue_geocode / process_jobs 是请求路径之外的后台队列（GeocodeJob 表 + geocode_worker 命令）。
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from common.geo import geohash_encode
+from common.utils import GeocodeError, build_geocode_query, geocode_mapbox, geocode_nominatim
+
+logger = logging.getLogger(__name__)
+
+
+# ============== 地址 -> 查询串 ==============
+def address_context(addr):
+    """Address -> (自由文本地址, 结构化上下文)，与 geocode_address 的参数一致"""
+    city = addr.city.name if addr.city_id else None
+    region = addr.region.name if addr.region_id else None
+    country = addr.country.name if addr.country_id else None
+    parts = [addr.street or '', addr.building_number or '', city or '', region or '', country or '', addr.postal_code or '']
+    text = ', '.join([p for p in parts if p])
+    ctx = {
+        'street': (f"{addr.street} {addr.building_number}".strip()) if (addr.street or addr.building_number) else None,
+        'city': city,
+        'region': region,
+        'country': country,
+        'country_code': addr.country.code if addr.country_id else None,
+        'postal_code': addr.postal_code or None,
+    }
+    return text, ctx
+
+
+def normalize_query(text: str, ctx=None) -> str:
+    """大小写、空白、Unicode 组合形式统一后的查询串，作为去重/缓存键的来源"""
+    q = build_geocode_query(text, ctx or {})
+    q = unicodedata.normalize('NFKC', q).lower()
+    q = re.sub(r'\s*,\s*', ', ', q)
+    return re.sub(r'\s+', ' ', q).strip(' ,')
+
+
+def cache_key(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+# ============== 限速 ==============
+class TokenBucket:
+    """线程安全的令牌桶：rate 个/秒，最多攒 capacity 个"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# ============== 服务商 ==============
+class Provider:
+    name = ''
+    rate = 1.0  # 每秒请求数
+
+    def __init__(self, rate=None):
+        self.bucket = TokenBucket(rate or self.rate)
+
+    def available(self) -> bool:
+        return True
+
+    def lookup(self, text, ctx):
+        """返回 (lon, lat) 或 None；请求失败抛 GeocodeError"""
+        raise NotImplementedError
+
+    def __call__(self, text, ctx):
+        self.bucket.acquire()
+        return self.lookup(text, ctx)
+
+
+class MapboxProvider(Provider):
+    name = 'mapbox'
+    rate = 10.0
+
+    def available(self):
+        return bool(getattr(settings, 'MAPBOX_TOKEN', None) or getattr(settings, 'MAPBOX_ACCESS_TOKEN', None))
+
+    def lookup(self, text, ctx):
+        return geocode_mapbox(build_geocode_query(text, ctx), ctx)
+
+
+class NominatimProvider(Provider):
+    name = 'nominatim'
+    rate = 1.0
+
+    def lookup(self, text, ctx):
+        return geocode_nominatim(build_geocode_query(text, ctx), ctx)
+
+
+class StubProvider(Provider):
+    """离线桩：按查询串哈希出一个稳定的波兰境内坐标，可选模拟延迟"""
+    name = 'stub'
+    rate = 1000.0
+
+    def __init__(self, rate=None, latency=0.0):
+        super().__init__(rate)
+        self.latency = latency
+
+    def lookup(self, text, ctx):
+        if self.latency:
+            time.sleep(self.latency)
+        h = int(hashlib.md5(normalize_query(text, ctx).encode('utf-8')).hexdigest()[:12], 16)
+        lat = 49.0 + (h % 10_000) / 10_000 * 5.8
+        lon = 14.1 + (h // 10_000 % 10_000) / 10_000 * 10.0
+        return round(lon, 6), round(lat, 6)
+
+
+PROVIDERS = {
+    'mapbox': MapboxProvider,
+    'nominatim': NominatimProvider,
+    'stub': StubProvider,
+}
+
+
+def default_providers():
+    """与 geocode_address 相同的顺序：有 Mapbox token 时先 Mapbox，再 Nominatim"""
+    chain = [MapboxProvider(), NominatimProvider()]
+    return [p for p in chain if p.available()]
+
+
+# ============== 批量 ==============
+class BatchGeocoder:
+    """
+    geocode_many({item_id: (text, ctx)}) -> {item_id: (lon, lat) 或 None}
+    先查 GeocodeCache，未命中的去重后并发请求，结果写回 GeocodeCache。
+    请求失败（GeocodeError）的条目不写缓存，结果为 None，下次还会重试。
+    """
+
+    def __init__(self, providers=None, workers=4, persist=True):
+        self.providers = providers if providers is not None else default_providers()
+        self.workers = max(1, workers)
+        self.persist = persist
+        self.stats = {'cache_hits': 0, 'lookups': 0, 'found': 0, 'errors': 0}
+        # 最近一次 geocode_many 中请求失败（而非查无结果）的 item_id，调用方据此决定是否重试
+        self.failed = set()
+
+    def _lookup(self, text, ctx):
+        errors = 0
+        for provider in self.providers:
+            try:
+                coords = provider(text, ctx)
+            except GeocodeError as e:
+                logger.debug('%s geocoding failed: %s', provider.name, e)
+                errors += 1
+                continue
+            if coords:
+                return provider.name, coords
+        if errors:
+            raise GeocodeError('all providers failed')
+        return '', None
+
+    def _worker(self, text, ctx):
+        try:
+            return self._lookup(text, ctx)
+        finally:
+            # 线程池里的线程不经过请求生命周期，需手动归还连接
+            close_old_connections()
+
+    def geocode_many(self, items):
+        from .models import GeocodeCache
+
+        keyed = {}  # cache key -> (normalized, text, ctx)
+        item_keys = {}
+        for item_id, (text, ctx) in items.items():
+            if not text:
+                item_keys[item_id] = None
+                continue
+            norm = normalize_query(text, ctx)
+            key = cache_key(norm)
+            item_keys[item_id] = key
+            keyed.setdefault(key, (norm, text, ctx))
+
+        resolved = {}
+        for row in GeocodeCache.objects.filter(key__in=list(keyed)):
+            resolved[row.key] = (row.longitude, row.latitude) if row.found else None
+        self.stats['cache_hits'] += len(resolved)
+
+        pending = [k for k in keyed if k not in resolved]
+        failed_keys = set()
+        new_rows = []
+        if pending and self.providers:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {k: pool.submit(self._worker, keyed[k][1], keyed[k][2]) for k in pending}
+                for key, future in futures.items():
+                    self.stats['lookups'] += 1
+                    try:
+                        provider, coords = future.result()
+                    except GeocodeError:
+                        self.stats['errors'] += 1
+                        failed_keys.add(key)
+                        continue
+                    resolved[key] = coords
+                    if coords:
+                        self.stats['found'] += 1
+                    new_rows.append(GeocodeCache(
+                        key=key, query=keyed[key][0][:512], provider=provider, found=bool(coords),
+                        longitude=coords[0] if coords else None, latitude=coords[1] if coords else None,
+                    ))
+        if self.persist and new_rows:
+            GeocodeCache.objects.bulk_create(new_rows, ignore_conflicts=True)
+
+        self.failed = {item_id for item_id, key in item_keys.items() if key in failed_keys}
+        return {item_id: (resolved.get(key) if key else None) for item_id, key in item_keys.items()}
+
+
+# ============== 后台队列 ==============
+MAX_ATTEMPTS = 6
+LEASE_SECONDS = 300
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 6 * 60 * 60
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    """第 n 次失败后的等待时间：30s, 60s, 120s ... 封顶 6 小时"""
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), BACKOFF_MAX_SECONDS))
+
+
+def enqueue_geocode(address):
+    """
+    地址缺坐标时标记为 pending 并入队，立即返回；坐标由 geocode_worker 异步补上。
+    任务行与调用方的写入在同一事务中提交，回滚时不会留下孤儿任务。
+    """
+    from .models import Address, GeocodeJob
+
+    if address is None or address.pk is None:
+        return False
+    if address.latitude is not None and address.longitude is not None:
+        return False
+    if not address_context(address)[0]:
+        return False
+    if address.geocode_status != Address.GeocodeStatus.PENDING:
+        address.geocode_status = Address.GeocodeStatus.PENDING
+        Address.objects.filter(pk=address.pk).update(geocode_status=Address.GeocodeStatus.PENDING)
+    GeocodeJob.objects.update_or_create(
+        address=address, defaults={'run_after': timezone.now(), 'attempts': 0, 'last_error': ''}
+    )
+    return True
+
+
+def claim_jobs(limit: int):
+    """领取到期任务并推后一个租约期；短事务，网络请求不在锁内进行"""
+    from .models import GeocodeJob
+
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            GeocodeJob.objects.select_for_update(skip_locked=True)
+            .filter(run_after__lte=now)
+            .order_by('run_after', 'id')[:limit]
+        )
+        if jobs:
+            GeocodeJob.objects.filter(pk__in=[j.pk for j in jobs]).update(
+                run_after=now + timedelta(seconds=LEASE_SECONDS), attempts=F('attempts') + 1,
+            )
+            for job in jobs:
+                job.attempts += 1
+    return jobs
+
+
+# 决定查询串的地址字段；写回结果时要求它们与请求前一致
+ADDRESS_QUERY_FIELDS = ('country_id', 'region_id', 'city_id', 'street', 'building_number', 'postal_code')
+
+
+def unchanged_address(addr):
+    """只匹配查询期间未被编辑、仍缺坐标的地址行"""
+    from .models import Address
+
+    fields = {f: getattr(addr, f) for f in ADDRESS_QUERY_FIELDS}
+    return Address.objects.filter(pk=addr.pk, latitude__isnull=True, longitude__isnull=True, **fields)
+
+
+def process_jobs(geocoder: BatchGeocoder, limit: int = 50) -> dict:
+    """
+    领取一批任务并处理；返回 {'claimed', 'done', 'not_found', 'retry', 'failed', 'requeued'}
+    服务商请求期间地址可能被编辑：结果用条件 UPDATE 写回，地址已变化时不覆盖，任务立即重新排队。
+    """
+    from .models import Address, GeocodeJob
+
+    counts = {'claimed': 0, 'done': 0, 'not_found': 0, 'retry': 0, 'failed': 0, 'requeued': 0}
+    jobs = claim_jobs(limit)
+    if not jobs:
+        return counts
+    counts['claimed'] = len(jobs)
+
+    addresses = Address.objects.select_related('city', 'region', 'country').in_bulk([j.address_id for j in jobs])
+    todo = {
+        addr_id: address_context(addr) for addr_id, addr in addresses.items()
+        if addr.latitude is None or addr.longitude is None
+    }
+    results = geocoder.geocode_many(todo) if todo else {}
+    now = timezone.now()
+
+    for job in jobs:
+        addr = addresses.get(job.address_id)
+        with transaction.atomic():
+            if addr is None or job.address_id not in todo:
+                # 地址已删除，或坐标已被其他途径补上
+                GeocodeJob.objects.filter(pk=job.pk).delete()
+                counts['done'] += 1
+                continue
+            coords = results.get(job.address_id)
+            if coords:
+                lon, lat = coords
+                written = unchanged_address(addr).update(
+                    latitude=lat, longitude=lon, location={"type": "Point", "coordinates": [lon, lat]},
+                    geohash=geohash_encode(float(lat), float(lon)), geocode_status=Address.GeocodeStatus.DONE,
+                )
+            elif job.address_id in geocoder.failed and job.attempts < MAX_ATTEMPTS:
+                GeocodeJob.objects.filter(pk=job.pk).update(
+                    run_after=now + backoff_delay(job.attempts), last_error='provider request failed',
+                )
+                counts['retry'] += 1
+                continue
+            else:
+                written = unchanged_address(addr).update(geocode_status=Address.GeocodeStatus.FAILED)
+            if not written:
+                # 查询期间地址被编辑（或坐标已补上）：结果作废，按新地址立即重新处理
+                GeocodeJob.objects.filter(pk=job.pk).update(run_after=now, last_error='')
+                counts['requeued'] += 1
+                continue
+            GeocodeJob.objects.filter(pk=job.pk).delete()
+            if coords:
+                counts['done'] += 1
+            else:
+                counts['failed' if job.address_id in geocoder.failed else 'not_found'] += 1
+    return counts
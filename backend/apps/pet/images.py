@@ -0,0 +1,206 @@
+# apps/pet/images.py
+"""
+图片派生文件：上传的原图按 thumb / card / full 三档宽度生成 WebP + JPEG，存放在原图旁边
+（pets/photos/abc.jpg -> pets/photos/abc__<批次>__card.webp），清单写进模型上的 *_variants JSON 字段：
+
+    {"source": "pets/photos/abc.jpg", "width": 3024, "height": 4032,
+     "sizes": {"thumb": {"w": 160, "h": 213, "webp": "...__thumb.webp", "jpeg": "...__thumb.jpg"}, ...}}
+
+- 保存后在事务提交时交给进程内线程池生成（Pillow 的缩放/编码释放 GIL），请求不等待；
+  IMAGE_DERIVATIVES_ASYNC=False 时同步生成（测试/管理命令）。
+- 每次生成用一个随机批次号命名：同一原图被多条记录引用（Lost.photo 同步成 Pet.cover）、
+  同名不同扩展名（abc.jpg / abc.png）或两个任务并发生成时，各自的派生文件互不覆盖。
+- 清单里的 source 与当前文件名不一致即视为过期（图片被替换），重新生成并删除旧派生文件；
+  写回清单时带上原图文件名和旧清单做条件 UPDATE，期间图片被换掉或已被别的任务写回则丢弃本次结果。
+  删除旧派生文件前确认没有其他记录的清单仍引用它（历史数据里 Pet/Lost 可能共用同一批文件）。
+- generate_image_derivatives 命令用进程池回填已有图片。
+"""
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# 档位 -> 最大宽度（像素）
+SIZES = {"thumb": 160, "card": 480, "full": 1280}
+FORMATS = {
+    "webp": ("WEBP", ".webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", ".jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def image_fields():
+    """模型 -> [(图片字段, 清单字段)]"""
+    from .models import Lost, Pet, PetPhoto, Shelter
+    return {
+        Pet: [("cover", "cover_variants")],
+        PetPhoto: [("image", "variants")],
+        Lost: [("photo", "photo_variants")],
+        Shelter: [("logo", "logo_variants"), ("cover_image", "cover_variants")],
+    }
+
+
+def derivative_name(source: str, size: str, ext: str, batch: str) -> str:
+    root, _ = os.path.splitext(source)
+    return f"{root}__{batch}__{size}{ext}"
+
+
+def variant_files(variants):
+    return [name for entry in (variants or {}).get("sizes", {}).values() for key, name in entry.items() if key in FORMATS]
+
+
+def delete_unreferenced(names):
+    """删除派生文件，但跳过任何记录的清单仍引用的（每个模型一条查询）"""
+    names = set(names)
+    if not names:
+        return
+    referenced = set()
+    for model, fields in image_fields().items():
+        q = Q()
+        for _, variants_field in fields:
+            for size in SIZES:
+                for fmt in FORMATS:
+                    q |= Q(**{f"{variants_field}__sizes__{size}__{fmt}__in": list(names)})
+        for row in model._base_manager.filter(q).values_list(*[v for _, v in fields]):
+            for variants in row:
+                referenced.update(variant_files(variants))
+    for name in names - referenced:
+        default_storage.delete(name)
+
+
+def generate_derivatives(source: str, storage=None) -> dict:
+    """读取原图，生成各档 WebP/JPEG 并保存（新批次号，不覆盖已有文件），返回清单；不访问数据库"""
+    storage = storage or default_storage
+    batch = uuid.uuid4().hex[:10]
+    with storage.open(source, "rb") as fh:
+        img = Image.open(fh)
+        img = ImageOps.exif_transpose(img)
+        img.load()
+    if img.mode not in ("RGB", "L"):
+        # JPEG 不支持透明通道，铺白底
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.convert("RGBA").split()[-1])
+        img = background
+    elif img.mode == "L":
+        img = img.convert("RGB")
+
+    width, height = img.size
+    manifest = {"source": source, "width": width, "height": height, "sizes": {}}
+    for size, max_width in SIZES.items():
+        w = min(width, max_width)
+        h = max(1, round(height * w / width))
+        resized = img if w == width else img.resize((w, h), Image.LANCZOS)
+        entry = {"w": w, "h": h}
+        for fmt, (pil_format, ext, options) in FORMATS.items():
+            buf = BytesIO()
+            resized.save(buf, pil_format, **options)
+            name = derivative_name(source, size, ext, batch)
+            entry[fmt] = storage.save(name, ContentFile(buf.getvalue()))
+        manifest["sizes"][size] = entry
+        # 不放大：原图已不超过本档宽度时，本档即原尺寸，更大的档省略
+        if width <= max_width:
+            break
+    return manifest
+
+
+def try_generate(source: str):
+    """进程池任务：失败只记日志返回 None，不影响其他图片"""
+    try:
+        return generate_derivatives(source)
+    except Exception:
+        logger.exception("Failed to generate derivatives for %s", source)
+        return None
+
+
+def is_stale(instance, image_field: str, variants_field: str) -> bool:
+    name = getattr(instance, image_field).name or ""
+    variants = getattr(instance, variants_field) or {}
+    return variants.get("source", "") != name
+
+
+def apply_manifest(model, pk, image_field, variants_field, manifest, old_variants=None):
+    """条件写回清单（原图未被替换、清单仍是 old_variants 才写），并删除旧派生文件；返回是否写入"""
+    updated = model._base_manager.filter(
+        pk=pk, **{image_field: manifest["source"], variants_field: old_variants or {}},
+    ).update(**{variants_field: manifest})
+    if not updated:
+        # 图片已被替换、清单已被并发任务写回或记录已删除：本批次文件只属于本次，直接作废
+        for name in variant_files(manifest):
+            default_storage.delete(name)
+        return False
+    delete_unreferenced(variant_files(old_variants))
+    return True
+
+
+def process(model, pk, image_field, variants_field):
+    """为一条记录的一个图片字段生成派生图并写回"""
+    instance = model._base_manager.filter(pk=pk).first()
+    if instance is None or not is_stale(instance, image_field, variants_field):
+        return False
+    old_variants = getattr(instance, variants_field)
+    source = getattr(instance, image_field).name
+    if not source:
+        if model._base_manager.filter(pk=pk, **{f"{image_field}__in": ["", None]}).update(**{variants_field: {}}):
+            delete_unreferenced(variant_files(old_variants))
+        return True
+    manifest = try_generate(source)
+    if manifest is None:
+        return False
+    return apply_manifest(model, pk, image_field, variants_field, manifest, old_variants)
+
+
+# ============== 后台线程池 ==============
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "IMAGE_DERIVATIVE_WORKERS", 2), thread_name_prefix="img-derivatives",
+            )
+        return _executor
+
+
+def _run(model, pk, image_field, variants_field):
+    try:
+        process(model, pk, image_field, variants_field)
+    except Exception:
+        logger.exception("Image derivative task failed for %s pk=%s", model.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def schedule(instance):
+    """保存后调用：过期的图片字段在事务提交后交给线程池（或同步）生成"""
+    fields = [(i, v) for i, v in image_fields().get(type(instance), []) if is_stale(instance, i, v)]
+    if not fields:
+        return
+    model, pk = type(instance), instance.pk
+
+    def submit():
+        for image_field, variants_field in fields:
+            if getattr(settings, "IMAGE_DERIVATIVES_ASYNC", True):
+                _get_executor().submit(_run, model, pk, image_field, variants_field)
+            else:
+                process(model, pk, image_field, variants_field)
+
+    transaction.on_commit(submit)
+
+
+def srcset(variants, fmt, build_url):
+    """清单 -> 'url 160w, url 480w'；build_url 把存储内的文件名转成（绝对）URL"""
+    entries = sorted((variants or {}).get("sizes", {}).values(), key=lambda e: e["w"])
+    return ", ".join(f"{build_url(e[fmt])} {e['w']}w" for e in entries if fmt in e)
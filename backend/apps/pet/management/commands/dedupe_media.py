@@ -0,0 +1,88 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common.storage import BLOB_DIR, ContentAddressedStorage, file_digest
+
+
+def _fmt(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f'{n:.1f} {unit}' if unit != 'B' else f'{n} B'
+        n /= 1024
+
+
+class Command(BaseCommand):
+    help = "Move existing MEDIA_ROOT files into the content-addressed blob store, hardlinking duplicates to one blob"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deduplicated')
+        parser.add_argument('--gc', action='store_true', help='Also remove blobs no longer referenced by any file')
+
+    def _files(self, root):
+        for dirpath, dirnames, filenames in os.walk(root):
+            if dirpath == root and BLOB_DIR in dirnames:
+                dirnames.remove(BLOB_DIR)
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.isfile(path) and not os.path.islink(path):
+                    yield path
+
+    def _gc(self, storage, dry):
+        removed = freed = 0
+        for dirpath, dirnames, filenames in os.walk(storage.blob_root()):
+            if dirpath == storage.blob_root() and 'tmp' in dirnames:
+                dirnames.remove('tmp')
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                st = os.stat(path)
+                if st.st_nlink == 1:
+                    removed += 1
+                    freed += st.st_size
+                    if not dry:
+                        os.remove(path)
+        return removed, freed
+
+    def handle(self, *args, **options):
+        dry = options['dry_run']
+        storage = ContentAddressedStorage(location=settings.MEDIA_ROOT)
+        root = storage.location
+        scanned = total = linked = duplicates = saved = 0
+
+        planned = {}  # 试运行：digest -> 首个文件（代替尚未创建的 blob）
+        for path in self._files(root):
+            st = os.stat(path)
+            scanned += 1
+            total += st.st_size
+            digest = file_digest(path)
+            blob = storage.blob_path(digest)
+            if not os.path.exists(blob) and digest not in planned:
+                # 第一次见到的内容：文件本身成为 blob（加一个硬链接，不复制）
+                linked += 1
+                if dry:
+                    planned[digest] = path
+                else:
+                    os.makedirs(os.path.dirname(blob), exist_ok=True)
+                    os.link(path, blob)
+                continue
+            if os.path.samefile(planned.get(digest, blob), path):
+                continue
+            # 重复内容：原子地把文件替换成指向已有 blob 的硬链接
+            duplicates += 1
+            if st.st_nlink == 1:
+                saved += st.st_size
+            if not dry:
+                tmp = f'{path}.dedupe.tmp'
+                os.link(blob, tmp)
+                os.replace(tmp, path)
+
+        self.stdout.write(
+            f'Scanned {scanned} files ({_fmt(total)}): {linked} new blobs, {duplicates} duplicates'
+        )
+        if options['gc']:
+            removed, freed = self._gc(storage, dry)
+            saved += freed
+            self.stdout.write(f'Garbage-collected {removed} unreferenced blobs ({_fmt(freed)})')
+        verb = 'Would save' if dry else 'Saved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {_fmt(saved)} ({saved} bytes)'))
@@ -0,0 +1,72 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.pet import images
+
+
+class Command(BaseCommand):
+    help = "Generate thumb/card/full WebP+JPEG derivatives for existing pet, pet photo, lost and shelter images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Resize processes (1 = in-process)')
+        parser.add_argument('--model', action='append', dest='models',
+                            help='Only these models (Pet, PetPhoto, Lost, Shelter); repeatable')
+        parser.add_argument('--force', action='store_true', help='Regenerate even if derivatives are current')
+
+    def _targets(self, models, force):
+        """(model, pk, 图片字段, 清单字段, 原图文件名, 旧清单)"""
+        for model, fields in images.image_fields().items():
+            if models and model.__name__.lower() not in models:
+                continue
+            for image_field, variants_field in fields:
+                rows = (
+                    model._base_manager.exclude(**{f'{image_field}__in': ['', None]})
+                    .order_by('pk').values_list('pk', image_field, variants_field).iterator(chunk_size=500)
+                )
+                for pk, name, variants in rows:
+                    if force or (variants or {}).get('source') != name:
+                        yield model, pk, image_field, variants_field, name, variants
+
+    def _save(self, target, manifest):
+        model, pk, image_field, variants_field, _, old = target
+        if manifest is None:
+            return False
+        return images.apply_manifest(model, pk, image_field, variants_field, manifest, old)
+
+    def handle(self, *args, **options):
+        known = {m.__name__.lower() for m in images.image_fields()}
+        models = {m.lower() for m in options['models'] or ()}
+        if models - known:
+            raise CommandError(f"Unknown model(s): {', '.join(sorted(models - known))}")
+        workers = max(1, options['workers'])
+        targets = self._targets(models, options['force'])
+        done = failed = 0
+
+        def record(ok):
+            nonlocal done, failed
+            if ok:
+                done += 1
+            else:
+                failed += 1
+            if (done + failed) % 100 == 0:
+                self.stdout.write(f'  ... {done} images, {failed} failed/skipped')
+
+        if workers == 1:
+            for target in targets:
+                record(self._save(target, images.try_generate(target[4])))
+        else:
+            # 子进程只做解码/缩放/编码，写库在主进程；最多 2×workers 张在途
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                inflight = deque()
+                for target in targets:
+                    inflight.append((target, pool.submit(images.try_generate, target[4])))
+                    if len(inflight) >= workers * 2:
+                        target_done, future = inflight.popleft()
+                        record(self._save(target_done, future.result()))
+                while inflight:
+                    target_done, future = inflight.popleft()
+                    record(self._save(target_done, future.result()))
+        self.stdout.write(self.style.SUCCESS(f'Generated derivatives for {done} images ({failed} failed/skipped)'))
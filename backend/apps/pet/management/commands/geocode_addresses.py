@@ -1,25 +1,43 @@
-from django.core.management.base import BaseCommand
+import time
+
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from django.contrib.gis.geos import Point
-from apps.pet.models import Address
-from common.utils import geocode_address
+from apps.pet.models import Address, GeocodeCheckpoint
+from apps.pet.geocoding import BatchGeocoder, PROVIDERS, address_context, default_providers
 from django.db.models import Q
 
 
 class Command(BaseCommand):
-    help = "Geocode Address rows missing latitude/longitude and save results."
+    help = "Geocode Address rows missing latitude/longitude and save results (batched, concurrent, resumable)."
 
     def add_arguments(self, parser):
-        parser.add_argument('--limit', type=int, default=500, help='Max rows to process')
+        parser.add_argument('--limit', type=int, default=500, help='Max rows to process (0 = no limit)')
         parser.add_argument('--dry-run', action='store_true', help='Only print, do not write changes')
         parser.add_argument('--recalc', action='store_true', help='Recalculate even if coordinates already exist')
         parser.add_argument('--filter', dest='filter_substr', type=str, help='Only process addresses containing this substring (street/city/region/country/postal/postfix)')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent lookups')
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows per batch / checkpoint interval')
+        parser.add_argument('--provider', choices=['auto', *PROVIDERS], default='auto',
+                            help='auto = Mapbox (if token) then Nominatim; stub = offline fake coordinates')
+        parser.add_argument('--rate', type=float, help='Override requests/second for the chosen provider')
+        parser.add_argument('--resume', action='store_true', help='Continue after the last checkpointed id')
+        parser.add_argument('--checkpoint', default='geocode_addresses', help='Checkpoint name')
+
+    def _providers(self, options):
+        if options['provider'] == 'auto':
+            providers = default_providers()
+            if options.get('rate'):
+                for p in providers:
+                    p.bucket.rate = options['rate']
+            return providers
+        return [PROVIDERS[options['provider']](rate=options.get('rate'))]
 
     def handle(self, *args, **options):
         limit = options['limit']
         dry = options['dry_run']
         recalc = options['recalc']
         filt = options.get('filter_substr')
+        batch_size = max(1, options['batch_size'])
 
         if recalc:
             qs = Address.objects.all()
@@ -35,47 +53,69 @@ class Command(BaseCommand):
                 Q(region__name__icontains=filt) |
                 Q(country__name__icontains=filt)
             )
+        qs = qs.select_related('city', 'region', 'country').order_by('id')
 
-        qs = qs.order_by('id')[:limit]
-        total = qs.count()
-        self.stdout.write(self.style.NOTICE(f'Processing {total} address rows (limit={limit})'))
-        updated = 0
-
-        for addr in qs:
-            parts = [
-                addr.street or '',
-                addr.building_number or '',
-                getattr(addr.city, 'name', '') if getattr(addr, 'city_id', None) else '',
-                getattr(addr.region, 'name', '') if getattr(addr, 'region_id', None) else '',
-                getattr(addr.country, 'name', '') if getattr(addr, 'country_id', None) else '',
-                addr.postal_code or '',
-            ]
-            s = ', '.join([p for p in parts if p])
-            if not s:
-                continue
-            ctx = {
-                'street': (f"{addr.street} {addr.building_number}".strip()) if (addr.street or addr.building_number) else None,
-                'city': getattr(addr.city, 'name', None) if getattr(addr, 'city_id', None) else None,
-                'region': getattr(addr.region, 'name', None) if getattr(addr, 'region_id', None) else None,
-                'country': getattr(addr.country, 'name', None) if getattr(addr, 'country_id', None) else None,
-                'country_code': getattr(getattr(addr, 'country', None), 'code', None) if getattr(addr, 'country_id', None) else None,
-                'postal_code': addr.postal_code or None,
-            }
-            coords = geocode_address(s, context=ctx)
-            if not coords:
-                continue
-            lon, lat = coords
-            if dry:
-                self.stdout.write(f'[dry-run] id={addr.id} -> {lat},{lon} ({s})')
-                updated += 1
-                continue
-            with transaction.atomic():
+        checkpoint = None
+        if not dry:
+            checkpoint, _ = GeocodeCheckpoint.objects.get_or_create(name=options['checkpoint'])
+            if options['resume']:
+                qs = qs.filter(id__gt=checkpoint.last_id)
+                self.stdout.write(self.style.NOTICE(f'Resuming after id={checkpoint.last_id}'))
+            else:
+                checkpoint.last_id = checkpoint.processed = checkpoint.updated = 0
+                checkpoint.save()
+
+        providers = self._providers(options)
+        if not providers:
+            raise CommandError('No geocoding provider available (set MAPBOX_TOKEN or use --provider nominatim/stub)')
+        geocoder = BatchGeocoder(providers, workers=options['workers'], persist=not dry)
+
+        self.stdout.write(self.style.NOTICE(
+            f"Geocoding with {', '.join(p.name for p in providers)} (workers={options['workers']}, limit={limit or '∞'})"
+        ))
+        started = time.monotonic()
+        processed = updated = 0
+        last_id = checkpoint.last_id if checkpoint else 0
+
+        while not limit or processed < limit:
+            size = batch_size if not limit else min(batch_size, limit - processed)
+            batch = list(qs.filter(id__gt=last_id)[:size])
+            if not batch:
+                break
+            items = {addr.id: address_context(addr) for addr in batch}
+            results = geocoder.geocode_many(items)
+
+            changed = []
+            for addr in batch:
+                coords = results.get(addr.id)
+                if not coords:
+                    continue
+                lon, lat = coords
+                if dry:
+                    self.stdout.write(f'[dry-run] id={addr.id} -> {lat},{lon} ({items[addr.id][0]})')
+                    continue
                 addr.latitude = lat
                 addr.longitude = lon
-                try:
-                    addr.location = Point(lon, lat)
-                except Exception:
-                    pass
-                addr.save(update_fields=['latitude', 'longitude', 'location'])
-                updated += 1
-        self.stdout.write(self.style.SUCCESS(f'Done. Updated {updated} rows.'))
+                addr.location = {"type": "Point", "coordinates": [lon, lat]}
+                changed.append(addr)
+
+            last_id = batch[-1].id
+            processed += len(batch)
+            with transaction.atomic():
+                # 逐行 save 以维护 geohash 并触发聚类/瓦片/搜索的同步信号
+                for addr in changed:
+                    addr.save(update_fields=['latitude', 'longitude', 'location'])
+                if checkpoint:
+                    checkpoint.last_id = last_id
+                    checkpoint.processed += len(batch)
+                    checkpoint.updated += len(changed)
+                    checkpoint.save()
+            updated += len(changed) if not dry else sum(1 for a in batch if results.get(a.id))
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'  ... {processed} rows, {updated} geocoded, last id={last_id}, '
+                f'{processed / elapsed if elapsed else 0:.1f} rows/s, stats={geocoder.stats}'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Done. Processed {processed} rows, updated {updated} rows.'))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.pet.geocoding import PROVIDERS, BatchGeocoder, default_providers, process_jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued GeocodeJob rows (addresses saved without coordinates), with retries and backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain currently due jobs and exit')
+        parser.add_argument('--batch-size', type=int, default=50, help='Jobs claimed per round')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent lookups per round')
+        parser.add_argument('--provider', choices=['auto', *PROVIDERS], default='auto',
+                            help='auto = Mapbox (if token) then Nominatim; stub = offline fake coordinates')
+        parser.add_argument('--idle-sleep', type=float, default=5.0, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        if options['provider'] == 'auto':
+            providers = default_providers()
+        else:
+            providers = [PROVIDERS[options['provider']]()]
+        if not providers:
+            raise CommandError('No geocoding provider available (set MAPBOX_TOKEN or use --provider nominatim/stub)')
+        geocoder = BatchGeocoder(providers, workers=options['workers'])
+
+        totals = {}
+        try:
+            while True:
+                counts = process_jobs(geocoder, limit=max(1, options['batch_size']))
+                for k, v in counts.items():
+                    totals[k] = totals.get(k, 0) + v
+                if counts['claimed']:
+                    self.stdout.write(f'  ... {counts}')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['idle_sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Geocode worker stopped: {totals}, stats={geocoder.stats}'))
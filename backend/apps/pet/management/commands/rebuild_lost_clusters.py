@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.pet.clusters import rebuild_clusters
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed lost-map clusters (LostMapCluster) from Lost + Address coordinates"
+
+    def handle(self, *args, **options):
+        n = rebuild_clusters()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {n} lost map cluster cells"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.pet.models import Pet
+from apps.pet.search import refresh_pet_documents
+
+
+class Command(BaseCommand):
+    help = "Rebuild PetSearchDocument rows (full-text + trigram search) for all pets"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **opts):
+        batch = opts["batch_size"]
+        ids = list(Pet.objects.order_by("pk").values_list("pk", flat=True))
+        done = 0
+        for i in range(0, len(ids), batch):
+            done += refresh_pet_documents(ids[i:i + batch])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {done} pet search documents"))
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:36
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+# pg_trgm 在托管 PostgreSQL 上通常可用；不可用时跳过（city 过滤退化为顺序扫描，功能不受影响）
+TRGM_INDEXES = (
+    ("pet_search_doc_city_trgm", "city"),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, column in TRGM_INDEXES:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {name} ON pet_petsearchdocument "
+                f"USING gin ({column} gin_trgm_ops)"
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for name, _ in TRGM_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def backfill_documents(apps, schema_editor):
+    from apps.pet.search import refresh_pet_documents
+
+    Pet = apps.get_model("pet", "Pet")
+    PetSearchDocument = apps.get_model("pet", "PetSearchDocument")
+    ids = list(Pet.objects.order_by("pk").values_list("pk", flat=True))
+    for i in range(0, len(ids), 1000):
+        refresh_pet_documents(ids[i:i + 1000], pet_model=Pet, document_model=PetSearchDocument)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pet', '0007_holidayfamily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PetSearchDocument',
+            fields=[
+                ('pet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_doc', serialize=False, to='pet.pet')),
+                ('name', models.CharField(blank=True, default='', max_length=80)),
+                ('species', models.CharField(blank=True, default='', max_length=40)),
+                ('breed', models.CharField(blank=True, default='', max_length=80)),
+                ('description', models.TextField(blank=True, default='')),
+                ('city', models.CharField(blank=True, default='', max_length=160)),
+                ('shelter_name', models.CharField(blank=True, default='', max_length=150)),
+                ('document', django.contrib.postgres.search.SearchVectorField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Pet Search Document',
+                'verbose_name_plural': 'Pet Search Documents',
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['document'], name='pet_search_document_gin')],
+            },
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
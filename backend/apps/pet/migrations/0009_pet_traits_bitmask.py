@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+# 与 apps.pet.models.PET_TRAIT_FIELDS 的位序一致
+TRAIT_FIELDS = (
+    "dewormed", "vaccinated", "microchipped", "child_friendly",
+    "trained", "loves_play", "loves_walks", "good_with_dogs",
+    "good_with_cats", "affectionate", "needs_attention", "sterilized",
+)
+
+
+def backfill_traits(apps, schema_editor):
+    Pet = apps.get_model("pet", "Pet")
+    expr = models.Value(0)
+    for i, name in enumerate(TRAIT_FIELDS):
+        expr = expr + models.Case(
+            models.When(**{name: True}, then=models.Value(1 << i)),
+            default=models.Value(0),
+        )
+    Pet.objects.update(traits=expr)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pet', '0008_pet_search_document'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pet',
+            name='traits',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Traits Bitmask'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(condition=models.Q(('status__in', ['available', 'pending'])), fields=['traits', '-pub_date'], name='pet_public_traits_idx'),
+        ),
+        migrations.RunPython(backfill_traits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pet', '0009_pet_traits_bitmask'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lost',
+            index=models.Index(fields=['-created_at', '-id'], name='lost_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(condition=models.Q(('status__in', ['available', 'pending'])), fields=['-pub_date', '-id'], name='pet_public_keyset_idx'),
+        ),
+    ]
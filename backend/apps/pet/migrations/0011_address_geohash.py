@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:40
+
+from django.db import migrations, models
+
+from common.geo import geohash_encode
+
+
+def backfill_geohash(apps, schema_editor):
+    Address = apps.get_model("pet", "Address")
+    batch = []
+    qs = Address.objects.filter(latitude__isnull=False, longitude__isnull=False).only("id", "latitude", "longitude")
+    for addr in qs.iterator(chunk_size=2000):
+        addr.geohash = geohash_encode(float(addr.latitude), float(addr.longitude))
+        batch.append(addr)
+        if len(batch) >= 2000:
+            Address.objects.bulk_update(batch, ["geohash"])
+            batch = []
+    if batch:
+        Address.objects.bulk_update(batch, ["geohash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pet', '0010_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12, verbose_name='Geohash'),
+        ),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['latitude', 'longitude'], name='address_lat_lon_idx'),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
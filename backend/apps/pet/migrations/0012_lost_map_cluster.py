@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:42
+
+from django.db import migrations, models
+
+
+def build_clusters(apps, schema_editor):
+    from apps.pet.clusters import rebuild_clusters
+
+    rebuild_clusters(
+        lost_model=apps.get_model("pet", "Lost"),
+        cluster_model=apps.get_model("pet", "LostMapCluster"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pet', '0011_address_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LostMapCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('open', 'Open'), ('found', 'Found'), ('closed', 'Closed')], max_length=20)),
+                ('precision', models.PositiveSmallIntegerField()),
+                ('cell', models.CharField(max_length=12)),
+                ('cell_lat', models.FloatField()),
+                ('cell_lon', models.FloatField()),
+                ('count', models.IntegerField(default=0)),
+                ('lat_sum', models.FloatField(default=0)),
+                ('lon_sum', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Lost Map Cluster',
+                'verbose_name_plural': 'Lost Map Clusters',
+                'indexes': [models.Index(fields=['precision', 'cell_lat', 'cell_lon'], name='lost_cluster_viewport_idx')],
+                'constraints': [models.UniqueConstraint(fields=('status', 'precision', 'cell'), name='lost_cluster_unique_cell')],
+            },
+        ),
+        migrations.RunPython(build_clusters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pet', '0013_geocode_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='geocode_status',
+            field=models.CharField(blank=True, choices=[('', 'Not requested'), ('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='', max_length=10, verbose_name='Geocode status'),
+        ),
+        migrations.CreateModel(
+            name='GeocodeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(db_index=True)),
+                ('last_error', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('address', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='geocode_job', to='pet.address')),
+            ],
+            options={
+                'verbose_name': 'Geocode Job',
+                'verbose_name_plural': 'Geocode Jobs',
+                'ordering': ['run_after', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# Django 的 icontains 编译为 UPPER("city"::text) LIKE UPPER(%x%)，
+# 原来建在裸 city 列上的 trigram 索引永远用不上；改成对同一表达式建索引。
+
+
+def create_upper_city_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("DROP INDEX IF EXISTS pet_search_doc_city_trgm")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS pet_search_doc_city_upper_trgm ON pet_petsearchdocument "
+            "USING gin ((UPPER(city::text)) gin_trgm_ops)"
+        )
+
+
+def drop_upper_city_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP INDEX IF EXISTS pet_search_doc_city_upper_trgm")
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is not None:
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS pet_search_doc_city_trgm ON pet_petsearchdocument "
+                "USING gin (city gin_trgm_ops)"
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pet', '0015_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_upper_city_index, drop_upper_city_index),
+    ]
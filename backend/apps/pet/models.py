@@ -1,15 +1,85 @@
 # apps/pet/models.py
+import logging
+
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.utils.safestring import mark_safe
 from smart_selects.db_fields import ChainedForeignKey
 
+from common.geo import geohash_encode
+
 User = get_user_model()
 
+# 特性位图的位序：只能在末尾追加，不能调整已有顺序（否则已存的 traits 值会错位）
+PET_TRAIT_FIELDS = (
+    "dewormed", "vaccinated", "microchipped", "child_friendly",
+    "trained", "loves_play", "loves_walks", "good_with_dogs",
+    "good_with_cats", "affectionate", "needs_attention", "sterilized",
+)
+PET_TRAIT_BITS = {name: 1 << i for i, name in enumerate(PET_TRAIT_FIELDS)}
+
+
+def trait_mask(names) -> int:
+    """特性名列表 -> 位掩码；未知名字抛 KeyError"""
+    mask = 0
+    for name in names:
+        mask |= PET_TRAIT_BITS[name]
+    return mask
+
+
+class PetQuerySet(models.QuerySet):
+    """保证批量写入（update/bulk_create/bulk_update）时 traits 位图与布尔字段一致"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.traits = obj.compute_traits()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if set(fields) & PET_TRAIT_BITS.keys():
+            # 只写了部分列时内存对象可能是旧值，按数据库里的列重算
+            self.model._base_manager.filter(pk__in=[o.pk for o in objs]).update(traits=traits_expression())
+        return rows
+
+    def update(self, **kwargs):
+        changed = {k: v for k, v in kwargs.items() if k in PET_TRAIT_BITS}
+        if not changed or "traits" in kwargs:
+            return super().update(**kwargs)
+        if all(isinstance(v, bool) for v in changed.values()):
+            # 常量赋值：一条 UPDATE 里直接置位/清位
+            set_mask = trait_mask(k for k, v in changed.items() if v)
+            clear_mask = trait_mask(k for k, v in changed.items() if not v)
+            expr = models.F("traits")
+            if set_mask:
+                expr = expr.bitor(set_mask)
+            if clear_mask:
+                expr = expr.bitand(~clear_mask & ((1 << len(PET_TRAIT_FIELDS)) - 1))
+            return super().update(traits=expr, **kwargs)
+        # 表达式赋值（F(...) 等）：先更新，再按列值重算这些行的位图
+        pks = list(self.values_list("pk", flat=True))
+        rows = super().update(**kwargs)
+        self.model._base_manager.filter(pk__in=pks).update(traits=traits_expression())
+        return rows
+
+
+def traits_expression():
+    """由 12 个布尔列计算 traits 的 SQL 表达式，用于回填/重算"""
+    expr = models.Value(0)
+    for name, bit in PET_TRAIT_BITS.items():
+        expr = expr + models.Case(
+            models.When(**{name: True}, then=models.Value(bit)),
+            default=models.Value(0),
+        )
+    return expr
+
 
 class Pet(models.Model):
     SEX_CHOICES = (
@@ -54,6 +124,8 @@ class Pet(models.Model):
     affectionate = models.BooleanField("Affectionate", default=False)
     needs_attention = models.BooleanField("Needs Attention", default=False)
     sterilized = models.BooleanField("Sterilized/Neutered", default=False)
+    # 上面 12 个特性的位图（位序见 PET_TRAIT_FIELDS），保存时自动维护，用于多特性组合过滤
+    traits = models.PositiveIntegerField("Traits Bitmask", default=0, editable=False)
     contact_phone = models.CharField("Contact Phone", max_length=30, blank=True, default="")
     
     address = models.ForeignKey(
@@ -63,6 +135,8 @@ class Pet(models.Model):
         "pet.Shelter", on_delete=models.SET_NULL, null=True, blank=True, related_name="pets", verbose_name="Shelter"
     )
     cover = models.ImageField("Cover", upload_to="pets/", blank=True, null=True)
+    # 缩略图/卡片/大图的 WebP+JPEG 派生文件清单，由 apps.pet.images 在后台生成
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     status = models.CharField(
         "Status", max_length=20, choices=Status.choices,
@@ -75,6 +149,8 @@ class Pet(models.Model):
     add_date = models.DateTimeField("Created At", auto_now_add=True)
     pub_date = models.DateTimeField("Updated At", auto_now=True)
 
+    objects = PetQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Pet"
         verbose_name_plural = "Pets"
@@ -83,11 +159,33 @@ class Pet(models.Model):
             models.Index(fields=["status"]),
             models.Index(fields=["species", "breed"]),
             models.Index(fields=["created_by"]),
+            # 公开列表的特性组合过滤：只索引 available/pending
+            models.Index(
+                fields=["traits", "-pub_date"],
+                name="pet_public_traits_idx",
+                condition=models.Q(status__in=["available", "pending"]),
+            ),
+            # 公开列表的游标分页 (pub_date, id)
+            models.Index(
+                fields=["-pub_date", "-id"],
+                name="pet_public_keyset_idx",
+                condition=models.Q(status__in=["available", "pending"]),
+            ),
         ]
 
     def __str__(self):
         return f"{self.name} ({self.species})"
 
+    def compute_traits(self) -> int:
+        return trait_mask(name for name in PET_TRAIT_FIELDS if getattr(self, name))
+
+    def save(self, *args, **kwargs):
+        self.traits = self.compute_traits()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and set(update_fields) & PET_TRAIT_BITS.keys():
+            kwargs["update_fields"] = set(update_fields) | {"traits"}
+        super().save(*args, **kwargs)
+
 
 # simple use case:
 # when user submit application, if pet available, status change into pending
@@ -197,85 +295,124 @@ class Donation(models.Model):
         return f"{self.donor} -> {self.name} ({self.species}) [{self.status}]"
 
     # —— 审核通过时自动创建 Pet，并将第一张图设为封面 ——
+    def _copy_photos(self):
+        """
+        在事务外把捐赠照片复制成 Pet 封面 + PetPhoto 文件：走存储层复制（本地为硬链接），
+        不把文件读进内存。返回 (封面文件名, [(序号, 照片文件名)])
+        """
+        from common.storage import copy_file
+        cover, photos = None, []
+        for idx, donation_photo in enumerate(self.photos.order_by("id")):
+            if not donation_photo.image:
+                continue
+            orig_name = donation_photo.image.name.split("/")[-1]
+            try:
+                if cover is None:
+                    cover = copy_file(donation_photo.image.name, f"pets/donation_{self.pk}_{orig_name}")
+                photos.append((idx, copy_file(donation_photo.image.name, f"pets/photos/donation_{self.pk}_{idx}_{orig_name}")))
+            except Exception as e:
+                # 出错也不阻断主流程
+                logging.error(f"Failed to copy photo {idx} for donation {self.pk}: {e}")
+        return cover, photos
+
     def approve(self, reviewer, note=""):
+        """
+        审核通过：先在事务外复制照片，再用一个短事务（锁住本条捐赠）创建 Pet/PetPhoto 并更新状态；
+        并发重复审批时后到者直接返回已创建的 Pet，并清理自己复制出的文件。
+        """
         from django.db import transaction
-        with transaction.atomic():
-            if self.created_pet:
-                return self.created_pet  # 避免重复创建
-
-            if self.status not in ("submitted", "reviewing", "approved"):
-                raise ValueError("Current status can't process")
-
-            pet = Pet.objects.create(
-                name=self.name, species=self.species, breed=self.breed, sex=self.sex,
-                age_years=self.age_years, age_months=self.age_months,
-                description=self.description,
-                address=self.address,
-                dewormed=self.dewormed,
-                vaccinated=self.vaccinated,
-                microchipped=self.microchipped,
-                sterilized=self.sterilized,
-                child_friendly=self.child_friendly,
-                trained=self.trained,
-                loves_play=self.loves_play,
-                loves_walks=self.loves_walks,
-                good_with_dogs=self.good_with_dogs,
-                good_with_cats=self.good_with_cats,
-                affectionate=self.affectionate,
-                needs_attention=self.needs_attention,
-                contact_phone=self.contact_phone,
-                status=Pet.Status.AVAILABLE,
-                created_by=self.donor,  # 或 reviewer/机构账号
-            )
-            
-            # 复制所有照片到 PetPhoto
-            donation_photos = self.photos.order_by("id").all()
-            for idx, donation_photo in enumerate(donation_photos):
-                if not donation_photo.image:
-                    continue
-                    
-                try:
-                    # 读取照片数据
-                    donation_photo.image.open("rb")
-                    data = donation_photo.image.read()
-                    donation_photo.image.close()
-                    
-                    # 生成新文件名
-                    orig_name = donation_photo.image.name.split("/")[-1]
-                    
-                    # 第一张设为封面
-                    if idx == 0:
-                        target_path = f"pets/{pet.id}_{orig_name}"
-                        saved_path = default_storage.save(target_path, ContentFile(data))
-                        pet.cover.name = saved_path
-                        pet.save(update_fields=["cover"])
-                    
-                    # 创建 PetPhoto（包括第一张，这样在 photos 数组中也能看到所有照片）
-                    pet_photo = PetPhoto.objects.create(
-                        pet=pet,
-                        order=idx,
-                    )
-                    photo_target_path = f"pets/photos/{pet.id}_{idx}_{orig_name}"
-                    pet_photo.image.save(photo_target_path, ContentFile(data), save=True)
-                    
-                except Exception as e:
-                    # 出错也不阻断主流程
-                    import logging
-                    logging.error(f"Failed to copy photo {idx} for pet {pet.id}: {e}")
-                    continue
-
-            self.created_pet = pet
-            self.status = "approved"
-            self.reviewer = reviewer
-            self.review_note = note
-            self.save(update_fields=["created_pet", "status", "reviewer", "review_note", "pub_date"])
-            return pet
+        if self.created_pet:
+            return self.created_pet  # 避免重复创建
+        if self.status not in ("submitted", "reviewing", "approved"):
+            raise ValueError("Current status can't process")
+
+        cover, photos = self._copy_photos()
+        copied = [name for name in [cover, *(n for _, n in photos)] if name]
+        try:
+            with transaction.atomic():
+                locked = Donation.objects.select_for_update(of=("self",)).select_related("created_pet").get(pk=self.pk)
+                if locked.created_pet:
+                    self.created_pet, self.status = locked.created_pet, locked.status
+                    for name in copied:
+                        default_storage.delete(name)
+                    return locked.created_pet
+                if locked.status not in ("submitted", "reviewing", "approved"):
+                    raise ValueError("Current status can't process")
+
+                pet = Pet.objects.create(
+                    name=self.name, species=self.species, breed=self.breed, sex=self.sex,
+                    age_years=self.age_years, age_months=self.age_months,
+                    description=self.description,
+                    address=self.address,
+                    dewormed=self.dewormed,
+                    vaccinated=self.vaccinated,
+                    microchipped=self.microchipped,
+                    sterilized=self.sterilized,
+                    child_friendly=self.child_friendly,
+                    trained=self.trained,
+                    loves_play=self.loves_play,
+                    loves_walks=self.loves_walks,
+                    good_with_dogs=self.good_with_dogs,
+                    good_with_cats=self.good_with_cats,
+                    affectionate=self.affectionate,
+                    needs_attention=self.needs_attention,
+                    contact_phone=self.contact_phone,
+                    status=Pet.Status.AVAILABLE,
+                    created_by=self.donor,  # 或 reviewer/机构账号
+                    cover=cover,
+                )
+                # 所有照片（包括第一张）都建 PetPhoto，这样在 photos 数组中也能看到所有照片
+                for idx, name in photos:
+                    PetPhoto.objects.create(pet=pet, image=name, order=idx)
+
+                self.created_pet = pet
+                self.status = "approved"
+                self.reviewer = reviewer
+                self.review_note = note
+                self.save(update_fields=["created_pet", "status", "reviewer", "review_note", "pub_date"])
+                return pet
+        except Exception:
+            for name in copied:
+                default_storage.delete(name)
+            raise
+
+    @classmethod
+    def approve_many(cls, donations, reviewer, note="", workers=4):
+        """
+        批量审批（后台 action 用）：每条捐赠各自独立事务，照片复制可并行，workers 个线程并发处理。
+        返回 (成功数, {donation_id: 错误})
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connections
+
+        def run(donation):
+            try:
+                donation.approve(reviewer=reviewer, note=note)
+                return donation.pk, None
+            except Exception as e:
+                return donation.pk, e
+
+        def run_in_thread(donation):
+            try:
+                return run(donation)
+            finally:
+                connections.close_all()  # 工作线程各自的数据库连接
+
+        donations = list(donations)
+        if workers > 1 and len(donations) > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="donation-approve") as pool:
+                results = list(pool.map(run_in_thread, donations))
+        else:
+            results = [run(d) for d in donations]
+        errors = {pk: e for pk, e in results if e is not None}
+        return len(results) - len(errors), errors
 
 
 class PetPhoto(models.Model):
     """ Pet 的额外照片（多图） """
     pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name="photos", verbose_name="Pet")
     image = models.ImageField("Photo", upload_to="pets/photos/")
+    variants = models.JSONField(default=dict, blank=True, editable=False)
     order = models.PositiveIntegerField("Display Order", default=0)  # 用于排序
     add_date = models.DateTimeField("Created At", auto_now_add=True)
 
@@ -348,6 +485,12 @@ class City(models.Model):
 
 
 class Address(models.Model):
+    class GeocodeStatus(models.TextChoices):
+        NONE = "", "Not requested"
+        PENDING = "pending", "Pending"  # 已入队，等待 geocode_worker 处理
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"  # 查无结果或重试次数用尽
+
     country = models.ForeignKey(
         Country, on_delete=models.PROTECT, verbose_name="Country",
         null=True, blank=True  # ← 允许空（第一次迁移更顺滑）
@@ -371,6 +514,11 @@ class Address(models.Model):
     longitude = models.DecimalField("Lng", max_digits=9, decimal_places=6, null=True, blank=True)
   # ✅ 新增：地理点（WGS84，经纬度）
     location  = models.JSONField(default=dict, null=True, blank=True)
+    # 由经纬度派生，保存时自动维护；前缀即所在网格，用于聚类/瓦片等按格子分组
+    geohash = models.CharField("Geohash", max_length=12, blank=True, default="", db_index=True, editable=False)
+    geocode_status = models.CharField(
+        "Geocode status", max_length=10, choices=GeocodeStatus.choices, blank=True, default=GeocodeStatus.NONE
+    )
 
     class Meta:
         ordering = ["country", "region", "city", "street"]
@@ -379,8 +527,25 @@ class Address(models.Model):
         indexes = [
             models.Index(fields=["country", "region", "city"]),
             models.Index(fields=["postal_code"]),
+            # 半径/包围盒查询：先按纬度范围扫索引，再在索引内过滤经度
+            models.Index(fields=["latitude", "longitude"], name="address_lat_lon_idx"),
         ]
 
+    def compute_geohash(self) -> str:
+        if self.latitude is None or self.longitude is None:
+            return ""
+        return geohash_encode(float(self.latitude), float(self.longitude))
+
+    def save(self, *args, **kwargs):
+        self.geohash = self.compute_geohash()
+        if self.geohash and self.geocode_status == self.GeocodeStatus.PENDING:
+            # 坐标已由用户或其他途径补上，排队中的任务由 worker 直接丢弃
+            self.geocode_status = self.GeocodeStatus.DONE
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"geohash", "geocode_status"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         parts = [
             self.street, self.building_number,
@@ -392,6 +557,64 @@ class Address(models.Model):
         return ", ".join([p for p in parts if p]) or "Address"
 
 
+class GeocodeCache(models.Model):
+    """
+    持久化的地理编码结果（按规范化地址去重），不受缓存淘汰影响。
+    found=False 记录“查无此地址”，避免批量回填时反复请求同一个无效地址。
+    """
+    key = models.CharField(max_length=64, unique=True)  # 规范化查询串的 sha256
+    query = models.CharField(max_length=512)
+    provider = models.CharField(max_length=20, blank=True, default="")
+    found = models.BooleanField(default=False)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Geocode Cache"
+        verbose_name_plural = "Geocode Cache"
+
+    def __str__(self):
+        return f"{self.query} -> {self.latitude},{self.longitude}" if self.found else f"{self.query} -> (not found)"
+
+
+class GeocodeCheckpoint(models.Model):
+    """批量地理编码的断点：记录已处理到的 Address id，--resume 时从这里继续"""
+    name = models.CharField(max_length=64, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Geocode Checkpoint"
+        verbose_name_plural = "Geocode Checkpoints"
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
+
+
+class GeocodeJob(models.Model):
+    """
+    地理编码任务队列（数据库表即队列，与业务写入同事务提交）。
+    每个地址至多一条任务；geocode_worker 用 SELECT ... FOR UPDATE SKIP LOCKED 领取，
+    领取时把 run_after 推后一个租约期，worker 崩溃后任务会在租约到期后被重新领取。
+    """
+    address = models.OneToOneField(Address, on_delete=models.CASCADE, related_name="geocode_job")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(db_index=True)
+    last_error = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["run_after", "id"]
+        verbose_name = "Geocode Job"
+        verbose_name_plural = "Geocode Jobs"
+
+    def __str__(self):
+        return f"GeocodeJob(address={self.address_id}, attempts={self.attempts})"
+
+
 class LostStatus(models.TextChoices):
     OPEN = "open", "Open"  # 待寻找
     FOUND = "found", "Found"  # 已找到
@@ -426,6 +649,7 @@ class Lost(models.Model):
     reward = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
     photo = models.ImageField(upload_to=lost_upload_to, null=True, blank=True)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     status = models.CharField(max_length=20, choices=LostStatus.choices, default=LostStatus.OPEN)
     reporter = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='lost_reports')
@@ -439,6 +663,7 @@ class Lost(models.Model):
         ordering = ['-created_at']
         verbose_name = "Lost"
         verbose_name_plural = "Losts"
+        indexes = [models.Index(fields=["-created_at", "-id"], name="lost_keyset_idx")]
 
     def __str__(self):
         base = self.pet_name or f"{self.species} ({self.color})"
@@ -453,6 +678,34 @@ class Lost(models.Model):
         return f"[{self.get_status_display()}] {base}"
 
 
+class LostMapCluster(models.Model):
+    """
+    走失地图的预聚合：按 geohash 前缀（精度 1~6，对应不同缩放级别）分格统计 Lost 数量与坐标和。
+    由 signals 增量维护（见 apps/pet/clusters.py），rebuild_lost_clusters 命令可全量重建。
+    """
+    status = models.CharField(max_length=20, choices=LostStatus.choices)
+    precision = models.PositiveSmallIntegerField()
+    cell = models.CharField(max_length=12)  # geohash 前缀
+    cell_lat = models.FloatField()  # 格子中心，用于视口过滤
+    cell_lon = models.FloatField()
+    count = models.IntegerField(default=0)
+    lat_sum = models.FloatField(default=0)  # 质心 = lat_sum / count
+    lon_sum = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name = "Lost Map Cluster"
+        verbose_name_plural = "Lost Map Clusters"
+        constraints = [
+            models.UniqueConstraint(fields=["status", "precision", "cell"], name="lost_cluster_unique_cell"),
+        ]
+        indexes = [
+            models.Index(fields=["precision", "cell_lat", "cell_lon"], name="lost_cluster_viewport_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.cell} [{self.status}] x{self.count}"
+
+
 class Shelter(models.Model):
     """Animal shelter organization"""
     name = models.CharField("Shelter Name", max_length=150, unique=True)
@@ -472,6 +725,8 @@ class Shelter(models.Model):
     # Images
     logo = models.ImageField("Logo", upload_to="shelters/logos/", blank=True, null=True)
     cover_image = models.ImageField("Cover Image", upload_to="shelters/covers/", blank=True, null=True)
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)
     
     # Capacity and statistics
     capacity = models.PositiveIntegerField("Capacity", default=0, help_text="Maximum number of animals")
@@ -538,6 +793,30 @@ class PetFavorite(models.Model):
     def __str__(self):
         return f"{self.user} ❤ {self.pet}"
 
+
+class PetSearchDocument(models.Model):
+    """
+    Pet 的反范式搜索文档（由 signals 维护，见 apps/pet/search.py）。
+    ?search= 走 document 上的 GIN 全文索引；city / name 等子串过滤走 pg_trgm 索引（迁移里按扩展可用性创建）。
+    """
+    pet = models.OneToOneField(Pet, on_delete=models.CASCADE, primary_key=True, related_name="search_doc")
+    name = models.CharField(max_length=80, blank=True, default="")
+    species = models.CharField(max_length=40, blank=True, default="")
+    breed = models.CharField(max_length=80, blank=True, default="")
+    description = models.TextField(blank=True, default="")
+    city = models.CharField(max_length=160, blank=True, default="")  # 地址城市 + 收容所城市
+    shelter_name = models.CharField(max_length=150, blank=True, default="")
+    document = SearchVectorField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Pet Search Document"
+        verbose_name_plural = "Pet Search Documents"
+        indexes = [GinIndex(fields=["document"], name="pet_search_document_gin")]
+
+    def __str__(self):
+        return f"search doc for pet #{self.pet_id}"
+
 class Ticket(models.Model):
     """Support ticket for admin use."""
     
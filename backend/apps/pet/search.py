@@ -0,0 +1,116 @@
+# apps/pet/search.py
+"""
+Pet 搜索文档的构建与查询。
+
+PetSearchDocument 把 name/species/breed/description/城市/收容所名 摊平到一张表，
+?search= 用 tsvector（'simple' 配置，中英文/波兰语都不做词干化）+ GIN 索引排名，
+?city= 用 UPPER(city) 上的 pg_trgm 表达式索引做子串匹配，避免在 pet/address/shelter 之间做多次 JOIN + ILIKE。
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F
+
+SEARCH_CONFIG = "simple"
+
+# Pet 上会影响搜索文档的字段；save(update_fields=...) 不含这些时无需重建
+PET_SEARCH_FIELDS = {"name", "species", "breed", "description", "address", "shelter"}
+
+_TERM_RE = re.compile(r"[\w-]+", re.UNICODE)
+
+
+def document_vector():
+    """按字段加权的 tsvector 表达式：名字 > 品种/物种 > 城市/收容所 > 描述"""
+    return (
+        SearchVector("name", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("species", "breed", weight="B", config=SEARCH_CONFIG)
+        + SearchVector("city", "shelter_name", weight="C", config=SEARCH_CONFIG)
+        + SearchVector("description", weight="D", config=SEARCH_CONFIG)
+    )
+
+
+def _city_text(*cities) -> str:
+    names = []
+    for c in cities:
+        if c and c.name not in names:
+            names.append(c.name)
+    return " ".join(names)
+
+
+def build_document_values(pet) -> dict:
+    """从（已 select_related 的）Pet 取出搜索文档各列的值"""
+    addr_city = pet.address.city if pet.address_id and pet.address.city_id else None
+    shelter = pet.shelter
+    if not shelter:
+        donation = getattr(pet, "from_donor", None)
+        shelter = donation.shelter if donation else None
+    shelter_city = None
+    if shelter and shelter.address_id and shelter.address.city_id:
+        shelter_city = shelter.address.city
+    return {
+        "name": pet.name or "",
+        "species": pet.species or "",
+        "breed": pet.breed or "",
+        "description": pet.description or "",
+        "city": _city_text(addr_city, shelter_city),
+        "shelter_name": shelter.name if shelter else "",
+    }
+
+
+def refresh_pet_documents(pet_ids, *, pet_model=None, document_model=None):
+    """
+    重建给定 Pet 的搜索文档：先 upsert 文本列，再用一条 UPDATE 计算 tsvector。
+    pet_model/document_model 供迁移传入历史模型。
+    """
+    if pet_model is None or document_model is None:
+        from .models import Pet, PetSearchDocument
+        pet_model, document_model = Pet, PetSearchDocument
+
+    pet_ids = list({pid for pid in pet_ids if pid})
+    if not pet_ids:
+        return 0
+
+    pets = pet_model.objects.filter(pk__in=pet_ids).select_related(
+        "address__city",
+        "shelter__address__city",
+        "from_donor__shelter__address__city",
+    )
+    docs = [document_model(pet_id=p.pk, **build_document_values(p)) for p in pets]
+    if not docs:
+        return 0
+    document_model.objects.bulk_create(
+        docs,
+        update_conflicts=True,
+        unique_fields=["pet"],
+        update_fields=["name", "species", "breed", "description", "city", "shelter_name"],
+    )
+    document_model.objects.filter(pet_id__in=[d.pet_id for d in docs]).update(document=document_vector())
+    return len(docs)
+
+
+def parse_terms(value: str):
+    return _TERM_RE.findall(value or "")
+
+
+def build_query(value: str):
+    """
+    把用户输入转成前缀匹配的 tsquery（'gold ret' -> 'gold:* & ret:*'）。
+    只保留单词字符，避免 to_tsquery 语法错误。
+    """
+    terms = parse_terms(value)
+    if not terms:
+        return None
+    raw = " & ".join(f"{t}:*" for t in terms)
+    return SearchQuery(raw, search_type="raw", config=SEARCH_CONFIG)
+
+
+def search_pets(queryset, value: str):
+    """按搜索文档过滤并按相关度排序；无有效关键词时原样返回"""
+    query = build_query(value)
+    if query is None:
+        return queryset
+    return (
+        queryset.filter(search_doc__document=query)
+        .annotate(search_rank=SearchRank(F("search_doc__document"), query))
+        .order_by("-search_rank", "-pub_date")
+    )
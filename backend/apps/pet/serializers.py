@@ -1,14 +1,58 @@
 from __future__ import annotations
 # apps/pet/serializers.py
 from rest_framework import serializers
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 import json
 from .models import Pet, Adoption, DonationPhoto, Donation, Lost, Address, Country, Region, City, PetFavorite, Shelter, Ticket, HolidayFamily
 from typing import TYPE_CHECKING
-from common.utils import geocode_address
+from .geocoding import enqueue_geocode
+from . import images
 if TYPE_CHECKING:
     from apps.pet.models import Location
 
 
+def _media_url(request, name):
+    from django.core.files.storage import default_storage
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request else url
+
+
+def image_srcset(request, file, variants):
+    """
+    图片 + 派生清单 -> {"src", "width", "height", "webp", "jpeg"}，前端直接用于 <picture>/srcset；
+    派生图尚未生成时 webp/jpeg 为空串，src 退回原图
+    """
+    if not file:
+        return None
+    variants = variants if (variants or {}).get("source") == file.name else {}
+    sizes = variants.get("sizes") or {}
+    # 默认 src 用 card 档（列表卡片尺寸），没有则用原图
+    default = sizes.get("card") or sizes.get("full") or sizes.get("thumb")
+    return {
+        "src": _media_url(request, default["jpeg"] if default else file.name),
+        "width": variants.get("width"),
+        "height": variants.get("height"),
+        "webp": images.srcset(variants, "webp", lambda n: _media_url(request, n)),
+        "jpeg": images.srcset(variants, "jpeg", lambda n: _media_url(request, n)),
+    }
+
+
+class SrcsetField(serializers.Field):
+    """只读：image_field + variants_field -> image_srcset(...)"""
+
+    def __init__(self, image_field, variants_field, **kwargs):
+        self.image_field = image_field
+        self.variants_field = variants_field
+        kwargs.update(source="*", read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        return image_srcset(
+            self.context.get("request"), getattr(obj, self.image_field), getattr(obj, self.variants_field),
+        )
+
+
 def _create_or_resolve_address(address_data: dict) -> Address:
     """
     Resolve or create Country/Region/City from provided strings or IDs and return an Address instance.
@@ -117,54 +161,6 @@ def _create_or_resolve_address(address_data: dict) -> Address:
     
     logger.warning(f"Final addr_kwargs: {addr_kwargs}")
 
-    # If coordinates were not provided, try geocoding from the textual address
-    if (lat_val is None or lon_val is None):
-        # Prefer resolved model names for city/region/country when available
-        parts = []
-        street = _norm(address_data.get('street')) if address_data.get('street') else None
-        bnum = _norm(address_data.get('building_number')) if address_data.get('building_number') else None
-        if street and bnum and bnum not in street:
-            parts.append(f"{street} {bnum}")
-        elif street:
-            parts.append(street)
-        elif bnum:
-            parts.append(bnum)
-
-        # add locality hierarchy (prefer resolved objects)
-        if city:
-            parts.append(city.name)
-        elif address_data.get('city'):
-            parts.append(_norm(address_data.get('city')))
-        if region:
-            parts.append(region.name)
-        elif address_data.get('region'):
-            parts.append(_norm(address_data.get('region')))
-        if country:
-            parts.append(country.name)
-        elif address_data.get('country'):
-            parts.append(_norm(address_data.get('country')))
-
-        if address_data.get('postal_code'):
-            parts.append(_norm(address_data.get('postal_code')))
-
-        addr_str = ", ".join([p for p in parts if p])
-        try:
-            ctx = {
-                'street': (f"{street} {bnum}" if street else bnum) if (street or bnum) else None,
-                'city': city.name if city else None,
-                'region': region.name if region else None,
-                'country': country.name if country else None,
-                'country_code': country.code if country else None,
-                'postal_code': _norm(address_data.get('postal_code')) if address_data.get('postal_code') else None,
-            }
-            coords = geocode_address(addr_str, context=ctx) if addr_str else None
-        except Exception:
-            coords = None
-        if coords:
-            lon_val, lat_val = coords
-            addr_kwargs['latitude'] = lat_val
-            addr_kwargs['longitude'] = lon_val
-
     if lat_val is not None and lon_val is not None:
         try:
             # Store location as JSON with lon,lat
@@ -175,6 +171,9 @@ def _create_or_resolve_address(address_data: dict) -> Address:
 
     addr = Address.objects.create(**addr_kwargs)
     logger.debug('Address created id=%s with kwargs=%r', getattr(addr, 'id', None), addr_kwargs)
+    # 未提供坐标：入队由 geocode_worker 异步补齐，不在请求里等第三方服务
+    if lat_val is None or lon_val is None:
+        enqueue_geocode(addr)
     return addr
 
 
@@ -240,6 +239,33 @@ class LostGeoSerializer(serializers.ModelSerializer):
         model = Lost
         fields = ("id", "status", "pet_name", "species", "breed", "color", "sex", "size", "reporter", "lost_time", "geometry")
 
+# PetListSerializer 读到的所有外键链路，列表/详情查询时一次性 JOIN 进来
+PET_LIST_RELATED = (
+    "created_by",
+    "address", "address__city", "address__region", "address__country",
+    "shelter", "shelter__address", "shelter__address__city",
+    "shelter__address__region", "shelter__address__country",
+    "from_donor", "from_donor__shelter", "from_donor__shelter__address",
+    "from_donor__shelter__address__city", "from_donor__shelter__address__region",
+    "from_donor__shelter__address__country",
+)
+
+
+class PetListListSerializer(serializers.ListSerializer):
+    """many=True 时先批量查出当前用户收藏过的 pet id，避免每行一次 exists()"""
+
+    def to_representation(self, data):
+        pets = list(data.all() if hasattr(data, "all") else data)
+        request = self.context.get("request")
+        u = getattr(request, "user", None)
+        if u and u.is_authenticated and "favorited_pet_ids" not in self.context:
+            self.context["favorited_pet_ids"] = set(
+                PetFavorite.objects.filter(user=u, pet_id__in=[p.id for p in pets])
+                .values_list("pet_id", flat=True)
+            )
+        return super().to_representation(pets)
+
+
 class PetListSerializer(serializers.ModelSerializer):
     created_by = serializers.StringRelatedField(read_only=True)
     applications_count = serializers.IntegerField(read_only=True, default=0)  # 预留统计字段
@@ -249,10 +275,14 @@ class PetListSerializer(serializers.ModelSerializer):
     # provide numeric coordinates for frontend map (fallback: address -> location)
     address_lat = serializers.SerializerMethodField()
     address_lon = serializers.SerializerMethodField()
+    # "pending" 表示坐标正由后台地理编码补齐
+    address_geocode_status = serializers.CharField(source='address.geocode_status', read_only=True, default='')
     photo = serializers.ImageField(source='cover', read_only=True)
     photos = serializers.SerializerMethodField()  # 多张照片数组
+    cover_srcset = SrcsetField("cover", "cover_variants")
+    photos_srcset = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
-    favorites_count = serializers.IntegerField(source='favorites.count', read_only=True)
+    favorites_count = serializers.SerializerMethodField()
     # 收容所信息
     shelter_name = serializers.SerializerMethodField()
     shelter_address = serializers.SerializerMethodField()
@@ -263,11 +293,13 @@ class PetListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Pet
+        list_serializer_class = PetListListSerializer
         fields = (
             "id", "name", "species", "breed", "sex",
             "age_years", "age_months", "age_display", "size",
             "description", "address_display", "city", "cover", 'photo', 'photos',
-            "address_lat", "address_lon",
+            "cover_srcset", "photos_srcset",
+            "address_lat", "address_lon", "address_geocode_status",
             "dewormed", "vaccinated", "microchipped", "child_friendly", "trained",
             "loves_play", "loves_walks", "good_with_dogs", "good_with_cats",
             "affectionate", "needs_attention", "sterilized", "contact_phone",
@@ -278,6 +310,23 @@ class PetListSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ("status", "created_by", "applications_count", "add_date", "pub_date")
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        预取列表字段会用到的关联数据：外键走 select_related，照片走 prefetch，
+        收藏数用子查询注解，这样一页的查询次数与页大小无关。
+        """
+        favorites_total = (
+            PetFavorite.objects.filter(pet=OuterRef("pk"))
+            .order_by().values("pet").annotate(c=Count("id")).values("c")
+        )
+        return (
+            queryset
+            .select_related(*PET_LIST_RELATED)
+            .prefetch_related("photos")
+            .annotate(favorites_total=Coalesce(Subquery(favorites_total), 0))
+        )
+
     def get_photos(self, obj: Pet):
         """返回所有额外照片的 URL"""
         request = self.context.get('request')
@@ -294,13 +343,37 @@ class PetListSerializer(serializers.ModelSerializer):
                     urls.append(photo.image.url)
         return urls
 
+    def get_photos_srcset(self, obj: Pet):
+        """与 photos 一一对应的响应式图片"""
+        request = self.context.get('request')
+        return [image_srcset(request, p.image, p.variants) for p in obj.photos.all() if p.image]
+
     def get_is_favorited(self, obj: Pet) -> bool:
         request = self.context.get('request')
         u = getattr(request, 'user', None)
         if not (u and u.is_authenticated):
             return False
+        favorited = self.context.get('favorited_pet_ids')
+        if favorited is not None:
+            return obj.id in favorited
         return PetFavorite.objects.filter(user=u, pet=obj).exists()
 
+    def get_favorites_count(self, obj: Pet) -> int:
+        total = getattr(obj, 'favorites_total', None)
+        if total is not None:
+            return total
+        return obj.favorites.count()
+
+    def _shelter(self, obj: Pet):
+        """Pet 自身的收容所，没有则回退到来源 Donation 的收容所；每行只解析一次"""
+        if not hasattr(obj, '_resolved_shelter'):
+            shelter = obj.shelter
+            if not shelter:
+                donation = getattr(obj, 'from_donor', None)
+                shelter = donation.shelter if donation else None
+            obj._resolved_shelter = shelter
+        return obj._resolved_shelter
+
     def get_age_display(self, obj: Pet) -> str:
         y = obj.age_years or 0
         m = obj.age_months or 0
@@ -366,20 +439,12 @@ class PetListSerializer(serializers.ModelSerializer):
 
     def get_shelter_name(self, obj: Pet) -> str:
         """获取关联的收容所名称"""
-        # 优先从 Pet 的 shelter 字段获取
-        if obj.shelter:
-            return obj.shelter.name
-        # 备选：从关联的 Donation 获取
-        donation = getattr(obj, 'from_donor', None)
-        if donation and donation.shelter:
-            return donation.shelter.name
-        return ""
+        shelter = self._shelter(obj)
+        return shelter.name if shelter else ""
 
     def get_shelter_address(self, obj: Pet) -> str:
         """获取关联的收容所地址"""
-        shelter = obj.shelter if obj.shelter else (
-            getattr(obj, 'from_donor', None) and getattr(obj, 'from_donor', None).shelter
-        )
+        shelter = self._shelter(obj)
         if shelter and shelter.address:
             addr = shelter.address
             parts = [
@@ -395,36 +460,28 @@ class PetListSerializer(serializers.ModelSerializer):
 
     def get_shelter_phone(self, obj: Pet) -> str:
         """获取关联的收容所电话"""
-        shelter = obj.shelter if obj.shelter else (
-            getattr(obj, 'from_donor', None) and getattr(obj, 'from_donor', None).shelter
-        )
+        shelter = self._shelter(obj)
         if shelter:
             return shelter.phone or ""
         return ""
 
     def get_shelter_website(self, obj: Pet) -> str:
         """获取关联的收容所网站"""
-        shelter = obj.shelter if obj.shelter else (
-            getattr(obj, 'from_donor', None) and getattr(obj, 'from_donor', None).shelter
-        )
+        shelter = self._shelter(obj)
         if shelter:
             return shelter.website or ""
         return ""
 
     def get_shelter_id(self, obj: Pet):
         """获取关联的收容所 ID"""
-        shelter = obj.shelter if obj.shelter else (
-            getattr(obj, 'from_donor', None) and getattr(obj, 'from_donor', None).shelter
-        )
+        shelter = self._shelter(obj)
         if shelter:
             return shelter.id
         return None
 
     def get_shelter_description(self, obj: Pet) -> str:
         """获取关联的收容所描述"""
-        shelter = obj.shelter if obj.shelter else (
-            getattr(obj, 'from_donor', None) and getattr(obj, 'from_donor', None).shelter
-        )
+        shelter = self._shelter(obj)
         if shelter:
             return shelter.description or ""
         return ""
@@ -472,60 +529,14 @@ class PetCreateUpdateSerializer(serializers.ModelSerializer):
         return super().to_internal_value(normalized_data)
 
     def _ensure_address_coords(self, address: Address):
-        """自动为地址地理编码（如果坐标缺失）"""
+        """地址缺坐标时加入地理编码队列（异步，不阻塞请求）"""
         try:
-            if not address:
-                return
-            
-            # 检查是否需要地理编码
-            lat_missing = getattr(address, 'latitude', None) is None
-            lon_missing = getattr(address, 'longitude', None) is None
-            
-            # 如果坐标都存在，跳过
-            if not (lat_missing or lon_missing):
-                return
-            
-            # 构建地址字符串
-            parts = [
-                address.street or '',
-                address.building_number or '',
-                address.city.name if getattr(address, 'city_id', None) else '',
-                address.region.name if getattr(address, 'region_id', None) else '',
-                address.country.name if getattr(address, 'country_id', None) else '',
-                address.postal_code or '',
-            ]
-            addr_str = ", ".join([p for p in parts if p])
-            
-            # 构建地理编码上下文
-            ctx = {
-                'street': (f"{address.street} {address.building_number}".strip()) if (address.street or address.building_number) else None,
-                'city': address.city.name if getattr(address, 'city_id', None) else None,
-                'region': address.region.name if getattr(address, 'region_id', None) else None,
-                'country': address.country.name if getattr(address, 'country_id', None) else None,
-                'country_code': getattr(getattr(address, 'country', None), 'code', None) if getattr(address, 'country_id', None) else None,
-                'postal_code': address.postal_code or None,
-            }
-            
-            # 执行地理编码
-            coords = geocode_address(addr_str, context=ctx) if addr_str else None
-            
-            if coords:
-                lon, lat = coords
-                address.latitude = lat
-                address.longitude = lon
-                try:
-                    address.location = {"type": "Point", "coordinates": [lon, lat]}
-                except Exception:
-                    pass
-                address.save(update_fields=["latitude", "longitude", "location"])
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.info(f"✅ Address {address.id} geocoded: ({lat}, {lon})")
+            enqueue_geocode(address)
         except Exception as e:
             # 不阻断主流程，但记录错误
             import logging
             logger = logging.getLogger(__name__)
-            logger.warning(f"Failed to geocode address {getattr(address, 'id', '?')}: {e}")
+            logger.warning(f"Failed to enqueue geocoding for address {getattr(address, 'id', '?')}: {e}")
 
     def create(self, validated_data):
         # Handle address_data if provided
@@ -802,6 +813,7 @@ class LostSerializer(serializers.ModelSerializer):
     latitude = serializers.SerializerMethodField(read_only=True)
     longitude = serializers.SerializerMethodField(read_only=True)
     photo_url = serializers.SerializerMethodField(read_only=True)
+    photo_srcset = SrcsetField('photo', 'photo_variants')
 
     # 接受 JSON 字符串或字典 - 使用 CharField 避免 JSONField 在 to_internal_value 前的处理
     address_data = serializers.CharField(write_only=True, required=False, allow_blank=True)
@@ -812,7 +824,7 @@ class LostSerializer(serializers.ModelSerializer):
             'id', 'pet_name', 'species', 'breed', 'color', 'sex', 'size',
             'address', 'address_data',  # ✅ 新增
             'country', 'region', 'city', 'street', 'postal_code', 'latitude', 'longitude',
-            'lost_time', 'description', 'reward', 'photo', 'photo_url',
+            'lost_time', 'description', 'reward', 'photo', 'photo_url', 'photo_srcset',
             'status', 'reporter', 'reporter_username',
             'contact_phone', 'contact_email',
             'created_at', 'updated_at',
@@ -949,13 +961,15 @@ class ShelterListSerializer(serializers.ModelSerializer):
     longitude = serializers.FloatField(source='address.longitude', read_only=True, allow_null=True)
     logo_url = serializers.SerializerMethodField(read_only=True)
     cover_url = serializers.SerializerMethodField(read_only=True)
+    logo_srcset = SrcsetField('logo', 'logo_variants')
+    cover_srcset = SrcsetField('cover_image', 'cover_variants')
 
     class Meta:
         model = Shelter
         fields = [
             'id', 'name', 'description', 'email', 'phone', 'website',
             'street', 'building_number', 'city', 'region', 'country', 'postal_code', 'latitude', 'longitude',
-            'logo_url', 'cover_url',
+            'logo_url', 'cover_url', 'logo_srcset', 'cover_srcset',
             'capacity', 'current_animals', 'available_capacity', 'occupancy_rate',
             'is_verified', 'is_active', 'created_at', 'updated_at'
         ]
@@ -991,8 +1005,11 @@ class ShelterDetailSerializer(serializers.ModelSerializer):
     postal_code = serializers.CharField(source='address.postal_code', read_only=True)
     latitude = serializers.FloatField(source='address.latitude', read_only=True, allow_null=True)
     longitude = serializers.FloatField(source='address.longitude', read_only=True, allow_null=True)
+    geocode_status = serializers.CharField(source='address.geocode_status', read_only=True, default='')
     logo_url = serializers.SerializerMethodField(read_only=True)
     cover_url = serializers.SerializerMethodField(read_only=True)
+    logo_srcset = SrcsetField('logo', 'logo_variants')
+    cover_srcset = SrcsetField('cover_image', 'cover_variants')
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
 
     class Meta:
@@ -1000,7 +1017,7 @@ class ShelterDetailSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'description', 'email', 'phone', 'website',
             'address', 'street', 'building_number', 'city', 'region', 'country', 'postal_code', 'latitude', 'longitude',
-            'logo_url', 'cover_url',
+            'geocode_status', 'logo_url', 'cover_url', 'logo_srcset', 'cover_srcset',
             'capacity', 'current_animals', 'available_capacity', 'occupancy_rate',
             'founded_year', 'is_verified', 'is_active',
             'facebook_url', 'instagram_url', 'twitter_url',
@@ -1,9 +1,14 @@
 # apps/pet/signals.py
 from django.db import transaction
-from django.db.models.signals import post_save, pre_save
+from django.db.models import Q
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete, post_init
 from django.dispatch import receiver
 
-from .models import Pet, Adoption, LostStatus, Lost
+from .models import Pet, PetPhoto, Adoption, LostStatus, Lost, Shelter, Address, City, Donation
+from .search import PET_SEARCH_FIELDS, refresh_pet_documents
+from .clusters import apply_contributions, contribution
+from .tiles import invalidate_point
+from . import images
 
 OPEN_STATUSES = {"submitted", "processing"}  # 未结案申请的状态集合
 
@@ -126,3 +131,231 @@ def sync_pet_with_lost(sender, instance: Lost, created, **kwargs):
     if instance.status in (LostStatus.FOUND, LostStatus.CLOSED) and pet.status == Pet.Status.LOST:
         pet.status = Pet.Status.AVAILABLE
         pet.save(update_fields=["status", "pub_date"])
+
+
+# —— 搜索文档同步 —— #
+def _refresh_search_on_commit(pet_ids):
+    pet_ids = set(pet_ids)
+    if pet_ids:
+        transaction.on_commit(lambda: refresh_pet_documents(pet_ids))
+
+
+def _pets_using_shelter(shelter_ids):
+    return set(
+        Pet.objects.filter(Q(shelter_id__in=shelter_ids) | Q(from_donor__shelter_id__in=shelter_ids))
+        .values_list("id", flat=True)
+    )
+
+
+@receiver(post_save, sender=Pet)
+def refresh_pet_search_document(sender, instance: Pet, created, update_fields=None, **kwargs):
+    if update_fields is not None and not (set(update_fields) & PET_SEARCH_FIELDS):
+        return
+    _refresh_search_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Donation)
+def refresh_search_for_donation(sender, instance: Donation, **kwargs):
+    # Pet 没有收容所时回退到来源 Donation 的收容所
+    if instance.created_pet_id:
+        _refresh_search_on_commit([instance.created_pet_id])
+
+
+@receiver(post_save, sender=Shelter)
+def refresh_search_for_shelter(sender, instance: Shelter, created, **kwargs):
+    if not created:
+        _refresh_search_on_commit(_pets_using_shelter([instance.pk]))
+
+
+@receiver(pre_delete, sender=Shelter)
+def collect_pets_before_shelter_delete(sender, instance: Shelter, **kwargs):
+    # SET_NULL 走批量 UPDATE，不触发 Pet 的 post_save，这里先记下受影响的 Pet
+    instance._search_pet_ids = _pets_using_shelter([instance.pk])
+
+
+@receiver(post_delete, sender=Shelter)
+def refresh_search_after_shelter_delete(sender, instance: Shelter, **kwargs):
+    _refresh_search_on_commit(getattr(instance, "_search_pet_ids", ()))
+
+
+@receiver(post_save, sender=Address)
+def refresh_search_for_address(sender, instance: Address, created, **kwargs):
+    if created:
+        return
+    pet_ids = set(Pet.objects.filter(address_id=instance.pk).values_list("id", flat=True))
+    pet_ids |= _pets_using_shelter(
+        Shelter.objects.filter(address_id=instance.pk).values_list("id", flat=True)
+    )
+    _refresh_search_on_commit(pet_ids)
+
+
+@receiver(post_save, sender=City)
+def refresh_search_for_city(sender, instance: City, created, **kwargs):
+    if created:
+        return
+    pet_ids = set(Pet.objects.filter(address__city_id=instance.pk).values_list("id", flat=True))
+    pet_ids |= _pets_using_shelter(
+        Shelter.objects.filter(address__city_id=instance.pk).values_list("id", flat=True)
+    )
+    _refresh_search_on_commit(pet_ids)
+
+
+# —— 走失地图聚类增量维护 —— #
+def _apply_clusters_on_commit(added=(), removed=()):
+    added, removed = [a for a in added if a], [r for r in removed if r]
+    if added or removed:
+        transaction.on_commit(lambda: apply_contributions(added=added, removed=removed))
+
+
+@receiver(pre_save, sender=Lost)
+def remember_lost_cluster_contribution(sender, instance: Lost, **kwargs):
+    old = None
+    if instance.pk:
+        prev = Lost.objects.select_related("address").filter(pk=instance.pk).first()
+        old = contribution(prev) if prev else None
+    instance._cluster_old = old
+
+
+@receiver(post_save, sender=Lost)
+def update_lost_clusters(sender, instance: Lost, **kwargs):
+    old = getattr(instance, "_cluster_old", None)
+    new = contribution(instance)
+    if old != new:
+        _apply_clusters_on_commit(added=[new], removed=[old])
+
+
+@receiver(post_delete, sender=Lost)
+def remove_lost_from_clusters(sender, instance: Lost, **kwargs):
+    _apply_clusters_on_commit(removed=[contribution(instance)])
+
+
+def _address_point(addr):
+    if not addr or not addr[0] or addr[1] is None or addr[2] is None:
+        return None
+    return addr[0], float(addr[1]), float(addr[2])
+
+
+@receiver(pre_save, sender=Address)
+def remember_address_point(sender, instance: Address, **kwargs):
+    old = None
+    if instance.pk:
+        old = Address.objects.filter(pk=instance.pk).values_list("geohash", "latitude", "longitude").first()
+    instance._old_point = _address_point(old)
+
+
+@receiver(post_save, sender=Address)
+def move_lost_clusters_with_address(sender, instance: Address, created, **kwargs):
+    old = getattr(instance, "_old_point", None)
+    new = _address_point((instance.geohash, instance.latitude, instance.longitude))
+    if created or old == new:
+        return
+    statuses = list(Lost.objects.filter(address_id=instance.pk).values_list("status", flat=True))
+    _apply_clusters_on_commit(
+        added=[(st, *new) for st in statuses] if new else [],
+        removed=[(st, *old) for st in statuses] if old else [],
+    )
+
+
+@receiver(pre_delete, sender=Address)
+def collect_lost_before_address_delete(sender, instance: Address, **kwargs):
+    # Lost.address 是 SET_NULL（批量 UPDATE，不触发 Lost 的信号），先记下它们的贡献
+    point = _address_point((instance.geohash, instance.latitude, instance.longitude))
+    statuses = list(Lost.objects.filter(address_id=instance.pk).values_list("status", flat=True)) if point else []
+    instance._cluster_removed = [(st, *point) for st in statuses]
+
+
+@receiver(post_delete, sender=Address)
+def remove_address_from_clusters(sender, instance: Address, **kwargs):
+    _apply_clusters_on_commit(removed=getattr(instance, "_cluster_removed", ()))
+
+
+# —— 矢量瓦片缓存失效：按变更前后的坐标精确删除 —— #
+def _invalidate_tiles_on_commit(points, layers=None):
+    points = [p for p in points if p]
+    if points:
+        transaction.on_commit(lambda: [invalidate_point(lat, lon, layers) for lat, lon in points])
+
+
+def _address_coords(address_ids):
+    ids = [i for i in address_ids if i]
+    if not ids:
+        return []
+    return list(
+        Address.objects.filter(pk__in=ids, latitude__isnull=False, longitude__isnull=False)
+        .values_list("latitude", "longitude")
+    )
+
+
+@receiver(post_save, sender=Address)
+def invalidate_tiles_for_address(sender, instance: Address, created, **kwargs):
+    old = getattr(instance, "_old_point", None)
+    new = _address_point((instance.geohash, instance.latitude, instance.longitude))
+    if created or old == new:
+        return
+    _invalidate_tiles_on_commit([old[1:] if old else None, new[1:] if new else None])
+
+
+@receiver(post_save, sender=Lost)
+def invalidate_tiles_for_lost(sender, instance: Lost, created, **kwargs):
+    old = getattr(instance, "_cluster_old", None)
+    new = contribution(instance)
+    points = [old[2:] if old else None, new[2:] if new else None]
+    _invalidate_tiles_on_commit(points, layers=["lost"])
+
+
+@receiver(post_delete, sender=Lost)
+def invalidate_tiles_for_deleted_lost(sender, instance: Lost, **kwargs):
+    c = contribution(instance)
+    _invalidate_tiles_on_commit([c[2:] if c else None], layers=["lost"])
+
+
+# Pet/Shelter 在加载时记下会影响瓦片的字段，保存时不必再查一次旧值
+_TILE_STATE_FIELDS = {
+    Pet: ("address_id", "status", "name", "species"),
+    Shelter: ("address_id", "is_active", "name"),
+}
+
+
+def _tile_state(instance):
+    return tuple(instance.__dict__.get(f) for f in _TILE_STATE_FIELDS[type(instance)])
+
+
+def _tile_layer(instance):
+    return "pet" if isinstance(instance, Pet) else "shelter"
+
+
+@receiver(post_init, sender=Pet)
+@receiver(post_init, sender=Shelter)
+def remember_tile_state(sender, instance, **kwargs):
+    instance._tile_state = _tile_state(instance)
+
+
+@receiver(post_save, sender=Pet)
+@receiver(post_save, sender=Shelter)
+def invalidate_tiles_for_pet_or_shelter(sender, instance, created, **kwargs):
+    old = getattr(instance, "_tile_state", None)
+    new = _tile_state(instance)
+    if not created and old == new:
+        return
+    instance._tile_state = new
+    old_address = old[0] if old else None
+    points = _address_coords({old_address, instance.address_id})
+    _invalidate_tiles_on_commit(points, layers=[_tile_layer(instance)])
+
+
+@receiver(post_delete, sender=Pet)
+@receiver(post_delete, sender=Shelter)
+def invalidate_tiles_for_deleted_pet_or_shelter(sender, instance, **kwargs):
+    _invalidate_tiles_on_commit(_address_coords([instance.address_id]), layers=[_tile_layer(instance)])
+
+
+# ============== 响应式图片派生 ==============
+@receiver(post_save, sender=Pet)
+@receiver(post_save, sender=PetPhoto)
+@receiver(post_save, sender=Lost)
+@receiver(post_save, sender=Shelter)
+def generate_image_derivatives(sender, instance, raw=False, **kwargs):
+    # 原图变更（或尚未生成）时，提交后交给后台线程池生成 thumb/card/full
+    if raw:
+        return
+    images.schedule(instance)
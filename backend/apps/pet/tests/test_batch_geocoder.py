@@ -0,0 +1,130 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.pet.geocoding import MAX_ATTEMPTS, BatchGeocoder, StubProvider, process_jobs
+from apps.pet.models import Address, GeocodeCache, GeocodeCheckpoint, GeocodeJob
+from apps.pet.serializers import _create_or_resolve_address
+from common.utils import GeocodeError
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'geocode-test'}}
+
+
+class CountingStub(StubProvider):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def lookup(self, text, ctx):
+        self.calls += 1
+        return super().lookup(text, ctx)
+
+
+@override_settings(CACHES=LOCMEM)
+class BatchGeocoderTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_dedupes_and_persists(self):
+        stub = CountingStub()
+        geocoder = BatchGeocoder([stub], workers=2)
+        items = {
+            1: ('Marszałkowska 1, Warszawa', {}),
+            2: ('  marszałkowska 1 ,  WARSZAWA ', {}),
+            3: ('Floriańska 5, Kraków', {}),
+            4: ('', {}),
+        }
+        result = geocoder.geocode_many(items)
+        self.assertEqual(stub.calls, 2)
+        self.assertEqual(result[1], result[2])
+        self.assertIsNone(result[4])
+        self.assertEqual(GeocodeCache.objects.count(), 2)
+
+        # 第二次全部命中持久化缓存
+        again = BatchGeocoder([stub]).geocode_many(items)
+        self.assertEqual(stub.calls, 2)
+        self.assertEqual(again, result)
+
+    def test_command_checkpoints_and_resumes(self):
+        ids = [Address.objects.create(street=f'Ulica {i}', building_number=str(i)).id for i in range(5)]
+        call_command('geocode_addresses', provider='stub', limit=2, batch_size=1, stdout=StringIO())
+        checkpoint = GeocodeCheckpoint.objects.get(name='geocode_addresses')
+        self.assertEqual(checkpoint.last_id, ids[1])
+        self.assertEqual(Address.objects.filter(latitude__isnull=False).count(), 2)
+
+        call_command('geocode_addresses', provider='stub', limit=0, resume=True, stdout=StringIO())
+        self.assertFalse(Address.objects.filter(latitude__isnull=True).exists())
+        addr = Address.objects.get(id=ids[-1])
+        self.assertEqual(addr.location['coordinates'], [float(addr.longitude), float(addr.latitude)])
+        self.assertTrue(addr.geohash)
+
+
+class FailingProvider(StubProvider):
+    def lookup(self, text, ctx):
+        raise GeocodeError('boom')
+
+
+@override_settings(CACHES=LOCMEM)
+class GeocodeQueueTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_address_enqueued_then_filled_by_worker(self):
+        addr = _create_or_resolve_address({'street': 'Długa', 'building_number': '7'})
+        addr.refresh_from_db()
+        self.assertIsNone(addr.latitude)
+        self.assertEqual(addr.geocode_status, Address.GeocodeStatus.PENDING)
+        self.assertTrue(GeocodeJob.objects.filter(address=addr).exists())
+
+        counts = process_jobs(BatchGeocoder([StubProvider()]))
+        self.assertEqual(counts['done'], 1)
+        addr.refresh_from_db()
+        self.assertIsNotNone(addr.latitude)
+        self.assertEqual(addr.geocode_status, Address.GeocodeStatus.DONE)
+        self.assertFalse(GeocodeJob.objects.exists())
+
+    def test_address_with_coords_not_enqueued(self):
+        _create_or_resolve_address({'street': 'Długa', 'latitude': 52.1, 'longitude': 21.0})
+        self.assertFalse(GeocodeJob.objects.exists())
+
+    def test_failures_back_off_then_give_up(self):
+        addr = _create_or_resolve_address({'street': 'Nieznana 1'})
+        geocoder = BatchGeocoder([FailingProvider()])
+        self.assertEqual(process_jobs(geocoder)['retry'], 1)
+        job = GeocodeJob.objects.get(address=addr)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now())
+        # 未到期不会被再次领取
+        self.assertEqual(process_jobs(geocoder)['claimed'], 0)
+
+        GeocodeJob.objects.filter(pk=job.pk).update(attempts=MAX_ATTEMPTS - 1, run_after=timezone.now())
+        self.assertEqual(process_jobs(geocoder)['failed'], 1)
+        addr.refresh_from_db()
+        self.assertEqual(addr.geocode_status, Address.GeocodeStatus.FAILED)
+        self.assertFalse(GeocodeJob.objects.exists())
+
+    def test_edit_during_lookup_is_not_overwritten(self):
+        addr = _create_or_resolve_address({'street': 'Stara', 'building_number': '1'})
+
+        class EditingProvider(StubProvider):
+            def lookup(self, text, ctx):
+                # 模拟服务商请求期间用户改了地址
+                Address.objects.filter(pk=addr.pk).update(street='Nowa')
+                return super().lookup(text, ctx)
+
+        counts = process_jobs(BatchGeocoder([EditingProvider()], persist=False))
+        self.assertEqual((counts['done'], counts['requeued']), (0, 1))
+        addr.refresh_from_db()
+        self.assertEqual(addr.street, 'Nowa')
+        self.assertIsNone(addr.latitude)
+        job = GeocodeJob.objects.get(address=addr)
+        self.assertLessEqual(job.run_after, timezone.now())
+
+        self.assertEqual(process_jobs(BatchGeocoder([StubProvider()]))['done'], 1)
+        addr.refresh_from_db()
+        self.assertEqual(addr.street, 'Nowa')
+        self.assertIsNotNone(addr.latitude)
+        self.assertTrue(addr.geohash)
@@ -0,0 +1,87 @@
+import errno
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from common.storage import ContentAddressedStorage, copy_file, file_digest
+
+
+class ContentAddressedStorageTest(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.root)
+
+    def test_same_bytes_share_one_blob(self):
+        a = self.storage.save('pets/a.jpg', ContentFile(b'same bytes'))
+        b = self.storage.save('avatars/b.png', ContentFile(b'same bytes'))
+        c = copy_file(a, 'pets/photos/c.jpg', storage=self.storage)
+        blob = self.storage.blob_path(file_digest(self.storage.path(a)))
+
+        self.assertTrue(os.path.samefile(self.storage.path(a), self.storage.path(b)))
+        self.assertTrue(os.path.samefile(blob, self.storage.path(c)))
+        self.assertEqual(self.storage.references(a), 3)
+        self.assertEqual(self.storage.listdir('')[0], ['avatars', 'pets'])
+
+        self.storage.delete(a)
+        self.storage.delete(b)
+        self.assertTrue(os.path.exists(blob))
+        self.assertEqual(self.storage.references(c), 1)
+        with self.storage.open(c) as fh:
+            self.assertEqual(fh.read(), b'same bytes')
+        self.storage.delete(c)
+        self.assertFalse(os.path.exists(blob))
+
+    def test_name_collision_gets_new_name(self):
+        first = self.storage.save('pets/x.jpg', ContentFile(b'one'))
+        second = self.storage.save('pets/x.jpg', ContentFile(b'two'))
+        self.assertNotEqual(first, second)
+        with self.storage.open(first) as fh:
+            self.assertEqual(fh.read(), b'one')
+
+    def test_copy_file_never_overwrites_a_concurrent_writer(self):
+        src = self.storage.save('pets/src.jpg', ContentFile(b'source'))
+        taken = self.storage.save('pets/other.jpg', ContentFile(b'taken'))
+        # 模拟 get_available_name() 之后、link 之前目标被别人占用
+        with mock.patch.object(self.storage, 'get_available_name', side_effect=[taken, 'pets/other_2.jpg']):
+            copied = copy_file(src, 'pets/other.jpg', storage=self.storage)
+        self.assertEqual(copied, 'pets/other_2.jpg')
+        with self.storage.open(taken) as fh:
+            self.assertEqual(fh.read(), b'taken')
+
+        # 不能硬链接（如跨设备）时退回复制，同样不覆盖
+        exdev = OSError(errno.EXDEV, 'cross-device link')
+        with mock.patch('common.storage.os.link', side_effect=exdev):
+            copied = copy_file(src, 'pets/copy.jpg', storage=self.storage)
+        with self.storage.open(copied) as fh:
+            self.assertEqual(fh.read(), b'source')
+        with mock.patch('common.storage.os.link', side_effect=OSError(errno.EIO, 'io')):
+            with self.assertRaises(OSError):
+                copy_file(src, 'pets/broken.jpg', storage=self.storage)
+
+    def test_dedupe_media_command(self):
+        for name, data in [('pets/1.jpg', b'x' * 1000), ('pets/2.jpg', b'x' * 1000),
+                           ('avatars/u.png', b'x' * 1000), ('lost/z.jpg', b'unique')]:
+            os.makedirs(os.path.dirname(os.path.join(self.root, name)), exist_ok=True)
+            with open(os.path.join(self.root, name), 'wb') as fh:
+                fh.write(data)
+
+        with override_settings(MEDIA_ROOT=self.root):
+            out = StringIO()
+            call_command('dedupe_media', '--dry-run', stdout=out)
+            self.assertIn('Would save 2.0 KB (2000 bytes)', out.getvalue())
+            self.assertFalse(os.path.exists(os.path.join(self.root, '.blobs')))
+
+            out = StringIO()
+            call_command('dedupe_media', stdout=out)
+            self.assertIn('2 new blobs, 2 duplicates', out.getvalue())
+            self.assertIn('Saved 2.0 KB (2000 bytes)', out.getvalue())
+
+        self.assertTrue(os.path.samefile(os.path.join(self.root, 'pets/1.jpg'), os.path.join(self.root, 'avatars/u.png')))
+        self.assertEqual(self.storage.references('pets/2.jpg'), 3)
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+
+from apps.pet.models import Donation, DonationPhoto, Pet, PetPhoto
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def _jpeg(shade):
+    buf = BytesIO()
+    Image.new('RGB', (40, 30), (shade, shade, shade)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def _donation(user, name, photos=2):
+    donation = Donation.objects.create(donor=user, name=name, species='dog', sex='male')
+    for i in range(photos):
+        DonationPhoto.objects.create(donation=donation, image=ContentFile(_jpeg(i * 50), name=f'p{i}.jpg'))
+    return donation
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DonationApproveTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.donor = User.objects.create_user(username='donor', password='pass')
+        self.admin = User.objects.create_user(username='reviewer', password='pass', is_staff=True)
+
+    def test_approve_links_photos_instead_of_copying(self):
+        donation = _donation(self.donor, 'Rex')
+        pet = donation.approve(reviewer=self.admin, note='ok')
+
+        donation.refresh_from_db()
+        self.assertEqual(donation.status, 'approved')
+        self.assertEqual(donation.created_pet, pet)
+        photos = list(PetPhoto.objects.filter(pet=pet))
+        self.assertEqual([p.order for p in photos], [0, 1])
+
+        sources = list(donation.photos.order_by('id'))
+        first = os.stat(default_storage.path(sources[0].image.name))
+        # 本地存储下为硬链接：同一 inode，未占用额外空间
+        self.assertEqual(os.stat(default_storage.path(pet.cover.name)).st_ino, first.st_ino)
+        self.assertEqual(os.stat(default_storage.path(photos[0].image.name)).st_ino, first.st_ino)
+        self.assertNotEqual(pet.cover.name, photos[0].image.name)
+        with default_storage.open(photos[1].image.name) as fh:
+            self.assertEqual(fh.read(), _jpeg(50))
+
+        # 重复审批返回同一只宠物
+        self.assertEqual(Donation.objects.get(pk=donation.pk).approve(reviewer=self.admin), pet)
+        self.assertEqual(Pet.objects.filter(name='Rex').count(), 1)
+
+    def test_rejected_donation_cleans_up_nothing_created(self):
+        donation = _donation(self.donor, 'Nope', photos=1)
+        donation.status = 'rejected'
+        donation.save()
+        with self.assertRaises(ValueError):
+            donation.approve(reviewer=self.admin)
+        self.assertFalse(Pet.objects.filter(name='Nope').exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_DERIVATIVES_ASYNC=False)
+class DonationApproveManyTest(TransactionTestCase):
+    def test_approve_many_concurrently(self):
+        User = get_user_model()
+        donor = User.objects.create_user(username='donor2', password='pass')
+        admin = User.objects.create_user(username='reviewer2', password='pass', is_staff=True)
+        donations = [_donation(donor, f'Pet {i}', photos=1) for i in range(4)]
+        closed = Donation.objects.create(donor=donor, name='Closed', species='cat', sex='female', status='closed')
+
+        ok, errors = Donation.approve_many(Donation.objects.all(), reviewer=admin, workers=3)
+
+        self.assertEqual(ok, 4)
+        self.assertEqual(list(errors), [closed.pk])
+        self.assertEqual(Pet.objects.count(), 4)
+        self.assertEqual(PetPhoto.objects.count(), 4)
+        self.assertTrue(all(d.created_pet_id for d in Donation.objects.filter(pk__in=[d.pk for d in donations])))
@@ -0,0 +1,55 @@
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase, APIClient
+
+from apps.pet.models import Pet, Shelter, Address
+from common.geo import geohash_encode, geohash_decode, haversine_km
+
+
+class GeoHelpersTest(SimpleTestCase):
+    def test_geohash_roundtrip(self):
+        self.assertEqual(geohash_encode(57.64911, 10.40744), 'u4pruydqq')
+        lat, lon = geohash_decode('u4pruydqq')
+        self.assertLess(haversine_km(lat, lon, 57.64911, 10.40744), 0.01)
+
+
+class GeoFilterTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='geo', password='pass')
+        self.client = APIClient()
+        # 华沙中心、华沙郊区（~12km）、克拉科夫（~250km）
+        spots = {'center': (52.2297, 21.0122), 'suburb': (52.1672, 20.8560), 'krakow': (50.0647, 19.9450)}
+        for name, (lat, lon) in spots.items():
+            addr = Address.objects.create(latitude=lat, longitude=lon)
+            Pet.objects.create(name=name, species='cat', created_by=self.user, address=addr)
+            Shelter.objects.create(name=f'shelter-{name}', address=addr)
+
+    def _names(self, url, **params):
+        resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return [r['name'] for r in resp.data['results']]
+
+    def test_address_geohash_maintained(self):
+        addr = Pet.objects.get(name='center').address
+        self.assertTrue(addr.geohash.startswith('u3qcn'))
+        addr.latitude, addr.longitude = 50.0647, 19.9450
+        addr.save(update_fields=['latitude', 'longitude'])
+        addr.refresh_from_db()
+        self.assertTrue(addr.geohash.startswith('u2yhv'))
+
+    def test_near_orders_by_distance(self):
+        url = reverse('pet:pet-list')
+        self.assertEqual(self._names(url, near='52.2297,21.0122', radius_km=5), ['center'])
+        self.assertEqual(self._names(url, near='52.17,20.86', radius_km=50), ['suburb', 'center'])
+        self.assertEqual(self.client.get(url, {'near': 'nowhere'}).status_code, 400)
+
+    def test_bbox_and_shelters(self):
+        self.assertEqual(
+            sorted(self._names(reverse('pet:pet-list'), bbox='19,49,20.5,51')), ['krakow']
+        )
+        self.assertEqual(
+            self._names(reverse('pet:shelter-list'), near='50.06,19.94', radius_km=300),
+            ['shelter-krakow', 'shelter-suburb', 'shelter-center'],
+        )
@@ -0,0 +1,92 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from apps.pet import images
+from apps.pet.models import Pet, PetPhoto
+from apps.pet.serializers import PetListSerializer
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def _jpeg(width, height):
+    buf = BytesIO()
+    Image.new('RGB', (width, height), (200, 120, 40)).save(buf, 'JPEG')
+    return ContentFile(buf.getvalue(), name='photo.jpg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_DERIVATIVES_ASYNC=False)
+class ImageDerivativesTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='imgs', password='pass')
+
+    def test_generated_on_save_and_replaced_with_cover(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pet = Pet.objects.create(name='Big', species='dog', created_by=self.user, cover=_jpeg(2000, 1000))
+        pet.refresh_from_db()
+        variants = pet.cover_variants
+        self.assertEqual(variants['source'], pet.cover.name)
+        self.assertEqual(sorted((v['w'], v['h']) for v in variants['sizes'].values()), [(160, 80), (480, 240), (1280, 640)])
+        old_files = images.variant_files(variants)
+        self.assertTrue(all(default_storage.exists(n) for n in old_files))
+        self.assertTrue(variants['sizes']['card']['webp'].endswith('__card.webp'))
+
+        # 换封面：重新生成，旧派生文件删除
+        with self.captureOnCommitCallbacks(execute=True):
+            pet.cover = _jpeg(300, 300)
+            pet.save()
+        pet.refresh_from_db()
+        self.assertEqual(set(pet.cover_variants['sizes']), {'thumb', 'card'})  # 不放大
+        self.assertEqual(pet.cover_variants['sizes']['card']['w'], 300)
+        self.assertFalse(any(default_storage.exists(n) for n in old_files))
+
+        data = PetListSerializer(pet).data
+        self.assertIn('__card.jpg?v=', data['cover_srcset']['src'])
+        self.assertIn('160w', data['cover_srcset']['webp'])
+        self.assertIn('300w', data['cover_srcset']['jpeg'])
+
+    def test_stale_manifest_is_discarded(self):
+        pet = Pet.objects.create(name='Race', species='cat', created_by=self.user, cover=_jpeg(600, 400))
+        manifest = images.generate_derivatives(pet.cover.name)
+        Pet.objects.filter(pk=pet.pk).update(cover='pets/other.jpg')
+        self.assertFalse(images.apply_manifest(Pet, pet.pk, 'cover', 'cover_variants', manifest))
+        self.assertFalse(any(default_storage.exists(n) for n in images.variant_files(manifest)))
+
+    def test_shared_source_keeps_files_other_rows_reference(self):
+        pet = Pet.objects.create(name='Shared', species='dog', created_by=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = PetPhoto.objects.create(pet=pet, image=_jpeg(600, 400))
+        with self.captureOnCommitCallbacks(execute=True):
+            # 像 Lost.photo -> Pet.cover 一样指向同一个原图
+            second = PetPhoto.objects.create(pet=pet, image=first.image.name)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertFalse(set(images.variant_files(first.variants)) & set(images.variant_files(second.variants)))
+
+        # 历史数据：两条记录共用同一批派生文件，替换其中一条不能删掉另一条还在用的
+        PetPhoto.objects.filter(pk=second.pk).update(variants=first.variants)
+        shared = images.variant_files(first.variants)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.image = _jpeg(300, 300)
+            first.save()
+        self.assertTrue(all(default_storage.exists(n) for n in shared))
+
+    def test_backfill_command(self):
+        pet = Pet.objects.create(name='Old', species='dog', created_by=self.user)
+        photo = PetPhoto.objects.create(pet=pet, image=_jpeg(800, 600))  # 未执行提交回调，相当于历史数据
+        call_command('generate_image_derivatives', '--workers', '1', '--model', 'PetPhoto', stdout=StringIO())
+        photo.refresh_from_db()
+        self.assertEqual(photo.variants['source'], photo.image.name)
+        self.assertEqual(photo.variants['sizes']['full']['w'], 800)
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from apps.pet.models import Pet
+
+
+class PetKeysetPaginationTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='pager', password='pass')
+        self.client = APIClient()
+        pets = [Pet.objects.create(name=f'pet{i}', species='dog', created_by=self.user) for i in range(7)]
+        # 制造时间戳相同的行，验证 (pub_date, id) 作为决胜键时不丢不重
+        same = timezone.now()
+        Pet.objects.filter(pk__in=[p.pk for p in pets]).update(pub_date=same)
+
+    def test_cursor_walks_all_rows_once(self):
+        url = reverse('pet:pet-list')
+        resp = self.client.get(url, {'pagination': 'cursor', 'page_size': 3})
+        self.assertEqual(resp.status_code, 200, resp.data)
+        self.assertNotIn('count', resp.data)
+        seen = [r['id'] for r in resp.data['results']]
+        while resp.data['next']:
+            resp = self.client.get(resp.data['next'])
+            self.assertEqual(resp.status_code, 200, resp.data)
+            seen += [r['id'] for r in resp.data['results']]
+        expected = list(Pet.objects.order_by('-pub_date', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_default_is_page_number_and_bad_cursor_404(self):
+        url = reverse('pet:pet-list')
+        self.assertEqual(self.client.get(url).data['count'], 7)
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 404)
@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from apps.pet.models import Lost, LostStatus, LostMapCluster, Address
+from apps.pet.clusters import rebuild_clusters
+
+
+class LostMapClusterTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='mapper', password='pass')
+        self.client = APIClient()
+        self.url = reverse('pet:lost-geo-clusters')
+
+    def _lost(self, lat, lon, **kw):
+        with self.captureOnCommitCallbacks(execute=True):
+            addr = Address.objects.create(latitude=lat, longitude=lon)
+            return Lost.objects.create(
+                species='cat', address=addr, lost_time=timezone.now(), reporter=self.user, **kw
+            )
+
+    def _snapshot(self):
+        return sorted(LostMapCluster.objects.values_list('status', 'precision', 'cell', 'count'))
+
+    def test_incremental_matches_rebuild(self):
+        a = self._lost(52.2297, 21.0122)
+        b = self._lost(52.2300, 21.0100)
+        c = self._lost(50.0647, 19.9450)
+        with self.captureOnCommitCallbacks(execute=True):
+            b.status = LostStatus.FOUND
+            b.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            c.address.latitude = 52.4064
+            c.address.longitude = 16.9252
+            c.address.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            a.delete()
+        incremental = self._snapshot()
+        rebuild_clusters()
+        self.assertEqual(incremental, self._snapshot())
+
+    def test_endpoint_clusters_and_points(self):
+        self._lost(52.2297, 21.0122)
+        self._lost(52.2300, 21.0100)
+        self._lost(50.0647, 19.9450)
+
+        resp = self.client.get(self.url, {'zoom': 5, 'bbox': '14,49,24,55'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['type'], 'clusters')
+        self.assertEqual(sorted(c['count'] for c in resp.data['results']), [1, 2])
+
+        resp = self.client.get(self.url, {'zoom': 15, 'bbox': '21.0,52.2,21.02,52.24'})
+        self.assertEqual(resp.data['type'], 'points')
+        self.assertEqual(len(resp.data['results']), 2)
+
+        self.assertEqual(self.client.get(self.url, {'zoom': 'x'}).status_code, 400)
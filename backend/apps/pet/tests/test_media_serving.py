@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from common.media import IMMUTABLE, REVALIDATE, parse_range, serve_media
+
+
+class MediaServingTest(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=root, MEDIA_URL='/media/')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.name = default_storage.save('avatars/u.png', ContentFile(b'0123456789'))
+        self.factory = RequestFactory()
+
+    def _get(self, url, **headers):
+        request = self.factory.get(url, headers=headers)
+        path = request.path[len('/media/'):]
+        return serve_media(request, path)
+
+    def test_versioned_url_is_immutable_and_changes_on_replace(self):
+        url = default_storage.url(self.name)
+        response = self._get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertEqual(self._get(url.split('?')[0])['Cache-Control'], REVALIDATE)
+
+        # 同名重传（如重置头像）：URL 版本号变化
+        default_storage.delete(self.name)
+        self.assertEqual(default_storage.save(self.name, ContentFile(b'new avatar')), self.name)
+        self.assertNotEqual(default_storage.url(self.name), url)
+        self.assertEqual(self._get(url)['Cache-Control'], REVALIDATE)
+
+    def test_conditional_get(self):
+        etag = self._get(default_storage.url(self.name))['ETag']
+        response = self._get(default_storage.url(self.name), if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_range_requests(self):
+        url = default_storage.url(self.name)
+        response = self._get(url, range='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        self.assertEqual(b''.join(self._get(url, range='bytes=-3').streaming_content), b'789')
+        self.assertEqual(self._get(url, range='bytes=20-').status_code, 416)
+        # If-Range 不匹配：整文件
+        self.assertEqual(self._get(url, range='bytes=2-5', if_range='"stale"').status_code, 200)
+        self.assertEqual(parse_range('bytes=0-1,4-5', 10), None)
+
+    def test_accel_redirect_and_blob_dir_hidden(self):
+        with self.settings(MEDIA_ACCEL_REDIRECT='/protected-media/'):
+            response = self._get(default_storage.url(self.name))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/avatars/u.png')
+        self.assertEqual(response.content, b'')
+        with self.assertRaises(Http404):
+            self._get('/media/.blobs/tmp')
+
+    def test_blob_dir_hidden_after_normalisation(self):
+        blob = default_storage.path('.blobs/ab/cd/blob')
+        os.makedirs(os.path.dirname(blob))
+        with open(blob, 'wb') as fh:
+            fh.write(b'secret')
+        request = self.factory.get('/media/')
+        with self.assertRaises(Http404):
+            serve_media(request, 'avatars/../.blobs/ab/cd/blob')
@@ -0,0 +1,73 @@
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase, APIClient
+
+from apps.pet.models import Pet, PetPhoto, PetFavorite, Donation, Shelter, Address, City, Region, Country
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class PetListQueryCountTest(APITestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='lister', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        country = Country.objects.create(name='Poland', code='PL')
+        region = Region.objects.create(country=country, code='14', name='Mazowieckie')
+        city = City.objects.create(region=region, name='Warszawa')
+        addr = Address.objects.create(country=country, region=region, city=city, street='Main')
+        self.shelter = Shelter.objects.create(name='Happy Paws', address=addr)
+
+    def _make_pets(self, n):
+        for i in range(n):
+            pet = Pet.objects.create(
+                name=f'pet{i}', species='dog', created_by=self.user, status=Pet.Status.AVAILABLE,
+            )
+            PetPhoto.objects.create(pet=pet, image=SimpleUploadedFile(f'p{i}.jpg', b'x'))
+            # 一半走 Donation 回退的收容所，一半直接挂收容所
+            if i % 2:
+                Donation.objects.create(
+                    donor=self.user, name=pet.name, species='dog',
+                    shelter=self.shelter, created_pet=pet,
+                )
+            else:
+                pet.shelter = self.shelter
+                pet.save(update_fields=['shelter'])
+            if i % 3 == 0:
+                PetFavorite.objects.create(user=self.user, pet=pet)
+
+    def _count_list_queries(self, page_size):
+        url = reverse('pet:pet-list')
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url, {'page_size': page_size})
+        self.assertEqual(resp.status_code, 200, resp.data)
+        self.assertEqual(len(resp.data['results']), page_size)
+        return len(ctx.captured_queries), resp.data['results']
+
+    def test_query_count_independent_of_page_size(self):
+        self._make_pets(12)
+        small, _ = self._count_list_queries(2)
+        large, results = self._count_list_queries(12)
+        self.assertEqual(small, large)
+
+        by_name = {r['name']: r for r in results}
+        self.assertTrue(by_name['pet0']['is_favorited'])
+        self.assertFalse(by_name['pet1']['is_favorited'])
+        self.assertEqual(by_name['pet0']['favorites_count'], 1)
+        self.assertEqual(by_name['pet1']['shelter_name'], 'Happy Paws')
+        self.assertEqual(by_name['pet2']['shelter_name'], 'Happy Paws')
+        self.assertEqual(len(by_name['pet3']['photos']), 1)
@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APITestCase, APIClient
+
+from apps.pet.models import Pet, PetSearchDocument, Shelter, Address, City, Region, Country
+
+
+class PetSearchDocumentTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='searcher', password='pass')
+        self.client = APIClient()
+        country = Country.objects.create(name='Poland', code='PL')
+        region = Region.objects.create(country=country, code='14', name='Mazowieckie')
+        self.city = City.objects.create(region=region, name='Warszawa')
+        addr = Address.objects.create(country=country, region=region, city=self.city)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shelter = Shelter.objects.create(name='Happy Paws', address=addr)
+            self.rex = Pet.objects.create(
+                name='Rex', species='dog', breed='Golden Retriever', created_by=self.user, shelter=self.shelter,
+            )
+            self.tom = Pet.objects.create(
+                name='Tom', species='cat', breed='', description='loves dogs', created_by=self.user,
+            )
+
+    def _names(self, **params):
+        resp = self.client.get(reverse('pet:pet-list'), params)
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return [r['name'] for r in resp.data['results']]
+
+    def test_search_uses_document_and_ranks_by_relevance(self):
+        # 名字/品种命中（权重高）排在只有描述命中的前面
+        self.assertEqual(self._names(search='dog'), ['Rex', 'Tom'])
+        self.assertEqual(self._names(search='gold retr'), ['Rex'])
+        self.assertEqual(self._names(search='happy'), ['Rex'])
+        self.assertEqual(self._names(search='!!'), ['Tom', 'Rex'])
+
+    def test_city_filter_and_shelter_sync(self):
+        self.assertEqual(self._names(city='warsz'), ['Rex'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.city.name = 'Krakow'
+            self.city.save()
+        self.assertEqual(self._names(city='krak'), ['Rex'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shelter.delete()
+        self.assertEqual(PetSearchDocument.objects.get(pet=self.rex).shelter_name, '')
+        self.assertEqual(self._names(city='krak'), [])
+
+    def test_city_filter_without_search_document(self):
+        # 文档行缺失（signal 未执行、回填迁移之前的数据）时按地址城市兜底
+        addr = Address.objects.create(city=self.city)
+        Pet.objects.create(name='Max', species='dog', created_by=self.user, address=addr)
+        self.assertFalse(PetSearchDocument.objects.filter(pet__name='Max').exists())
+        PetSearchDocument.objects.filter(pet=self.rex).delete()
+        self.assertEqual(sorted(self._names(city='warsz')), ['Max', 'Rex'])
+        self.assertEqual(self._names(city='krak'), [])
@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.urls import reverse
+from rest_framework.test import APITestCase, APIClient
+
+from apps.pet.models import Pet, trait_mask
+
+
+class PetTraitsBitmaskTest(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='traits', password='pass')
+        self.client = APIClient()
+        self.a = Pet.objects.create(name='A', species='dog', created_by=self.user, vaccinated=True, sterilized=True)
+        self.b = Pet.objects.create(name='B', species='dog', created_by=self.user, vaccinated=True)
+        self.c = Pet.objects.create(name='C', species='cat', created_by=self.user)
+
+    def _traits(self, pet):
+        return Pet.objects.values_list('traits', flat=True).get(pk=pet.pk)
+
+    def test_traits_maintained_on_save_and_bulk_writes(self):
+        self.assertEqual(self._traits(self.a), trait_mask(['vaccinated', 'sterilized']))
+
+        self.c.trained = True
+        self.c.save(update_fields=['trained'])
+        self.assertEqual(self._traits(self.c), trait_mask(['trained']))
+
+        Pet.objects.filter(pk__in=[self.a.pk, self.b.pk]).update(vaccinated=False, dewormed=True)
+        self.assertEqual(self._traits(self.a), trait_mask(['dewormed', 'sterilized']))
+        self.assertEqual(self._traits(self.b), trait_mask(['dewormed']))
+
+        Pet.objects.filter(pk=self.b.pk).update(affectionate=F('dewormed'))
+        self.assertEqual(self._traits(self.b), trait_mask(['dewormed', 'affectionate']))
+
+        self.b.dewormed = False
+        Pet.objects.bulk_update([self.b], ['dewormed'])
+        self.assertEqual(self._traits(self.b), trait_mask(['affectionate']))
+
+    def test_trait_filters_use_mask(self):
+        url = reverse('pet:pet-list')
+        names = lambda **p: sorted(r['name'] for r in self.client.get(url, p).data['results'])
+        self.assertEqual(names(traits='vaccinated,sterilized'), ['A'])
+        self.assertEqual(names(vaccinated='true'), ['A', 'B'])
+        self.assertEqual(names(vaccinated='true', sterilized='false'), ['B'])
+        self.assertEqual(self.client.get(url, {'traits': 'flying'}).status_code, 400)
@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase, APIClient
+
+from apps.pet.models import Pet, Address
+from common.mvt import lonlat_to_tile
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiles-test'}}
+
+
+@override_settings(CACHES=LOCMEM)
+class VectorTileTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(username='tiler', password='pass')
+        self.client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.addr = Address.objects.create(latitude=52.2297, longitude=21.0122)
+            Pet.objects.create(name='Burek', species='dog', created_by=self.user, address=self.addr)
+
+    def _tile(self, layer, z, lat=52.2297, lon=21.0122):
+        x, y = lonlat_to_tile(lon, lat, z)
+        resp = self.client.get(reverse('pet:vector_tile', args=[layer, z, x, y]))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        return resp.content
+
+    def test_points_and_clusters(self):
+        self.assertIn(b'Burek', self._tile('pet', 15))
+        low = self._tile('pet', 4)
+        self.assertIn(b'point_count', low)
+        self.assertNotIn(b'Burek', low)
+        self.assertEqual(self.client.get(reverse('pet:vector_tile', args=['nope', 1, 0, 0])).status_code, 404)
+
+    def test_cache_invalidated_when_address_moves(self):
+        self.assertIn(b'Burek', self._tile('pet', 15))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.addr.latitude, self.addr.longitude = 50.0647, 19.9450
+            self.addr.save()
+        self.assertNotIn(b'Burek', self._tile('pet', 15))
+        self.assertIn(b'Burek', self._tile('pet', 15, lat=50.0647, lon=19.9450))
@@ -0,0 +1,122 @@
+# apps/pet/tiles.py
+"""
+地图矢量瓦片（MVT）：lost / pet / shelter 三个点图层。
+
+- 高缩放（>= POINTS_MIN_ZOOM）逐条输出要素；低缩放按 geohash 前缀在数据库里聚合成带 point_count 的点，
+  一块瓦片的要素数只与格子数有关，不随数据量增长。
+- 编码结果按 (layer, z, x, y) 缓存；Address/Lost/Pet/Shelter 变更时按新旧坐标精确删除各级瓦片。
+"""
+from common.cache import SubsystemCache
+from django.db.models import Avg, Count, FloatField
+from django.db.models.functions import Cast, Substr
+
+from common.mvt import EXTENT, encode_tile, lonlat_to_tile, lonlat_to_tile_pixel, tile_bounds
+from .clusters import POINTS_MIN_ZOOM, zoom_to_precision
+
+MAX_ZOOM = 20
+TILE_CACHE_TIMEOUT = 60 * 60 * 24
+# 瓦片边缘留 64px 缓冲，避免图标在瓦片边界被裁掉
+BUFFER = 64
+MAX_FEATURES = 5000
+
+tile_cache = SubsystemCache("tiles")
+
+
+def _lost_qs():
+    from .models import Lost
+    return Lost.objects.all()
+
+
+def _pet_qs():
+    from .models import Pet
+    return Pet.objects.filter(status__in=[Pet.Status.AVAILABLE, Pet.Status.PENDING])
+
+
+def _shelter_qs():
+    from .models import Shelter
+    return Shelter.objects.filter(is_active=True)
+
+
+# 图层名 -> (queryset 工厂, 高缩放时输出的属性字段)
+LAYERS = {
+    "lost": (_lost_qs, ("status", "species", "pet_name")),
+    "pet": (_pet_qs, ("name", "species", "status")),
+    "shelter": (_shelter_qs, ("name",)),
+}
+
+
+def tile_cache_key(layer: str, z: int, x: int, y: int) -> str:
+    return f"mvt:{layer}:{z}:{x}:{y}"
+
+
+def _in_tile(qs, z, x, y):
+    min_lat, min_lon, max_lat, max_lon = tile_bounds(z, x, y)
+    # 按缓冲像素放宽经纬度范围
+    pad_lat = (max_lat - min_lat) * BUFFER / EXTENT
+    pad_lon = (max_lon - min_lon) * BUFFER / EXTENT
+    return qs.filter(
+        address__latitude__gte=min_lat - pad_lat, address__latitude__lte=max_lat + pad_lat,
+        address__longitude__gte=min_lon - pad_lon, address__longitude__lte=max_lon + pad_lon,
+    )
+
+
+def layer_features(layer: str, z: int, x: int, y: int):
+    factory, props = LAYERS[layer]
+    qs = _in_tile(factory(), z, x, y)
+    features = []
+    if z >= POINTS_MIN_ZOOM:
+        rows = qs.values_list("id", "address__latitude", "address__longitude", *props)[:MAX_FEATURES]
+        for row in rows:
+            fid, lat, lon, values = row[0], float(row[1]), float(row[2]), row[3:]
+            features.append((fid, lonlat_to_tile_pixel(lon, lat, z, x, y), dict(zip(props, values))))
+        return features
+
+    # 低缩放：比聚类接口细一级的 geohash 格子，在数据库里 GROUP BY
+    precision = min(zoom_to_precision(z) + 1, 12)
+    rows = (
+        qs.exclude(address__geohash="")
+        .annotate(cell=Substr("address__geohash", 1, precision))
+        .values("cell")
+        .annotate(
+            n=Count("id"),
+            lat=Avg(Cast("address__latitude", FloatField())),
+            lon=Avg(Cast("address__longitude", FloatField())),
+        )
+        .order_by()[:MAX_FEATURES]
+    )
+    for row in rows:
+        features.append((None, lonlat_to_tile_pixel(row["lon"], row["lat"], z, x, y), {"point_count": row["n"]}))
+    return features
+
+
+def render_tile(layer: str, z: int, x: int, y: int) -> bytes:
+    """读缓存，未命中则查询并编码；空瓦片也缓存（空字节）"""
+    key = tile_cache_key(layer, z, x, y)
+    data = tile_cache.get(key)
+    if data is None:
+        data = encode_tile({layer: layer_features(layer, z, x, y)})
+        tile_cache.set(key, data, TILE_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_point(lat, lon, layers=None):
+    """删除包含该点的所有缩放级别的瓦片（含相邻瓦片的缓冲区影响，按 1 格邻域处理）"""
+    if lat is None or lon is None:
+        return
+    lat, lon = float(lat), float(lon)
+    keys = []
+    for layer in layers or LAYERS:
+        for z in range(MAX_ZOOM + 1):
+            tx, ty = lonlat_to_tile(lon, lat, z)
+            n = 1 << z
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    nx, ny = tx + dx, ty + dy
+                    if 0 <= nx < n and 0 <= ny < n and _within_buffer(lon, lat, z, nx, ny):
+                        keys.append(tile_cache_key(layer, z, nx, ny))
+    tile_cache.delete_many(keys)
+
+
+def _within_buffer(lon, lat, z, x, y):
+    px, py = lonlat_to_tile_pixel(lon, lat, z, x, y)
+    return -BUFFER <= px <= EXTENT + BUFFER and -BUFFER <= py <= EXTENT + BUFFER
@@ -2,7 +2,7 @@
 from rest_framework.routers import DefaultRouter
 from .views import PetViewSet, AdoptionViewSet, LostViewSet, DonationViewSet, ShelterViewSet, TicketViewSet
 from django.urls import path, include
-from apps.pet.views import LostGeoViewSet, HolidayFamilyViewSet
+from apps.pet.views import LostGeoViewSet, HolidayFamilyViewSet, vector_tile
 
 router = DefaultRouter()
 router.register(r'', PetViewSet, basename='pet')
@@ -48,6 +48,12 @@ urlpatterns = [
 		ShelterViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}),
 		name='shelter_detail'
 	),
+	# 地图矢量瓦片
+	path(
+		'tiles/<str:layer>/<int:z>/<int:x>/<int:y>.pbf',
+		vector_tile,
+		name='vector_tile'
+	),
 	# Router-generated routes
 	*router.urls
 ]
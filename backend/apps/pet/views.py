@@ -6,7 +6,7 @@ from rest_framework.decorators import action
 from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import IsAdminUser, AllowAny, SAFE_METHODS
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, APIException
 from .models import Pet, Adoption, Lost, Donation, PetFavorite, Shelter, Ticket, HolidayFamily
 from django.core.exceptions import FieldDoesNotExist
 from .serializers import PetListSerializer, PetCreateUpdateSerializer, AdoptionCreateSerializer, \
@@ -14,14 +14,19 @@ from .serializers import PetListSerializer, PetCreateUpdateSerializer, AdoptionC
     DonationDetailSerializer, DonationCreateSerializer, DonationDetailSerializer, \
     ShelterListSerializer, ShelterDetailSerializer, ShelterCreateUpdateSerializer, TicketSerializer
 from .permissions import IsOwnerOrAdmin, IsAdopterOrOwnerOrAdmin
-from .filters import PetFilter, LostFilter
+from .filters import PetFilter, LostFilter, ShelterFilter, PetSearchFilter, DistanceAwareOrderingFilter
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.parsers import MultiPartParser, FormParser
 from .serializers import LostGeoSerializer, HolidayFamilyApplicationSerializer
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework import viewsets, permissions
 from django.utils import timezone
-from django.contrib.auth.models import User
+from common.pagination import PageOrKeysetPagination
+from common.geo import parse_bbox
+from .clusters import MAX_POINTS, POINTS_MIN_ZOOM, clusters_in_bbox, zoom_to_precision
+from .tiles import LAYERS as TILE_LAYERS, MAX_ZOOM as TILE_MAX_ZOOM, render_tile
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
 import logging
 logger = logging.getLogger(__name__)
 
@@ -39,8 +44,11 @@ class PetViewSet(viewsets.ModelViewSet):
         except FieldDoesNotExist:
             pass
     queryset = Pet.objects.select_related(*_valid_related).order_by("-pub_date")
+    filter_backends = [DjangoFilterBackend, PetSearchFilter, DistanceAwareOrderingFilter]
     filterset_class = PetFilter
-    search_fields = ["name", "species", "breed", "description", "address"]
+    # ?pagination=cursor 时按 (pub_date, id) 游标分页
+    pagination_class = PageOrKeysetPagination
+    cursor_ordering_field = "pub_date"
     ordering_fields = ["add_date", "pub_date", "age_months", "name"]
     permission_classes = [IsAuthenticatedOrReadOnly]
 
@@ -51,6 +59,13 @@ class PetViewSet(viewsets.ModelViewSet):
         pet.save(update_fields=['status', 'pub_date'])
         return Response({'status': 'lost'}, status=status.HTTP_200_OK)
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        # 列表/详情走 PetListSerializer，一次性预取关联，避免 N+1
+        if self.action in ("list", "retrieve"):
+            qs = PetListSerializer.setup_eager_loading(qs)
+        return qs
+
     def get_serializer_class(self):
         return PetListSerializer if self.action in ("list", "retrieve") else PetCreateUpdateSerializer
 
@@ -70,6 +85,9 @@ class PetViewSet(viewsets.ModelViewSet):
             page = self.paginate_queryset(qs)
             ser = PetListSerializer(page, many=True, context={"request": request})
             return self.get_paginated_response(ser.data)
+        except APIException:
+            # 参数校验等 4xx 交给 DRF 正常处理
+            raise
         except Exception as exc:
             logger.exception('PetViewSet.list encountered error')
             # Return JSON error and avoid unhandled exception bubbling (helps with CORS during dev)
@@ -137,7 +155,9 @@ class PetViewSet(viewsets.ModelViewSet):
 
     @decorators.action(detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated])
     def favorites(self, request):
-        qs = Pet.objects.filter(favorites__user=request.user).order_by("-favorites__add_date")
+        qs = PetListSerializer.setup_eager_loading(
+            Pet.objects.filter(favorites__user=request.user)
+        ).order_by("-favorites__add_date")
         page = self.paginate_queryset(qs)
         ser = PetListSerializer(page, many=True, context={"request": request})
         return self.get_paginated_response(ser.data)
@@ -145,7 +165,9 @@ class PetViewSet(viewsets.ModelViewSet):
     @decorators.action(detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated])
     def my_pets(self, request):
         """Get all pets created by current user"""
-        qs = Pet.objects.filter(created_by=request.user).order_by("-add_date")
+        qs = PetListSerializer.setup_eager_loading(
+            Pet.objects.filter(created_by=request.user)
+        ).order_by("-add_date")
         page = self.paginate_queryset(qs)
         ser = PetListSerializer(page, many=True, context={"request": request})
         return self.get_paginated_response(ser.data)
@@ -246,10 +268,12 @@ class LostViewSet(viewsets.ModelViewSet):
     serializer_class = LostSerializer
     # Allow anyone to read, authenticated users and owners to write
     permission_classes = [permissions.AllowAny]
-    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, DistanceAwareOrderingFilter]
     filterset_class = LostFilter
     ordering_fields = ['created_at', 'lost_time']
     ordering = ['-created_at']
+    pagination_class = PageOrKeysetPagination
+    cursor_ordering_field = 'created_at'
 
     # Optional JWT authentication for write operations
     authentication_classes = [JWTAuthentication]
@@ -360,13 +384,67 @@ class LostGeoViewSet(viewsets.ReadOnlyModelViewSet):
     # bbox_filter_field = "address__location" 
     # InBBoxFilter removed - using standard filtering
 
+    @action(detail=False, methods=["get"])
+    def clusters(self, request):
+        """
+        地图聚类：?zoom=&bbox=min_lon,min_lat,max_lon,max_lat[&status=open,found]
+        低缩放返回预聚合格子（质心+数量），zoom >= POINTS_MIN_ZOOM 返回视口内的单点。
+        """
+        params = request.query_params
+        try:
+            zoom = max(0, min(int(params.get("zoom", 0)), 22))
+            box = parse_bbox(params.get("bbox") or "-180,-90,180,90")
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        statuses = [s for s in params.get("status", "").split(",") if s]
+
+        if zoom >= POINTS_MIN_ZOOM:
+            min_lat, min_lon, max_lat, max_lon = box
+            qs = Lost.objects.filter(
+                address__latitude__gte=min_lat, address__latitude__lte=max_lat,
+                address__longitude__gte=min_lon, address__longitude__lte=max_lon,
+            )
+            if statuses:
+                qs = qs.filter(status__in=statuses)
+            rows = qs.order_by("-created_at").values(
+                "id", "status", "species", "pet_name", "address__latitude", "address__longitude",
+            )[:MAX_POINTS]
+            points = [
+                {
+                    "id": r["id"], "status": r["status"], "species": r["species"], "pet_name": r["pet_name"],
+                    "lat": float(r["address__latitude"]), "lon": float(r["address__longitude"]),
+                }
+                for r in rows
+            ]
+            return Response({"type": "points", "zoom": zoom, "results": points})
+
+        return Response({
+            "type": "clusters",
+            "zoom": zoom,
+            "precision": zoom_to_precision(zoom),
+            "results": clusters_in_bbox(zoom, box, statuses),
+        })
+
+
+@require_GET
+def vector_tile(request, layer, z, x, y):
+    """GET pet/tiles/<layer>/<z>/<x>/<y>.pbf —— lost/pet/shelter 点图层的 Mapbox Vector Tile"""
+    if layer not in TILE_LAYERS or z > TILE_MAX_ZOOM or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise Http404("Unknown tile")
+    data = render_tile(layer, z, x, y)
+    response = HttpResponse(data, content_type="application/vnd.mapbox-vector-tile")
+    # 服务端缓存会在数据变更时失效，浏览器端只短时间缓存
+    response["Cache-Control"] = "public, max-age=60"
+    return response
+
 
 class ShelterViewSet(viewsets.ModelViewSet):
     """ViewSet for Shelter CRUD operations"""
     permission_classes = [IsAuthenticatedOrReadOnly]
     authentication_classes = [JWTAuthentication]
     parser_classes = [MultiPartParser, FormParser]
-    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, DistanceAwareOrderingFilter]
+    filterset_class = ShelterFilter
     ordering_fields = ['name', 'created_at', 'capacity', 'current_animals']
     ordering = ['name']
     
@@ -525,18 +603,13 @@ class HolidayFamilyViewSet(viewsets.ModelViewSet):
     
     def _notify_admins(self, application):
         """Send notification to all admin users about new application"""
-        from apps.common.models import Notification
-        
-        admin_users = User.objects.filter(is_staff=True)
-        
-        for admin in admin_users:
-            try:
-                Notification.objects.create(
-                    user=admin,
-                    title="New Holiday Family Application",
-                    message=f"New application from {application.full_name} ({application.email})",
-                    notification_type="info",
-                    link=f"/admin/pet/holidayfamily/{application.id}/change/"
-                )
-            except Exception as e:
-                logger.error(f"Failed to create notification for admin {admin.id}: {e}")
\ No newline at end of file
+        from apps.user.notifications import notify, staff_users
+
+        # 原实现引用了不存在的 apps.common.models，通知从未写入；改为提交后批量扇出
+        notify(
+            staff_users(),
+            notification_type="holiday_family_apply",
+            title="New Holiday Family Application",
+            content=f"New application from {application.full_name} ({application.email})",
+            from_user_id=application.user_id,
+        )
\ No newline at end of file
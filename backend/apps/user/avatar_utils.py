@@ -1,79 +1,143 @@
 """
 User avatar utilities
+
+默认头像只由（首字母, 颜色, 尺寸）决定，组合只有几千种：字体按字号缓存在进程内，
+渲染结果按组合存入 avatars 缓存（进程内 LRU + 磁盘/Redis），由
+/user/avatars/{user_id}/default/?size= 直接输出，不再为每个用户写一份文件。
 """
+import hashlib
 import io
+from functools import lru_cache
+
 from PIL import Image, ImageDraw, ImageFont
 from django.core.files.base import ContentFile
 from django.contrib.auth import get_user_model
-import random
+from django.urls import reverse
+
+from common.cache import SubsystemCache
 
 User = get_user_model()
 
+avatar_cache = SubsystemCache('avatars')
 
-def generate_default_avatar(username: str, size: int = 200) -> ContentFile:
-    """
-    Generate a default avatar image with initials
-    
-    Args:
-        username: The user's username
-        size: Size of the avatar (default 200x200)
-    
-    Returns:
-        ContentFile object that can be saved to ImageField
-    """
+# 修改绘制逻辑时加一，旧缓存自然失效
+RENDER_VERSION = 1
+DEFAULT_AVATAR_SIZE = 200
+# 允许的输出尺寸，请求的 size 取不小于它的最近档，限制组合数量
+DEFAULT_AVATAR_SIZES = (32, 48, 64, 96, 128, 200, 256, 512)
+
+FONT_PATHS = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",  # Windows path
+)
+
+# Define a color palette for variety
+AVATAR_COLORS = (
+    (255, 107, 107),  # Red
+    (66, 165, 245),   # Blue
+    (102, 187, 106),  # Green
+    (255, 167, 38),   # Orange
+    (171, 71, 188),   # Purple
+    (29, 233, 182),   # Teal
+    (255, 205, 86),   # Yellow
+    (255, 138, 101),  # Deep Orange
+    (103, 58, 183),   # Deep Purple
+    (244, 67, 54),    # Crimson
+)
+
+
+@lru_cache(maxsize=None)
+def _font(font_size: int):
+    """按字号缓存字体对象，避免每次从磁盘加载 TrueType"""
+    for path in FONT_PATHS:
+        try:
+            return ImageFont.truetype(path, font_size)
+        except OSError:
+            continue
+    # Fall back to default font
+    return ImageFont.load_default(font_size)
+
+
+def avatar_initials(username: str) -> str:
     # Extract initials from username (first 2 characters or first character twice)
-    initials = (username[:2] if len(username) >= 2 else username[0] * 2).upper()
-    
-    # Define a color palette for variety
-    colors = [
-        (255, 107, 107),  # Red
-        (66, 165, 245),   # Blue
-        (102, 187, 106),  # Green
-        (255, 167, 38),   # Orange
-        (171, 71, 188),   # Purple
-        (29, 233, 182),   # Teal
-        (255, 205, 86),   # Yellow
-        (255, 138, 101),  # Deep Orange
-        (103, 58, 183),   # Deep Purple
-        (244, 67, 54),    # Crimson
-    ]
-    
+    return (username[:2] if len(username) >= 2 else username[0] * 2).upper()
+
+
+def avatar_color(username: str) -> tuple:
     # Use username hash to get consistent color
-    color = colors[sum(ord(c) for c in username) % len(colors)]
-    
-    # Create image
+    return AVATAR_COLORS[sum(ord(c) for c in username) % len(AVATAR_COLORS)]
+
+
+def avatar_size(size) -> int:
+    """把请求的尺寸归到 DEFAULT_AVATAR_SIZES 中的一档"""
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        return DEFAULT_AVATAR_SIZE
+    return next((s for s in DEFAULT_AVATAR_SIZES if s >= size), DEFAULT_AVATAR_SIZES[-1])
+
+
+def _render(initials: str, color: tuple, size: int) -> bytes:
     image = Image.new('RGB', (size, size), color=color)
     draw = ImageDraw.Draw(image)
-    
-    # Try to use a nice font, fall back to default if not available
-    try:
-        # Try to find a nice font - this path works in most systems
-        font_size = size // 3
-        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", font_size)
-    except:
-        try:
-            # Windows path
-            font = ImageFont.truetype("C:\\Windows\\Fonts\\arial.ttf", size // 3)
-        except:
-            # Fall back to default font
-            font = ImageFont.load_default()
-    
+    font = _font(size // 3)
+
     # Calculate text position (center)
     bbox = draw.textbbox((0, 0), initials, font=font)
     text_width = bbox[2] - bbox[0]
     text_height = bbox[3] - bbox[1]
     x = (size - text_width) // 2
     y = (size - text_height) // 2
-    
-    # Draw text
     draw.text((x, y), initials, fill=(255, 255, 255), font=font)
-    
-    # Convert to ContentFile
+
     img_io = io.BytesIO()
-    image.save(img_io, format='PNG')
-    img_io.seek(0)
+    image.save(img_io, format='PNG', optimize=True)
+    return img_io.getvalue()
+
+
+def default_avatar_key(username: str, size: int = DEFAULT_AVATAR_SIZE) -> str:
+    """同一组合的缓存键，也用作 ETag"""
+    initials, color = avatar_initials(username), avatar_color(username)
+    raw = f"v{RENDER_VERSION}:{initials}:{'%02x%02x%02x' % color}:{size}"
+    return hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+
+
+def render_default_avatar(username: str, size: int = DEFAULT_AVATAR_SIZE) -> bytes:
+    """默认头像 PNG 字节；每个（首字母, 颜色, 尺寸）组合只渲染一次"""
+    key = default_avatar_key(username, size)
+    data = avatar_cache.get(key)
+    if data is None:
+        data = _render(avatar_initials(username), avatar_color(username), size)
+        avatar_cache.set(key, data, None)
+    return data
+
+
+def generate_default_avatar(username: str, size: int = DEFAULT_AVATAR_SIZE) -> ContentFile:
+    """
+    Generate a default avatar image with initials
+    
+    Args:
+        username: The user's username
+        size: Size of the avatar (default 200x200)
     
-    return ContentFile(img_io.getvalue(), name=f'{username}_avatar.png')
+    Returns:
+        ContentFile object that can be saved to ImageField
+    """
+    return ContentFile(render_default_avatar(username, size), name=f'{username}_avatar.png')
+
+
+def default_avatar_url(user_id, request=None) -> str:
+    url = reverse('user:avatar-default', args=[user_id])
+    return request.build_absolute_uri(url) if request else url
+
+
+def user_avatar_url(user, request=None) -> str:
+    """自定义头像的（绝对）URL；没有则回落到默认头像端点，不返回 None"""
+    profile = getattr(user, 'profile', None)
+    if profile is not None and profile.avatar:
+        url = profile.avatar.url
+        return request.build_absolute_uri(url) if request and url.startswith('/') else url
+    return default_avatar_url(user.pk, request)
 
 
 def get_avatar_url(user) -> str:
@@ -95,4 +159,4 @@ def get_avatar_url(user) -> str:
         return user.profile.avatar.url
     
     # Return default avatar initials as a placeholder
-    return f'/api/user/avatars/{user.id}/default/'
+    return default_avatar_url(user.id)
@@ -0,0 +1,226 @@
+# apps/user/conversations.py
+"""
+私信会话摘要（Conversation）的维护与收件箱分页。
+
+- 发送：一条 INSERT ... ON CONFLICT DO UPDATE，更新最后一条消息/时间，接收方未读 +1；
+- 已读/删除：signals 里按状态变化对接收方未读 ±1；删掉的是最后一条时回退到剩余的最新一条；
+- 批量已读 mark_read()：一条 UPDATE ... RETURNING 标记整段会话，同一事务内扣减 UnreadCounter
+  和会话未读数，并把该侧的已读水位推进到仍未读的最早一条之前（已读回执，发送方按 id 比较，
+  不逐条写回执）；
+- 收件箱：(last_message_at, id) 游标，user_low=u 与 user_high=u 两个索引各取一页后合并，
+  不再对私信表做 sender=u OR recipient=u 再按对方分组。
+"""
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Conversation, PrivateMessage
+
+
+def pair(a, b):
+    return (a, b) if a <= b else (b, a)
+
+
+def _unread_field(conversation_pair, recipient_id):
+    return "low_unread" if conversation_pair[0] == recipient_id else "high_unread"
+
+
+def record_message(message):
+    """新私信写入摘要；与私信在同一事务内"""
+    low, high = pair(message.sender_id, message.recipient_id)
+    unread = 0 if message.is_read else 1
+    low_unread = unread if low == message.recipient_id else 0
+    high_unread = unread if low != message.recipient_id else 0
+
+    qn = connection.ops.quote_name
+    table = qn(Conversation._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} (user_low_id, user_high_id, last_message_id, last_message_at, low_unread, high_unread) "
+        f"VALUES (%s, %s, %s, %s, %s, %s) "
+        f"ON CONFLICT (user_low_id, user_high_id) DO UPDATE SET "
+        # 并发发送时按时间保留较新的一条，不依赖提交顺序
+        f"last_message_id = CASE WHEN EXCLUDED.last_message_at >= {table}.last_message_at "
+        f"THEN EXCLUDED.last_message_id ELSE {table}.last_message_id END, "
+        f"last_message_at = GREATEST({table}.last_message_at, EXCLUDED.last_message_at), "
+        f"low_unread = {table}.low_unread + EXCLUDED.low_unread, "
+        f"high_unread = {table}.high_unread + EXCLUDED.high_unread"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [low, high, message.pk, message.created_at, low_unread, high_unread])
+
+
+def bump_unread(message, delta):
+    """接收方在该会话的未读数 +delta（只更新已有行，不小于 0）"""
+    conversation_pair = pair(message.sender_id, message.recipient_id)
+    field = _unread_field(conversation_pair, message.recipient_id)
+    Conversation.objects.filter(user_low_id=conversation_pair[0], user_high_id=conversation_pair[1]).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def mark_read(user_id, peer_id, *, up_to_id=None, up_to=None, message_ids=None):
+    """
+    把 peer_id 发给 user_id 的未读私信标为已读：可限定 id 上界（up_to_id）、时间上界（up_to）
+    或具体的 message_ids。返回 (标记条数, 标记后的已读水位)；水位不越过仍未读的最早一条
+    """
+    qn = connection.ops.quote_name
+    table = qn(PrivateMessage._meta.db_table)
+    now = timezone.now()
+    where = ["recipient_id = %s", "sender_id = %s", "is_read = false"]
+    params = [now, user_id, peer_id]
+    if up_to_id is not None:
+        where.append("id <= %s")
+        params.append(up_to_id)
+    if up_to is not None:
+        where.append("created_at <= %s")
+        params.append(up_to)
+    if message_ids is not None:
+        where.append("id = ANY(%s)")
+        params.append(list(message_ids))
+    # 一条语句完成标记与统计；行锁保证并发标记同一条消息时只有一方计入
+    sql = (
+        f"WITH marked AS (UPDATE {table} SET is_read = true, read_at = %s "
+        f"WHERE {' AND '.join(where)} RETURNING id, is_system) "
+        f"SELECT is_system, count(*), max(id) FROM marked GROUP BY is_system"
+    )
+
+    from . import realtime, unread
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        if not rows:
+            return 0, None
+        marked = sum(n for _, n, _ in rows)
+        last_read = max(max_id for _, _, max_id in rows)
+        unread.bump({user_id: {unread.message_field(is_system): -n for is_system, n, _ in rows}})
+
+        # 水位的含义是“id <= read_up_to 的消息都已读”：只标了较新的某几条（message_ids / 跳读）时，
+        # 不能越过对方发来的、仍未读的最早一条
+        first_unread = (
+            PrivateMessage.objects.filter(recipient_id=user_id, sender_id=peer_id, is_read=False)
+            .order_by('id').values_list('id', flat=True).first()
+        )
+        if first_unread is not None and first_unread <= last_read:
+            last_read = first_unread - 1
+
+        low, high = pair(user_id, peer_id)
+        side = "low" if low == user_id else "high"
+        conversations = Conversation.objects.filter(user_low_id=low, user_high_id=high)
+        conversations.update(**{
+            f"{side}_unread": Greatest(F(f"{side}_unread") - marked, 0),
+            # PostgreSQL 的 GREATEST 忽略 NULL，首次已读直接取本次的值
+            f"{side}_read_up_to": Greatest(F(f"{side}_read_up_to"), last_read),
+            f"{side}_read_at": now,
+        })
+        read_up_to = conversations.values_list(f"{side}_read_up_to", flat=True).first()
+    # 提交后通知对方（发送方）刷新已读回执
+    realtime.publish_read_receipt(peer_id, user_id, read_up_to, now)
+    return marked, read_up_to
+
+
+def _row(user_id, peer_id):
+    low, high = pair(user_id, peer_id)
+    return Conversation.objects.filter(user_low_id=low, user_high_id=high)
+
+
+def unread_in(user_id, peer_id):
+    """user_id 在与 peer_id 的会话里的未读数"""
+    field = "low_unread" if pair(user_id, peer_id)[0] == user_id else "high_unread"
+    return max(0, _row(user_id, peer_id).values_list(field, flat=True).first() or 0)
+
+
+def read_receipt(user_id, peer_id):
+    """peer_id 对 user_id 所发消息的已读水位：{"read_up_to": id, "read_at": 时间}（还没有会话时两项均为 None）"""
+    conversation = _row(user_id, peer_id).first()
+    if conversation is None:
+        return {"read_up_to": None, "read_at": None}
+    return conversation.read_receipt_for(peer_id)
+
+
+def backfill_read_receipts(conversation_model=None, message_model=None):
+    """按现有 is_read 数据初始化两侧的已读水位（迁移用），一条 UPDATE"""
+    from django.db.models import OuterRef, Subquery
+
+    conversation_model = conversation_model or Conversation
+    messages = (message_model or PrivateMessage).objects.filter(is_read=True).order_by('-id')
+
+    def latest(reader, writer, field):
+        return Subquery(messages.filter(recipient_id=OuterRef(reader), sender_id=OuterRef(writer)).values(field)[:1])
+
+    conversation_model.objects.update(
+        low_read_up_to=latest('user_low', 'user_high', 'id'),
+        low_read_at=latest('user_low', 'user_high', 'read_at'),
+        high_read_up_to=latest('user_high', 'user_low', 'id'),
+        high_read_at=latest('user_high', 'user_low', 'read_at'),
+    )
+
+
+def messages_between(user_id, peer_id):
+    return PrivateMessage.objects.filter(
+        Q(sender_id=user_id, recipient_id=peer_id) | Q(sender_id=peer_id, recipient_id=user_id)
+    )
+
+
+def forget_message(message, was_unread):
+    """私信删除后：未读 -1；若它是最后一条（外键已被置空），回退到剩余最新的一条或删除空会话"""
+    low, high = pair(message.sender_id, message.recipient_id)
+    conversations = Conversation.objects.filter(user_low_id=low, user_high_id=high)
+    if was_unread:
+        bump_unread(message, -1)
+    if not conversations.filter(Q(last_message__isnull=True) | Q(last_message_id=message.pk)).exists():
+        return
+    latest = messages_between(low, high).order_by('-created_at', '-pk').values('pk', 'created_at').first()
+    if latest is None:
+        conversations.delete()
+    else:
+        conversations.update(last_message_id=latest['pk'], last_message_at=latest['created_at'])
+
+
+def inbox(user_id, after=None, limit=20):
+    """
+    按最后消息时间倒序的会话列表；after 为上一页最后一条的 (last_message_at, id)。
+    返回 (本页会话, 是否还有下一页)
+    """
+    qs = Conversation.objects.select_related(
+        'last_message', 'user_low__profile', 'user_high__profile'
+    ).order_by('-last_message_at', '-pk')
+    if after is not None:
+        ts, pk = after
+        qs = qs.filter(Q(last_message_at__lt=ts) | Q(last_message_at=ts, pk__lt=pk), last_message_at__lte=ts)
+    low = list(qs.filter(user_low_id=user_id)[:limit + 1])
+    # 自己给自己的会话（low == high）只在 low 一侧出现
+    high = list(qs.filter(user_high_id=user_id).exclude(user_low_id=user_id)[:limit + 1])
+    rows = sorted(low + high, key=lambda c: (c.last_message_at, c.pk), reverse=True)
+    return rows[:limit], len(rows) > limit
+
+
+def backfill(conversation_model=None, message_model=None, batch_size=1000):
+    """按现有私信重建全部会话摘要（迁移用）"""
+    from django.db.models import Count
+    from django.db.models.functions import Least
+
+    conversation_model = conversation_model or Conversation
+    messages = (message_model or PrivateMessage).objects.annotate(
+        low=Least('sender_id', 'recipient_id'), high=Greatest('sender_id', 'recipient_id'),
+    )
+    unread = {}
+    for row in messages.filter(is_read=False).order_by().values('low', 'high', 'recipient_id').annotate(n=Count('id')):
+        field = 'low_unread' if row['recipient_id'] == row['low'] else 'high_unread'
+        unread.setdefault((row['low'], row['high']), {})[field] = row['n']
+
+    latest = messages.order_by('low', 'high', '-created_at', '-id').distinct('low', 'high')
+    batch = []
+    for row in latest.values('low', 'high', 'id', 'created_at').iterator(chunk_size=batch_size):
+        key = (row['low'], row['high'])
+        batch.append(conversation_model(
+            user_low_id=row['low'], user_high_id=row['high'], last_message_id=row['id'],
+            last_message_at=row['created_at'], **unread.get(key, {}),
+        ))
+        if len(batch) >= batch_size:
+            conversation_model.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        conversation_model.objects.bulk_create(batch, ignore_conflicts=True)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.user.unread import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recount unread notifications/private messages and repair drifted UnreadCounter rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only these user ids (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report drift, do not write')
+
+    def handle(self, *args, **options):
+        drift = reconcile(user_ids=options['users'], dry_run=options['dry_run'])
+        for user_id, diff in drift[:50]:
+            changes = ', '.join(f'{field} {have}->{want}' for field, (have, want) in diff.items())
+            self.stdout.write(f'  user {user_id}: {changes}')
+        if len(drift) > 50:
+            self.stdout.write(f'  ... and {len(drift) - 50} more')
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(drift)} drifted counter rows'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from apps.user.view_counter import rollup_view_totals, view_counter
+
+
+class Command(BaseCommand):
+    help = "Recompute the 7/30-day windows of ViewTotal from ViewStatistics (run daily; --full also rebuilds totals)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild ViewTotal.total from all ViewStatistics rows')
+
+    def handle(self, *args, **options):
+        view_counter.flush()
+        n = rollup_view_totals(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up view totals for {n} objects"))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comment', '0001_initial'),
+        ('holiday_family', '0004_holidayfamilyapplication_rejection_reason'),
+        ('user', '0006_userprofile_is_holiday_family_certified'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='user_notifi_user_id_7c7879_idx',
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='user_notifi_user_id_bb219c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='privatemessage',
+            index=models.Index(fields=['sender', '-created_at', '-id'], name='user_privat_sender__7fb64c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='privatemessage',
+            index=models.Index(fields=['recipient', '-created_at', '-id'], name='user_privat_recipie_5896ba_idx'),
+        ),
+    ]
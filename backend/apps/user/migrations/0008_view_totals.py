@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_view_totals(apps, schema_editor):
+    from apps.user.view_counter import rollup_view_totals
+
+    rollup_view_totals(
+        full=True,
+        stats_model=apps.get_model('user', 'ViewStatistics'),
+        totals_model=apps.get_model('user', 'ViewTotal'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('user', '0007_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('last_7d', models.PositiveIntegerField(default=0)),
+                ('last_30d', models.PositiveIntegerField(default=0)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'View total',
+                'verbose_name_plural': 'View totals',
+                'indexes': [models.Index(fields=['content_type', '-total', 'object_id'], name='user_viewtotal_total_idx'), models.Index(fields=['content_type', '-last_7d', 'object_id'], name='user_viewtotal_7d_idx'), models.Index(fields=['content_type', '-last_30d', 'object_id'], name='user_viewtotal_30d_idx')],
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id'), name='user_viewtotal_object_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_view_totals, migrations.RunPython.noop),
+    ]
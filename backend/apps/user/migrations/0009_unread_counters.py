@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_unread_counters(apps, schema_editor):
+    from apps.user.unread import reconcile
+
+    reconcile(
+        lock=False,
+        counter_model=apps.get_model('user', 'UnreadCounter'),
+        notification_model=apps.get_model('user', 'Notification'),
+        message_model=apps.get_model('user', 'PrivateMessage'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('user', '0008_view_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('reply', models.IntegerField(default=0)),
+                ('mention', models.IntegerField(default=0)),
+                ('friend_request', models.IntegerField(default=0)),
+                ('system', models.IntegerField(default=0)),
+                ('holiday_family_apply', models.IntegerField(default=0)),
+                ('holiday_family_approve', models.IntegerField(default=0)),
+                ('holiday_family_reject', models.IntegerField(default=0)),
+                ('messages', models.IntegerField(default=0)),
+                ('system_messages', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Unread counter',
+                'verbose_name_plural': 'Unread counters',
+            },
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
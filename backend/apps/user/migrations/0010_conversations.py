@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_conversations(apps, schema_editor):
+    from apps.user.conversations import backfill
+
+    backfill(
+        conversation_model=apps.get_model('user', 'Conversation'),
+        message_model=apps.get_model('user', 'PrivateMessage'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0009_unread_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField()),
+                ('low_unread', models.IntegerField(default=0)),
+                ('high_unread', models.IntegerField(default=0)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='user.privatemessage')),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Conversation',
+                'verbose_name_plural': 'Conversations',
+                'indexes': [models.Index(fields=['user_low', '-last_message_at', '-id'], name='user_conv_low_inbox_idx'), models.Index(fields=['user_high', '-last_message_at', '-id'], name='user_conv_high_inbox_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_low', 'user_high'), name='user_conversation_pair_uniq'), models.CheckConstraint(condition=models.Q(('user_low__lte', models.F('user_high'))), name='user_conversation_pair_ordered')],
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:25
+
+from django.db import migrations, models
+
+
+def backfill_read_receipts(apps, schema_editor):
+    from apps.user.conversations import backfill_read_receipts
+
+    backfill_read_receipts(
+        conversation_model=apps.get_model('user', 'Conversation'),
+        message_model=apps.get_model('user', 'PrivateMessage'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0010_conversations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='high_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='high_read_up_to',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='low_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='low_read_up_to',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_read_receipts, migrations.RunPython.noop),
+    ]
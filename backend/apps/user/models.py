@@ -1,7 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
-from django.core.cache import cache
 from django.utils import timezone
 from django.conf import settings
 from django.core.validators import RegexValidator
@@ -83,51 +82,63 @@ class ViewStatistics(models.Model):
 
     @classmethod
     def increase(cls, request, obj):
-        uid = request.uid
-        obj_id = obj.id
-        date = timezone.now().date()
+        """记一次浏览：经布隆过滤器去重后进入写后缓冲，由 view_counter 批量 upsert"""
+        from .view_counter import view_counter
+
         ct = ContentType.objects.get_for_model(obj.__class__)
-        key = f'{uid}:{date}:{obj_id}'
-
-        if not cache.get(key):
-            cache.set(key, 1, 60 * 60 * 24)
-            try:
-                cls.objects.get(content_type=ct, object_id=obj_id, date=date)
-            except cls.DoesNotExist:
-                cls.objects.create(
-                    content_type=ct,
-                    object_id=obj_id,
-                    count=1,
-                    date=date
-                )
-            else:
-                cls.objects.filter(
-                    content_type=ct,
-                    object_id=obj_id,
-                    date=date
-                ).update(count=models.F('count') + 1)
+        view_counter.record(request.uid, ct.id, obj.id, timezone.now().date())
 
     @classmethod
     def get_view_count(cls, obj):
+        """累计浏览量：读汇总表 ViewTotal 一行，加上本进程尚未落库的增量"""
+        from .view_counter import view_counter
+
         ct = ContentType.objects.get_for_model(obj)
-        obj_id = obj.id
-        date = timezone.now().date()
-        try:
-            view_statistics = ViewStatistics.objects.get(
-                content_type=ct,
-                object_id=obj_id,
-                date=date
-            )
-        except cls.DoesNotExist:
-            return 0
-        else:
-            return cls.objects.filter(
-                content_type=ct,
-                object_id=obj_id
-            ).aggregate(models.Sum('count'))['count__sum']
+        total = ViewTotal.objects.filter(content_type=ct, object_id=obj.id).values_list('total', flat=True).first()
+        return (total or 0) + view_counter.pending_count(ct.id, obj.id)
 
 
-class Notification(models.Model):
+class ViewTotal(models.Model):
+    """
+    每个对象一行的浏览量汇总：total 随 view_counter 每次刷盘增量累加；
+    last_7d / last_30d 同样增量累加，由 rollup_view_totals 每天按 ViewStatistics 重算以滑出过期天数。
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    total = models.PositiveIntegerField(default=0)
+    last_7d = models.PositiveIntegerField(default=0)
+    last_30d = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'View total'
+        verbose_name_plural = 'View totals'
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id'], name='user_viewtotal_object_uniq'),
+        ]
+        indexes = [
+            # 热门排序：按类型取 total 最大的若干个对象
+            models.Index(fields=['content_type', '-total', 'object_id'], name='user_viewtotal_total_idx'),
+            models.Index(fields=['content_type', '-last_7d', 'object_id'], name='user_viewtotal_7d_idx'),
+            models.Index(fields=['content_type', '-last_30d', 'object_id'], name='user_viewtotal_30d_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.content_type}{self.object_id}-{self.total}'
+
+
+class AtomicSaveMixin:
+    """
+    save() 连同 post_save 处理器放进同一事务：ATOMIC_REQUESTS 关闭时，单条 create() 的 INSERT
+    不会先于未读计数/会话摘要的更新单独提交（apps/user/signals.py）
+    """
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class Notification(AtomicSaveMixin, models.Model):
     """用户通知模型 - 记录评论回复和其他通知"""
     NOTIFICATION_TYPES = (
         ('reply', '有人回复了我的评论'),
@@ -176,7 +187,7 @@ class Notification(models.Model):
         verbose_name_plural = 'Notifications'
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['user', '-created_at', '-id']),
             models.Index(fields=['user', 'is_read']),
         ]
     
@@ -216,7 +227,7 @@ class Friendship(models.Model):
         return f'{self.from_user.username} -> {self.to_user.username} ({self.status})'
 
 
-class PrivateMessage(models.Model):
+class PrivateMessage(AtomicSaveMixin, models.Model):
     """私信模型"""
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='sent_messages')
     recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='received_messages')
@@ -235,7 +246,88 @@ class PrivateMessage(models.Model):
         indexes = [
             models.Index(fields=['sender', 'recipient', '-created_at']),
             models.Index(fields=['recipient', 'is_read']),
+            # 收件箱/游标分页：sender=u OR recipient=u 两边各走一个索引
+            models.Index(fields=['sender', '-created_at', '-id']),
+            models.Index(fields=['recipient', '-created_at', '-id']),
         ]
     
     def __str__(self):
         return f'{self.sender.username} -> {self.recipient.username}: {self.content[:50]}'
+
+
+class Conversation(models.Model):
+    """
+    私信会话摘要：每对用户一行（user_low <= user_high，与发送方向无关），
+    记录最后一条消息、时间和双方各自的未读数；收件箱直接按它做游标分页。
+    由 apps/user/conversations.py 在发送、已读、删除私信时维护；批量已读同时推进已读水位。
+    """
+    user_low = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    user_high = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey(PrivateMessage, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='+')
+    last_message_at = models.DateTimeField()
+    # user_low / user_high 各自收到但未读的条数
+    low_unread = models.IntegerField(default=0)
+    high_unread = models.IntegerField(default=0)
+    # 已读水位（已读回执）：该侧已读到的对方消息的最大 id 及时间，发送方据此判断哪些消息已读
+    low_read_up_to = models.BigIntegerField(null=True, blank=True)
+    low_read_at = models.DateTimeField(null=True, blank=True)
+    high_read_up_to = models.BigIntegerField(null=True, blank=True)
+    high_read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Conversation'
+        verbose_name_plural = 'Conversations'
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='user_conversation_pair_uniq'),
+            models.CheckConstraint(condition=models.Q(user_low__lte=models.F('user_high')),
+                                   name='user_conversation_pair_ordered'),
+        ]
+        indexes = [
+            # 收件箱：user_low=u / user_high=u 两边各走一个索引范围扫描
+            models.Index(fields=['user_low', '-last_message_at', '-id'], name='user_conv_low_inbox_idx'),
+            models.Index(fields=['user_high', '-last_message_at', '-id'], name='user_conv_high_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_low_id} <-> {self.user_high_id}'
+
+    def peer_id(self, user_id):
+        return self.user_high_id if self.user_low_id == user_id else self.user_low_id
+
+    def unread_for(self, user_id):
+        return self.low_unread if self.user_low_id == user_id else self.high_unread
+
+    def read_receipt_for(self, user_id):
+        """user_id 一侧的已读水位：{"read_up_to": 消息 id, "read_at": 时间}"""
+        if self.user_low_id == user_id:
+            return {'read_up_to': self.low_read_up_to, 'read_at': self.low_read_at}
+        return {'read_up_to': self.high_read_up_to, 'read_at': self.high_read_at}
+
+
+class UnreadCounter(models.Model):
+    """
+    每个用户一行的未读计数（通知按类型分列 + 私信），角标轮询只需按主键读一行。
+    由 apps/user/unread.py 在通知/私信的创建、已读、删除路径上增减；
+    reconcile_unread_counters 命令按实际数据修正偏差。
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='unread_counter')
+    # 通知：列名与 Notification.NOTIFICATION_TYPES 一一对应
+    reply = models.IntegerField(default=0)
+    mention = models.IntegerField(default=0)
+    friend_request = models.IntegerField(default=0)
+    system = models.IntegerField(default=0)
+    holiday_family_apply = models.IntegerField(default=0)
+    holiday_family_approve = models.IntegerField(default=0)
+    holiday_family_reject = models.IntegerField(default=0)
+    # 私信
+    messages = models.IntegerField(default=0)
+    system_messages = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Unread counter'
+        verbose_name_plural = 'Unread counters'
+
+    def __str__(self):
+        return f'{self.user_id} unread counters'
@@ -0,0 +1,103 @@
+# apps/user/notifications.py
+"""
+通知扇出：给一批用户写同一条通知。
+
+- 接收者可以是用户 queryset（按 id 分块读取，不一次性载入）或 id 列表；
+  每块一次 bulk_create，N 个接收者只需 N / chunk_size 次 INSERT。
+- notify(..., defer=True)：在事务提交后执行（请求回滚则不发），默认交给进程内后台线程，
+  请求不等待写库；NOTIFICATION_FANOUT_ASYNC=False 时在提交回调里同步执行（测试/管理命令）。
+- 单个接收者的通知（回复、审批结果等）也走这里，保证写入路径只有一处。
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import QuerySet
+
+from . import realtime, unread
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+
+
+def _recipient_ids(recipients, chunk_size):
+    if isinstance(recipients, QuerySet):
+        return recipients.order_by().values_list("id", flat=True).iterator(chunk_size=chunk_size)
+    return iter(recipients)
+
+
+def fan_out(recipients, *, exclude=None, chunk_size=CHUNK_SIZE, **fields) -> int:
+    """
+    立即为 recipients 中的每个用户创建一条通知（fields 为 Notification 的字段，如 title/content/
+    notification_type/from_user），返回写入条数；exclude 为要跳过的用户 id（如操作者本人）
+    """
+    exclude = set(exclude or ())
+    ids = (uid for uid in _recipient_ids(recipients, chunk_size) if uid not in exclude)
+    created = 0
+    while True:
+        chunk = list(islice(ids, chunk_size))
+        if not chunk:
+            return created
+        with transaction.atomic():
+            notes = Notification.objects.bulk_create([Notification(user_id=uid, **fields) for uid in chunk])
+            realtime.publish_notifications(notes)
+            # bulk_create 不发 post_save，未读计数在同一事务里批量累加
+            if not fields.get("is_read"):
+                field = unread.notification_field(fields.get("notification_type", "reply"))
+                unread.bump({uid: {field: 1} for uid in chunk})
+        created += len(chunk)
+
+
+# ============== 后台线程 ==============
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # 单线程即可：扇出本身是批量写，多线程只会增加锁竞争
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notify-fanout")
+        return _executor
+
+
+def _run(recipients, exclude, fields):
+    try:
+        fan_out(recipients, exclude=exclude, **fields)
+    except Exception:
+        logger.exception("Notification fan-out failed (%s)", fields.get("title"))
+    finally:
+        close_old_connections()
+
+
+def notify(recipients, *, exclude=None, defer=True, **fields):
+    """
+    给 recipients 发通知。defer=True（默认）时在当前事务提交后执行，异步与否由
+    NOTIFICATION_FANOUT_ASYNC 决定；defer=False 立即同步写入并返回条数
+    """
+    if not defer:
+        return fan_out(recipients, exclude=exclude, **fields)
+    if isinstance(recipients, QuerySet):
+        # queryset 在后台线程里才求值；去掉缓存结果，避免把已载入的对象带过去
+        recipients = recipients.all()
+    else:
+        recipients = list(recipients)
+
+    def submit():
+        if getattr(settings, "NOTIFICATION_FANOUT_ASYNC", True):
+            _get_executor().submit(_run, recipients, exclude, fields)
+        else:
+            fan_out(recipients, exclude=exclude, **fields)
+
+    transaction.on_commit(submit)
+
+
+def staff_users():
+    from django.contrib.auth import get_user_model
+    return get_user_model().objects.filter(is_staff=True, is_active=True)
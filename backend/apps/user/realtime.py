@@ -0,0 +1,226 @@
+# apps/user/realtime.py
+"""
+通知/私信的服务端推送，替代轮询 unread_count / 通知列表 / conversation。
+
+GET /user/events/（JWT 放 Authorization 头；EventSource 不能设头时先 POST /user/events/ticket/
+换一张一次性、EVENT_STREAM_TICKET_TTL 秒内有效的票据，再用 ?ticket= 连接。
+access token 不出现在 URL 里，也就不会被写进访问日志）：
+- Accept: text/event-stream -> SSE 长连接。先推一条 {"type": "unread", "counts": {...}} 作为基准，
+  之后推 notification / message / read（已读回执）/ unread（增量 delta 或清零 reset）/ resync 事件，
+  空闲时每 EVENT_STREAM_HEARTBEAT 秒发注释行保活；access token 过期时服务端结束流，客户端换 token 重连。
+- 其他（或 ?mode=poll）-> 长轮询：最多等 EVENT_LONG_POLL_TIMEOUT 秒，返回
+  {"events": [...], "cursor": "...", "unread": {...}}，未读数以每次返回的快照为准。
+  下一次轮询带上 ?cursor=，两次轮询之间的事件从本进程的 backlog 补发；游标来自别的 worker、
+  已过期或中间事件已被挤出时，先返回一条 resync，客户端需重新拉取列表。
+
+JWT 只在建立连接时校验一次。连接挂在 asyncio 协程上，需以 ASGI 方式部署
+（gunicorn -k uvicorn.workers.UvicornWorker server.asgi:application）；
+WSGI 下 SSE 退化为“收到第一批事件或超时即结束”的单次响应，由 EventSource 自动重连。
+"""
+import json
+import secrets
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import permissions
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from common import events
+from common.cache import SubsystemCache
+
+PREVIEW_LENGTH = 200
+TICKET_PREFIX = "stream-ticket:"
+
+# 票据必须删除后立即失效，用不走 L1 的 auth 缓存
+auth_cache = SubsystemCache("auth")
+
+
+# ============== 事件 ==============
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def notification_event(notification):
+    return {
+        "type": "notification",
+        "id": notification.pk,
+        "notification_type": notification.notification_type,
+        "title": notification.title,
+        "content": (notification.content or "")[:PREVIEW_LENGTH],
+        "from_user": notification.from_user_id,
+        "created_at": _isoformat(notification.created_at),
+    }
+
+
+def message_event(message):
+    return {
+        "type": "message",
+        "id": message.pk,
+        "sender": message.sender_id,
+        "content": message.content[:PREVIEW_LENGTH],
+        "is_system": message.is_system,
+        "created_at": _isoformat(message.created_at),
+    }
+
+
+def publish_notifications(notifications):
+    events.publish([([n.user_id], notification_event(n)) for n in notifications])
+
+
+def publish_message(message):
+    events.publish([([message.recipient_id], message_event(message))])
+
+
+def publish_read_receipt(sender_id, reader_id, read_up_to, read_at):
+    """reader_id 已读到 sender_id 发出的 read_up_to（含）为止的消息"""
+    events.publish([([sender_id], {
+        "type": "read", "reader": reader_id, "read_up_to": read_up_to, "read_at": _isoformat(read_at),
+    })])
+
+
+def publish_unread(deltas):
+    """deltas: {user_id: {字段: 增量}}；增量相同的用户合并成一条消息（扇出时整块只有一条）"""
+    groups = {}
+    for user_id, fields in deltas.items():
+        delta = {f: n for f, n in fields.items() if n}
+        if delta:
+            groups.setdefault(tuple(sorted(delta.items())), []).append(user_id)
+    events.publish([(user_ids, {"type": "unread", "delta": dict(key)}) for key, user_ids in groups.items()])
+
+
+def publish_unread_reset(user_id, fields):
+    events.publish([([user_id], {"type": "unread", "reset": list(fields)})])
+
+
+# ============== 连接 ==============
+class StreamTicketView(APIView):
+    """POST /user/events/ticket/：为 EventSource 换一张一次性票据（?ticket=），到期时间不晚于 access token"""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        ttl = getattr(settings, "EVENT_STREAM_TICKET_TTL", 30)
+        ticket = secrets.token_urlsafe(24)
+        expires_at = request.auth.get("exp", time.time() + 3600)
+        auth_cache.set(TICKET_PREFIX + ticket, {"user_id": request.user.pk, "exp": expires_at}, ttl)
+        return Response({"ticket": ticket, "expires_in": ttl})
+
+
+def _redeem_ticket(ticket):
+    """票据只能用一次：取到后删除成功的一方才算数。返回 (user, 过期时间戳)"""
+    key = TICKET_PREFIX + ticket
+    data = auth_cache.get(key)
+    if data is None or not auth_cache.delete(key):
+        return None, None
+    user = get_user_model().objects.filter(pk=data["user_id"], is_active=True).first()
+    return (user, data["exp"]) if user is not None else (None, None)
+
+
+def _authenticate(request):
+    """返回 (user, 过期时间戳)；无效时 (None, None)"""
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw = auth.get_raw_token(header) if header else None
+    if not raw:
+        ticket = request.GET.get("ticket")
+        return _redeem_ticket(ticket) if ticket else (None, None)
+    try:
+        token = auth.get_validated_token(raw)
+        user = auth.get_user(token)
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None, None
+    return user, token.get("exp", time.time() + 3600)
+
+
+def _frame(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _snapshot(user_id):
+    from . import unread
+    return await sync_to_async(unread.counts)(user_id)
+
+
+async def _sse(user_id, expires_at, once):
+    heartbeat = getattr(settings, "EVENT_STREAM_HEARTBEAT", 25)
+    # 先订阅再取快照：快照之前已排队的增量都已提交、已计入快照，丢弃即可
+    sub = events.subscribe(user_id)
+    try:
+        yield "retry: 3000\n\n"
+        yield _frame({"type": "unread", "counts": await _snapshot(user_id)})
+        for event in sub.drain():
+            if event["type"] != "unread":
+                yield _frame(event)
+        if once:
+            for event in await sub.get_batch(min(heartbeat, max(0, expires_at - time.time()))):
+                yield _frame(event)
+            return
+        while True:
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                return
+            event = await sub.get(min(heartbeat, remaining))
+            yield ": ping\n\n" if event is None else _frame(event)
+    finally:
+        sub.close()
+
+
+def _cursor_seq(cursor, backlog):
+    """游标 "token:序号" 属于这个 backlog 时返回序号，否则 None"""
+    token, _, seq = (cursor or "").partition(":")
+    return int(seq) if token == backlog.token and seq.isdigit() else None
+
+
+async def _long_poll(user_id, expires_at, cursor):
+    timeout = min(getattr(settings, "EVENT_LONG_POLL_TIMEOUT", 25), max(0, expires_at - time.time()))
+    # 订阅只用来唤醒；事件一律从 backlog 按序号取，两次轮询之间到达的也不会丢
+    sub = events.subscribe(user_id)
+    try:
+        backlog = events.backlog(user_id)
+        seq = _cursor_seq(cursor, backlog)
+        # 带了游标却续不上（别的 worker / 已过期）：从当前位置开始，先让客户端 resync
+        resync = bool(cursor) and seq is None
+        if seq is None:
+            seq = backlog.seq
+        found = events.broker.since(backlog, seq)
+        if found == [] and not resync:
+            await sub.get_batch(timeout)
+            found = events.broker.since(backlog, seq)
+        if found is None:
+            resync, seq, found = True, backlog.seq, []
+    finally:
+        sub.close()
+    if found:
+        seq = found[-1][0]
+    found = [event for _, event in found]
+    if resync:
+        found.insert(0, events.RESYNC)
+    return JsonResponse({"events": found, "cursor": f"{backlog.token}:{seq}", "unread": await _snapshot(user_id)})
+
+
+async def event_stream(request):
+    if request.method != "GET":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
+    user, expires_at = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided or are invalid"}, status=401)
+
+    if request.GET.get("mode") == "poll" or "text/event-stream" not in request.headers.get("Accept", ""):
+        return await _long_poll(user.pk, expires_at, request.GET.get("cursor"))
+
+    response = StreamingHttpResponse(
+        _sse(user.pk, expires_at, once=not isinstance(request, ASGIRequest)),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    # 关闭 nginx 的响应缓冲，事件立即下发
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -9,10 +9,13 @@ logger = logging.getLogger(__name__)
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework.permissions import AllowAny
-from django.core.cache import cache
-from .models import Notification, Friendship, PrivateMessage
+from common.cache import SubsystemCache
+from .avatar_utils import default_avatar_url, user_avatar_url
+from .models import Notification, Friendship, PrivateMessage, Conversation
 
 User = get_user_model()
+# 验证码 / 邮箱验证码
+auth_cache = SubsystemCache('auth')
 
 
 def get_token_for_user(user):
@@ -35,15 +38,14 @@ class VerifyEmailCodeSerializer(serializers.Serializer):
 
     def validate(self, attrs):
         attrs = super().validate(attrs)
-        from django.core.cache import cache
-        item_code = cache.get(attrs['email'])
+        item_code = auth_cache.get(attrs['email'])
         if not item_code:
             raise serializers.ValidationError('Verification code expired!')
         # 大小写不敏感比较验证码
         if item_code.lower() != attrs['code'].lower():
             raise serializers.ValidationError('Code wrong!')
         # 验证码验证成功后，删除它以防止重复使用
-        cache.delete(attrs['email'])
+        auth_cache.delete(attrs['email'])
         return attrs
     
 class UserMeSerializer(serializers.ModelSerializer):
@@ -124,6 +126,9 @@ class UserMeSerializer(serializers.ModelSerializer):
             request = self.context.get('request')
             if request:
                 data['avatar'] = request.build_absolute_uri(data['avatar'])
+        elif 'avatar' in data and instance.pk:
+            # 没有自定义头像：指向默认头像接口（共享缓存渲染，不落用户文件）
+            data['avatar'] = default_avatar_url(instance.pk, self.context.get('request'))
         return data
 
 class RegisterSerializer(VerifyEmailCodeSerializer, serializers.ModelSerializer):
@@ -193,6 +198,9 @@ class UserInfoSerializer(serializers.ModelSerializer):
             request = self.context.get('request')
             if request:
                 data['avatar'] = request.build_absolute_uri(data['avatar'])
+        elif 'avatar' in data and instance.pk:
+            # 没有自定义头像：指向默认头像接口（共享缓存渲染，不落用户文件）
+            data['avatar'] = default_avatar_url(instance.pk, self.context.get('request'))
         return data
 
 
@@ -233,7 +241,7 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
             raise serializers.ValidationError("Repeat password incorrect!")
         validate_password(attrs["new_password"])  # 走 Django 密码强度校验
 
-        real = cache.get(attrs["email"])
+        real = auth_cache.get(attrs["email"])
         if not real:
             raise serializers.ValidationError("Verification code expired!")
         if real != attrs["code"]:
@@ -292,7 +300,6 @@ class CaptchaSerializer(serializers.Serializer):
     )
 
     def validate(self, attrs):
-        from django.core.cache import cache
         import logging
         
         logger = logging.getLogger(__name__)
@@ -300,7 +307,7 @@ class CaptchaSerializer(serializers.Serializer):
         captcha_input = attrs.get('captcha')
         
         # 检查缓存中是否存在验证码
-        cached_captcha = cache.get(uid)
+        cached_captcha = auth_cache.get(uid)
         
         logger.info(f"[CaptchaValidator] uid={uid}, input={captcha_input}, cached={bool(cached_captcha)}")
 
@@ -318,7 +325,7 @@ class CaptchaSerializer(serializers.Serializer):
             })
         
         logger.info(f"[CaptchaValidator] Verification code validated successfully for uid={uid}")
-        cache.delete(uid)
+        auth_cache.delete(uid)
         return super().validate(attrs)
 
 
@@ -354,6 +361,9 @@ class UserListSerializer(serializers.ModelSerializer):
             request = self.context.get('request')
             if request:
                 data['avatar'] = request.build_absolute_uri(data['avatar'])
+        elif 'avatar' in data and instance.pk:
+            # 没有自定义头像：指向默认头像接口（共享缓存渲染，不落用户文件）
+            data['avatar'] = default_avatar_url(instance.pk, self.context.get('request'))
         return data
 
 
@@ -434,6 +444,9 @@ class UserDetailSerializer(DynamicFieldsModelSerializer):
             request = self.context.get('request')
             if request:
                 data['avatar'] = request.build_absolute_uri(data['avatar'])
+        elif 'avatar' in data and instance.pk:
+            # 没有自定义头像：指向默认头像接口（共享缓存渲染，不落用户文件）
+            data['avatar'] = default_avatar_url(instance.pk, self.context.get('request'))
         return data
 
 
@@ -483,6 +496,32 @@ class NotificationSerializer(serializers.ModelSerializer):
         return result
 
 
+class BroadcastSerializer(serializers.Serializer):
+    """系统广播：title/content 必填，其余为接收人群筛选条件（都不填 = 全部活跃用户）"""
+    title = serializers.CharField(max_length=255)
+    content = serializers.CharField(allow_blank=True, required=False, default='')
+    user_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    is_staff = serializers.BooleanField(required=False, allow_null=True, default=None)
+    holiday_family_certified = serializers.BooleanField(required=False, allow_null=True, default=None)
+    joined_after = serializers.DateTimeField(required=False)
+    active_since = serializers.DateTimeField(required=False, help_text='last_login >= active_since')
+
+    def recipients(self):
+        data = self.validated_data
+        qs = User.objects.filter(is_active=True)
+        if data.get('user_ids'):
+            qs = qs.filter(id__in=data['user_ids'])
+        if data.get('is_staff') is not None:
+            qs = qs.filter(is_staff=data['is_staff'])
+        if data.get('holiday_family_certified') is not None:
+            qs = qs.filter(profile__is_holiday_family_certified=data['holiday_family_certified'])
+        if data.get('joined_after'):
+            qs = qs.filter(date_joined__gte=data['joined_after'])
+        if data.get('active_since'):
+            qs = qs.filter(last_login__gte=data['active_since'])
+        return qs
+
+
 class FriendshipSerializer(serializers.ModelSerializer):
     """好友关系序列化器"""
     from_user = serializers.SerializerMethodField()
@@ -517,29 +556,56 @@ class PrivateMessageSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'read_at', 'is_read', 'is_system']
     
     def get_sender(self, obj):
-        avatar_url = None
-        if obj.sender.profile and obj.sender.profile.avatar:
-            avatar_url = obj.sender.profile.avatar.url
-            request = self.context.get('request')
-            if request:
-                avatar_url = request.build_absolute_uri(avatar_url)
-        
         return {
             'id': obj.sender.id,
             'username': obj.sender.username,
-            'avatar': avatar_url
+            'avatar': user_avatar_url(obj.sender, self.context.get('request'))
         }
     
     def get_recipient(self, obj):
-        avatar_url = None
-        if obj.recipient.profile and obj.recipient.profile.avatar:
-            avatar_url = obj.recipient.profile.avatar.url
-            request = self.context.get('request')
-            if request:
-                avatar_url = request.build_absolute_uri(avatar_url)
-        
         return {
             'id': obj.recipient.id,
             'username': obj.recipient.username,
-            'avatar': avatar_url
+            'avatar': user_avatar_url(obj.recipient, self.context.get('request'))
         }
+
+
+class ConversationSerializer(serializers.ModelSerializer):
+    """收件箱里的一个会话（context 需带 request，按当前用户取对方和未读数）"""
+    peer = serializers.SerializerMethodField()
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
+    peer_read_receipt = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'peer', 'last_message', 'last_message_at', 'unread_count', 'peer_read_receipt']
+
+    def _user_id(self):
+        return self.context['request'].user.id
+
+    def get_peer(self, obj):
+        peer = obj.user_high if obj.user_low_id == self._user_id() else obj.user_low
+        return {'id': peer.id, 'username': peer.username, 'avatar': user_avatar_url(peer, self.context.get('request'))}
+
+    def get_last_message(self, obj):
+        message = obj.last_message
+        if message is None:
+            return None
+        return {
+            'id': message.id,
+            'sender_id': message.sender_id,
+            'content': message.content[:200],
+            'is_read': message.is_read,
+            'is_system': message.is_system,
+            'created_at': serializers.DateTimeField().to_representation(message.created_at),
+        }
+
+    def get_unread_count(self, obj):
+        return max(0, obj.unread_for(self._user_id()))
+
+    def get_peer_read_receipt(self, obj):
+        """对方已读到的（我发出的）消息 id 与时间"""
+        receipt = obj.read_receipt_for(obj.peer_id(self._user_id()))
+        receipt['read_at'] = serializers.DateTimeField().to_representation(receipt['read_at']) if receipt['read_at'] else None
+        return receipt
@@ -1,21 +1,19 @@
 # apps/user/signals.py
 import logging
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
 from django.dispatch import receiver
 from django.conf import settings
-from .models import UserProfile, Friendship, Notification
-from .avatar_utils import generate_default_avatar
+from .models import UserProfile, Friendship, Notification, PrivateMessage
+from . import conversations, realtime, unread
+from .notifications import notify
 
 logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_profile(sender, instance, created, **kwargs):
     if created:
-        profile, _ = UserProfile.objects.get_or_create(user=instance)
-        # Generate and save default avatar if not already set
-        if not profile.avatar:
-            default_avatar = generate_default_avatar(instance.username)
-            profile.avatar.save(f'{instance.username}_avatar.png', default_avatar, save=True)
+        # 不再为每个用户生成头像文件：avatar 为空时序列化器返回 /user/avatars/{id}/default/
+        UserProfile.objects.get_or_create(user=instance)
 
 
 @receiver(post_save, sender=Friendship)
@@ -24,9 +22,9 @@ def create_friend_request_notification(sender, instance, created, **kwargs):
     try:
         if created and instance.status == 'pending':
             logger.info(f'Creating notification for friend request from {instance.from_user.username} to {instance.to_user.username}')
-            # 为接收方创建通知
-            notification = Notification.objects.create(
-                user=instance.to_user,
+            # 为接收方创建通知（提交后写入）
+            notify(
+                [instance.to_user_id],
                 notification_type='friend_request',
                 title=f'{instance.from_user.username} sent a friend request',
                 content=f'{instance.from_user.username} wants to add you as a friend',
@@ -34,6 +32,70 @@ def create_friend_request_notification(sender, instance, created, **kwargs):
                 friendship=instance,
                 is_read=False
             )
-            logger.info(f'Notification created successfully: {notification.id}')
     except Exception as e:
         logger.error(f'Error creating friend request notification: {str(e)}', exc_info=True)
+
+
+# ============== 未读计数 ==============
+def _unread_target(instance):
+    """(计数所属用户, 计数字段)"""
+    if isinstance(instance, Notification):
+        return instance.user_id, unread.notification_field(instance.notification_type)
+    return instance.recipient_id, unread.message_field(instance.is_system)
+
+
+@receiver(post_init, sender=Notification)
+@receiver(post_init, sender=PrivateMessage)
+def remember_read_state(sender, instance, **kwargs):
+    instance._was_read = instance.__dict__.get('is_read')
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_save, sender=PrivateMessage)
+def update_unread_counter(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    was_read = True if created else instance._was_read
+    instance._was_read = instance.is_read
+    if was_read == instance.is_read:
+        return
+    user_id, field = _unread_target(instance)
+    unread.bump_one(user_id, field, -1 if instance.is_read else 1)
+    if sender is PrivateMessage and not created:
+        conversations.bump_unread(instance, -1 if instance.is_read else 1)
+
+
+@receiver(post_save, sender=PrivateMessage)
+def update_conversation(sender, instance, created, raw=False, **kwargs):
+    # 会话摘要：最后一条消息 + 接收方未读（apps/user/conversations.py）
+    if created and not raw:
+        conversations.record_message(instance)
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_save, sender=PrivateMessage)
+def push_created(sender, instance, created, raw=False, **kwargs):
+    # 提交后推送给在线的接收者（apps/user/realtime.py）
+    if not created or raw:
+        return
+    if isinstance(instance, Notification):
+        realtime.publish_notifications([instance])
+    else:
+        realtime.publish_message(instance)
+
+
+@receiver(pre_delete, sender=Notification)
+@receiver(pre_delete, sender=PrivateMessage)
+def remember_read_state_before_delete(sender, instance, **kwargs):
+    # instance.delete() 用的可能是过期的内存对象（别处已标记已读），以库里的状态为准
+    instance._was_read = sender.objects.filter(pk=instance.pk).values_list('is_read', flat=True).first()
+
+
+@receiver(post_delete, sender=Notification)
+@receiver(post_delete, sender=PrivateMessage)
+def decrement_unread_counter_on_delete(sender, instance, **kwargs):
+    if instance._was_read is False:
+        user_id, field = _unread_target(instance)
+        unread.decrement(user_id, field)
+    if sender is PrivateMessage:
+        conversations.forget_message(instance, was_unread=instance._was_read is False)
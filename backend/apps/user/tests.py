@@ -1,3 +1,403 @@
-from django.test import TestCase
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from common.bloom import BloomFilter
+from .models import Notification, ViewStatistics
+from . import avatar_utils
+from .view_counter import ViewCounter, view_counter
+
+
+class BloomFilterTest(TestCase):
+    def test_add_and_contains(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        self.assertTrue(bloom.add('a'))
+        self.assertFalse(bloom.add('a'))
+        self.assertIn('a', bloom)
+        false_positives = sum(1 for i in range(1000) if f'x{i}' in bloom)
+        self.assertLess(false_positives, 50)
+
+    def test_scalable_filter_keeps_error_rate_past_capacity(self):
+        from common.bloom import ScalableBloomFilter
+        bloom = ScalableBloomFilter(capacity=1000, error_rate=0.01)
+        # 5 倍容量的不同元素：固定大小的过滤器此时几乎把所有新元素都当成“见过”
+        accepted = sum(bloom.add(f'v{i}') for i in range(5000))
+        self.assertGreater(accepted, 4900)
+        self.assertGreater(len(bloom.filters), 1)
+        self.assertFalse(bloom.add('v42'))
+        false_positives = sum(1 for i in range(2000) if f'new{i}' in bloom)
+        self.assertLess(false_positives, 60)
+
+
+@override_settings(VIEW_COUNTER_AUTOFLUSH=False)
+class ViewCounterTest(TestCase):
+    def setUp(self):
+        self.obj = get_user_model().objects.create_user(username='reader', password='pass')
+        self.ct = ContentType.objects.get_for_model(self.obj)
+
+    def test_dedupes_and_flushes_with_upsert(self):
+        counter = ViewCounter(flush_interval=3600, max_pending=100)
+        for uid in ('u1', 'u2', 'u1', 'u3'):
+            counter.record(uid, self.ct.id, self.obj.id, '2026-10-17')
+        self.assertFalse(ViewStatistics.objects.exists())
+        self.assertEqual(counter.pending_count(self.ct.id, self.obj.id), 3)
+
+        self.assertEqual(counter.flush(), 1)
+        counter.record('u4', self.ct.id, self.obj.id, '2026-10-17')
+        counter.flush()
+        row = ViewStatistics.objects.get(content_type=self.ct, object_id=self.obj.id)
+        self.assertEqual(row.count, 4)
+
+    def test_flushes_on_interval_without_further_records(self):
+        counter = ViewCounter(flush_interval=3600, max_pending=100)
+        counter.last_flush -= 3600
+        with mock.patch.object(counter, 'flush', side_effect=SystemExit) as flush, \
+                mock.patch('apps.user.view_counter.close_old_connections'):
+            with self.assertRaises(SystemExit):  # 停在第一次定时刷盘
+                counter._flush_forever()
+        flush.assert_called_once_with()
+
+    def test_increase_goes_through_buffer(self):
+        view_counter.flush()
+        ViewStatistics.increase(SimpleNamespace(uid='abc'), self.obj)
+        ViewStatistics.increase(SimpleNamespace(uid='abc'), self.obj)
+        view_counter.flush()
+        self.assertEqual(ViewStatistics.get_view_count(self.obj), 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DefaultAvatarTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='avatar_user', password='pass')
+
+    def test_no_per_user_file_and_url_points_to_default(self):
+        self.assertFalse(self.user.profile.avatar)
+        self.assertEqual(avatar_utils.get_avatar_url(self.user), f'/user/avatars/{self.user.pk}/default/')
+
+    def test_message_serializer_falls_back_to_default_avatar(self):
+        from .models import PrivateMessage
+        from .serializer import PrivateMessageSerializer
+
+        other = get_user_model().objects.create_user(username='avatar_peer', password='pass')
+        msg = PrivateMessage.objects.create(sender=other, recipient=self.user, content='hi')
+        data = PrivateMessageSerializer(msg).data
+        self.assertEqual(data['sender']['avatar'], f'/user/avatars/{other.pk}/default/')
+        self.assertEqual(data['recipient']['avatar'], f'/user/avatars/{self.user.pk}/default/')
+
+    def test_serves_cached_sizes_with_etag(self):
+        url = reverse('user:avatar-default', args=[self.user.pk])
+        with mock.patch.object(avatar_utils, '_render', wraps=avatar_utils._render) as render:
+            resp = self.client.get(url, {'size': 100})
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp['Content-Type'], 'image/png')
+            self.assertEqual(Image.open(BytesIO(resp.content)).size, (128, 128))
+
+            # 首字母和颜色相同的用户（'av' + 同一色号）共用同一张缓存图
+            twin = next(f'av{i}' for i in range(100)
+                        if avatar_utils.avatar_color(f'av{i}') == avatar_utils.avatar_color('avatar_user'))
+            self.assertEqual(avatar_utils.render_default_avatar(twin, 128), resp.content)
+            self.assertEqual(render.call_count, 1)
+
+            self.assertEqual(self.client.get(url, {'size': 128}, HTTP_IF_NONE_MATCH=resp['ETag']).status_code, 304)
+            self.assertEqual(Image.open(BytesIO(self.client.get(url).content)).size, (200, 200))
+            self.assertEqual(render.call_count, 2)
+
+        self.assertEqual(self.client.get(reverse('user:avatar-default', args=[999999])).status_code, 404)
+
+
+@override_settings(NOTIFICATION_FANOUT_ASYNC=False)
+class NotificationFanOutTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user(username='boss', password='pass', is_staff=True)
+        self.users = [User.objects.create_user(username=f'fan{i}', password='pass') for i in range(5)]
+
+    def test_fan_out_inserts_in_chunks(self):
+        from .notifications import fan_out
+        ids = [u.id for u in self.users]
+        # 5 个接收者、每块 2 个：3 块，每块 SAVEPOINT + INSERT + 未读计数 upsert + RELEASE，无逐条往返
+        with self.assertNumQueries(12):
+            self.assertEqual(fan_out(ids, chunk_size=2, notification_type='system', title='hi'), 5)
+        self.assertEqual(Notification.objects.filter(title='hi').count(), 5)
+
+    def test_broadcast_to_cohort_after_commit(self):
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = reverse('user:notification-broadcast')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = client.post(url, {'title': 'Maintenance', 'content': 'tonight', 'is_staff': False}, format='json')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.data['recipients'], 5)
+        notes = Notification.objects.filter(title='Maintenance')
+        self.assertEqual(sorted(notes.values_list('user_id', flat=True)), sorted(u.id for u in self.users))
+        self.assertTrue(all(n.notification_type == 'system' and n.from_user_id == self.admin.id for n in notes))
+
+        client.force_authenticate(self.users[0])
+        self.assertEqual(client.post(url, {'title': 'x'}, format='json').status_code, 403)
+
+
+@override_settings(NOTIFICATION_FANOUT_ASYNC=False)
+class UnreadCounterTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        User = get_user_model()
+        self.user = User.objects.create_user(username='reader1', password='pass')
+        self.other = User.objects.create_user(username='writer1', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _badge(self):
+        return self.client.get(reverse('user:notification-unread-count')).data
+
+    def test_single_create_commits_with_its_counter_bump(self):
+        from django.db import DatabaseError
+        from . import unread
+        with mock.patch.object(unread, 'bump', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                Notification.objects.create(user=self.user, notification_type='reply', title='lost')
+        self.assertFalse(Notification.objects.filter(title='lost').exists())
+
+    def test_counters_follow_create_read_delete(self):
+        from .models import PrivateMessage
+        from .notifications import fan_out
+        fan_out([self.user.id], notification_type='system', title='a')
+        fan_out([self.user.id], notification_type='reply', title='b')
+        note = Notification.objects.create(user=self.user, notification_type='reply', title='c')
+        PrivateMessage.objects.create(sender=self.other, recipient=self.user, content='hi')
+
+        # 角标只读一行计数
+        with self.assertNumQueries(1):
+            from . import unread
+            unread.counts(self.user.id)
+        badge = self._badge()
+        self.assertEqual(badge['unread_count'], 3)
+        self.assertEqual(badge['by_type']['reply'], 2)
+        self.assertEqual(badge['messages'], 1)
+
+        self.client.post(reverse('user:notification-mark-as-read', args=[note.pk]))
+        self.assertEqual(self._badge()['by_type']['reply'], 1)
+        note.delete()  # 已读的删除不影响计数
+        self.assertEqual(self._badge()['unread_count'], 2)
+
+        self.client.post(reverse('user:notification-mark-all-as-read'))
+        badge = self._badge()
+        self.assertEqual(badge['unread_count'], 0)
+        self.assertEqual(badge['messages'], 1)
+
+        msg = PrivateMessage.objects.get(recipient=self.user)
+        self.client.post(reverse('user:message-mark-as-read', args=[msg.pk]))
+        self.assertEqual(self.client.get(reverse('user:message-unread-count')).data['unread_count'], 0)
+
+    def test_reconcile_repairs_drift(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import UnreadCounter
+        Notification.objects.create(user=self.user, notification_type='mention', title='m')
+        UnreadCounter.objects.filter(user=self.user).update(mention=7, messages=-2)
+
+        out = StringIO()
+        call_command('reconcile_unread_counters', stdout=out)
+        self.assertIn('mention 7->1', out.getvalue())
+        self.assertIn('Repaired 1 drifted', out.getvalue())
+        self.assertEqual(self._badge()['by_type']['mention'], 1)
+        self.assertEqual(self._badge()['messages'], 0)
+
+
+@override_settings(EVENT_BACKEND='common.events.LocalBackend', NOTIFICATION_FANOUT_ASYNC=False,
+                   EVENT_LONG_POLL_TIMEOUT=5, EVENT_STREAM_HEARTBEAT=5)
+class EventStreamTest(TransactionTestCase):
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        User = get_user_model()
+        self.user = User.objects.create_user(username='listener', password='pass')
+        self.other = User.objects.create_user(username='talker', password='pass')
+        self.token = str(AccessToken.for_user(self.user))
+
+    def _later(self, func):
+        import threading
+        from django.db import connection
+
+        def run():
+            try:
+                func()
+            finally:
+                connection.close()
+        timer = threading.Timer(0.3, run)
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def test_long_poll_wakes_on_notification(self):
+        from .notifications import fan_out
+        self._later(lambda: fan_out([self.user.id], notification_type='system', title='ping'))
+        resp = self.client.get(reverse('user:events'), {'mode': 'poll'}, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(resp.status_code, 200)
+        events = resp.json()['events']
+        self.assertEqual(events[0]['type'], 'notification')
+        self.assertEqual(events[0]['title'], 'ping')
+        self.assertEqual(resp.json()['unread']['notifications'], 1)
+        self.assertEqual(self.client.get(reverse('user:events'), {'mode': 'poll'}).status_code, 401)
+
+    def test_sse_pushes_message_and_unread_delta(self):
+        from .models import PrivateMessage
+        self._later(lambda: PrivateMessage.objects.create(sender=self.other, recipient=self.user, content='hello'))
+        ticket = self.client.post(reverse('user:events-ticket'), HTTP_AUTHORIZATION=f'Bearer {self.token}').json()['ticket']
+        resp = self.client.get(reverse('user:events'), {'ticket': ticket}, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(resp['Content-Type'], 'text/event-stream')
+        # WSGI 测试客户端同步消费异步流：单次模式收到第一批事件即结束
+        with self.assertWarnsRegex(Warning, 'asynchronous iterators'):
+            body = b''.join(resp).decode()
+        self.assertIn('event: unread\ndata: {"type": "unread", "counts"', body)
+        self.assertIn('"type": "message"', body)
+        self.assertIn('"content": "hello"', body)
+
+    def test_stream_ticket_is_single_use(self):
+        url = reverse('user:events')
+        self.assertEqual(self.client.post(reverse('user:events-ticket')).status_code, 401)
+        self.assertEqual(self.client.get(url, {'mode': 'poll', 'token': self.token}).status_code, 401)
+        ticket = self.client.post(reverse('user:events-ticket'), HTTP_AUTHORIZATION=f'Bearer {self.token}').json()['ticket']
+        with self.settings(EVENT_LONG_POLL_TIMEOUT=0.1):
+            self.assertEqual(self.client.get(url, {'mode': 'poll', 'ticket': ticket}).status_code, 200)
+            self.assertEqual(self.client.get(url, {'mode': 'poll', 'ticket': ticket}).status_code, 401)
+
+    def test_long_poll_cursor_replays_events_between_polls(self):
+        from .notifications import fan_out
+        url, auth = reverse('user:events'), {'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+        with self.settings(EVENT_LONG_POLL_TIMEOUT=0.1):
+            first = self.client.get(url, {'mode': 'poll'}, **auth).json()
+            self.assertEqual(first['events'], [])
+            # 两次轮询之间（没有挂起的请求）到达的通知
+            fan_out([self.user.id], notification_type='system', title='between')
+            second = self.client.get(url, {'mode': 'poll', 'cursor': first['cursor']}, **auth).json()
+            self.assertEqual([e['title'] for e in second['events'] if e['type'] == 'notification'], ['between'])
+            self.assertEqual(self.client.get(url, {'mode': 'poll', 'cursor': second['cursor']}, **auth).json()['events'], [])
+            # 续不上的游标（别的 worker / 已过期）：先 resync
+            stale = self.client.get(url, {'mode': 'poll', 'cursor': 'other:3'}, **auth).json()
+            self.assertEqual(stale['events'], [{'type': 'resync'}])
+
+    def test_postgres_payloads_fit_notify_limit(self):
+        import json
+        from common.events import PostgresBackend
+        backend = PostgresBackend()
+        ids = list(range(100000, 103000))
+        payloads = backend.pack([(ids, {'type': 'unread', 'delta': {'system': 1}}), ([1], {'type': 'resync'})])
+        self.assertGreater(len(payloads), 1)
+        self.assertTrue(all(len(p.encode()) <= backend.MAX_PAYLOAD for p in payloads))
+        messages = [m for p in payloads for m in json.loads(p)]
+        self.assertEqual(sorted(u for users, e in messages if e['type'] == 'unread' for u in users), ids)
+        self.assertEqual(messages[-1], [[1], {'type': 'resync'}])
+
+
+class ConversationTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        User = get_user_model()
+        self.me = User.objects.create_user(username='inbox_me', password='pass')
+        self.peers = [User.objects.create_user(username=f'inbox_peer{i}', password='pass') for i in range(3)]
+        self.client = APIClient()
+
+    def _send(self, sender, recipient, content):
+        from .models import PrivateMessage
+        return PrivateMessage.objects.create(sender=sender, recipient=recipient, content=content)
+
+    def test_inbox_summary_and_paging(self):
+        for i, peer in enumerate(self.peers):
+            self._send(peer, self.me, f'hi {i}')
+        self._send(self.me, self.peers[0], 'reply 0')
+        last = self._send(self.peers[0], self.me, 'again 0')
+
+        self.client.force_authenticate(self.me)
+        url = reverse('user:message-inbox')
+        resp = self.client.get(url, {'page_size': 2})
+        rows = resp.data['results']
+        self.assertEqual([r['peer']['id'] for r in rows], [self.peers[0].id, self.peers[2].id])
+        self.assertEqual(rows[0]['last_message']['content'], 'again 0')
+        self.assertEqual(rows[0]['unread_count'], 2)
+        older = self.client.get(resp.data['next']).data
+        self.assertEqual([r['peer']['id'] for r in older['results']], [self.peers[1].id])
+        self.assertIsNone(older['next'])
+
+        # 对方视角：同一行，未读数是对方自己的
+        self.client.force_authenticate(self.peers[0])
+        self.assertEqual(self.client.get(url).data['results'][0]['unread_count'], 1)
+
+        self.client.force_authenticate(self.me)
+        self.client.post(reverse('user:message-mark-as-read', args=[last.pk]))
+        self.assertEqual(self.client.get(url).data['results'][0]['unread_count'], 1)
+        last.delete()
+        self.assertEqual(self.client.get(url).data['results'][0]['last_message']['content'], 'reply 0')
+
+    def test_conversation_load_older(self):
+        for i in range(5):
+            self._send(self.peers[0], self.me, f'm{i}')
+        self.client.force_authenticate(self.me)
+        url = reverse('user:message-conversation')
+        page = self.client.get(url, {'user_id': self.peers[0].id, 'pagination': 'cursor', 'page_size': 3}).data
+        self.assertEqual([m['content'] for m in page['results']], ['m2', 'm3', 'm4'])
+        older = self.client.get(page['next']).data
+        self.assertEqual([m['content'] for m in older['results']], ['m0', 'm1'])
+        self.assertEqual(len(self.client.get(url, {'user_id': self.peers[0].id}).data['results']), 5)
+
+    def test_backfill_rebuilds_summaries(self):
+        from .conversations import backfill
+        from .models import Conversation
+        self._send(self.peers[0], self.me, 'a')
+        self._send(self.me, self.peers[0], 'b')
+        self._send(self.peers[1], self.me, 'c')
+        from .conversations import backfill_read_receipts, mark_read
+        mark_read(self.me.id, self.peers[0].id)
+        fields = ('user_low', 'user_high', 'last_message', 'low_unread', 'high_unread', 'low_read_up_to', 'high_read_up_to')
+        expected = sorted(Conversation.objects.values_list(*fields))
+        Conversation.objects.all().delete()
+        backfill()
+        backfill_read_receipts()
+        self.assertEqual(sorted(Conversation.objects.values_list(*fields)), expected)
+
+    def test_mark_conversation_read_in_one_update(self):
+        from .models import PrivateMessage
+        sent = [self._send(self.peers[0], self.me, f'n{i}') for i in range(4)]
+        self._send(self.peers[1], self.me, 'other')
+        self.client.force_authenticate(self.me)
+        url = reverse('user:message-mark-conversation-read')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            resp = self.client.post(url, {'user_id': self.peers[0].id, 'up_to_id': sent[2].pk}, format='json')
+        self.assertEqual(resp.data['marked'], 3)
+        self.assertEqual(resp.data['read_up_to'], sent[2].pk)
+        self.assertEqual(resp.data['conversation_unread'], 1)
+        self.assertEqual(resp.data['unread_count'], 2)
+        self.assertTrue(callbacks)
+        self.assertEqual(PrivateMessage.objects.filter(recipient=self.me, is_read=False).count(), 2)
+
+        # 发送方看到已读回执（水位），不需要逐条回执记录
+        self.client.force_authenticate(self.peers[0])
+        receipt = self.client.get(reverse('user:message-conversation'), {'user_id': self.me.id}).data['peer_read_receipt']
+        self.assertEqual(receipt['read_up_to'], sent[2].pk)
+        inbox = self.client.get(reverse('user:message-inbox')).data['results'][0]
+        self.assertEqual(inbox['peer_read_receipt']['read_up_to'], sent[2].pk)
+
+        self.client.force_authenticate(self.me)
+        resp = self.client.post(url, {'user_id': self.peers[0].id}, format='json')
+        self.assertEqual((resp.data['marked'], resp.data['unread_count'], resp.data['conversation_unread']), (1, 1, 0))
+        self.assertEqual(self.client.post(url, {'user_id': self.peers[0].id}, format='json').data['marked'], 0)
+        self.assertEqual(self.client.post(url, {'user_id': 'x'}, format='json').status_code, 400)
+
+    def test_single_read_does_not_move_watermark_past_unread(self):
+        from .conversations import read_receipt
+        sent = [self._send(self.peers[0], self.me, f'r{i}') for i in range(3)]
+        self.client.force_authenticate(self.me)
+        self.client.post(reverse('user:message-mark-as-read', args=[sent[2].pk]))
+        read_up_to = read_receipt(self.peers[0].id, self.me.id)['read_up_to']
+        self.assertLess(read_up_to, sent[0].pk)
+
+        self.client.post(reverse('user:message-mark-as-read', args=[sent[0].pk]))
+        self.assertEqual(read_receipt(self.peers[0].id, self.me.id)['read_up_to'], sent[1].pk - 1)
+        self.client.post(reverse('user:message-mark-as-read', args=[sent[1].pk]))
+        self.assertEqual(read_receipt(self.peers[0].id, self.me.id)['read_up_to'], sent[2].pk)
@@ -0,0 +1,185 @@
+# apps/user/unread.py
+"""
+未读计数（UnreadCounter）的维护与读取。
+
+- 单条通知/私信的创建、已读状态变化、删除由 signals 里的处理器调用 bump()；
+  Notification/PrivateMessage.save() 自带事务（AtomicSaveMixin），处理器与行写入一起提交；
+- 批量路径显式维护：fan_out 每块 bulk_create 后 bump()，全部已读走 reset()；
+- bump() 是一条 INSERT ... ON CONFLICT DO UPDATE SET col = col + n，与业务写入在同一事务内；
+- 每次变化在提交后推送 unread 事件（realtime.publish_unread），客户端在连接时的快照上累加；
+- 读取 counts()：缓存镜像（UNREAD_COUNTER_CACHE_TIMEOUT 秒，0 关闭）-> 主键读一行；
+  计数变化时在提交后删除对应缓存键。
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from common.db import upsert_increment
+
+from . import realtime
+from .models import UnreadCounter
+
+NOTIFICATION_FIELDS = (
+    "reply", "mention", "friend_request", "system",
+    "holiday_family_apply", "holiday_family_approve", "holiday_family_reject",
+)
+MESSAGE_FIELDS = ("messages", "system_messages")
+ALL_FIELDS = NOTIFICATION_FIELDS + MESSAGE_FIELDS
+
+CACHE_KEY = "unread:{}"
+
+
+def notification_field(notification_type: str) -> str:
+    # 未登记的类型（历史数据）计入 system
+    return notification_type if notification_type in NOTIFICATION_FIELDS else "system"
+
+
+def message_field(is_system: bool) -> str:
+    return "system_messages" if is_system else "messages"
+
+
+def _cache_timeout():
+    return getattr(settings, "UNREAD_COUNTER_CACHE_TIMEOUT", 0)
+
+
+def _invalidate(user_ids):
+    if _cache_timeout():
+        keys = [CACHE_KEY.format(uid) for uid in user_ids]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def bump(deltas):
+    """deltas: {user_id: {字段: 增量}}，一条语句累加所有用户的计数"""
+    rows = []
+    # 按 user_id 排序加锁，避免两批并发扇出互相等待死锁
+    for user_id, fields in sorted(deltas.items()):
+        row = dict.fromkeys(ALL_FIELDS, 0)
+        row.update(fields)
+        row["user_id"] = user_id
+        rows.append(row)
+    if not rows:
+        return
+    upsert_increment(UnreadCounter, rows, key_fields=["user_id"], increment_fields=ALL_FIELDS)
+    _invalidate(deltas)
+    realtime.publish_unread(deltas)
+
+
+def bump_one(user_id, field, delta=1):
+    bump({user_id: {field: delta}})
+
+
+def decrement(user_id, field):
+    """
+    删除路径专用：只 UPDATE 已有行，不 upsert。删除用户时级联先删掉计数行，
+    这里若再插入一行会在提交时违反外键
+    """
+    UnreadCounter.objects.filter(user_id=user_id).update(**{field: F(field) - 1})
+    _invalidate([user_id])
+    realtime.publish_unread({user_id: {field: -1}})
+
+
+def counter_deltas(pairs, delta=1):
+    """[(user_id, 字段)] -> bump() 需要的 {user_id: {字段: n}}"""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for user_id, field in pairs:
+        deltas[user_id][field] += delta
+    return deltas
+
+
+def lock(user_id):
+    """锁住计数行（不存在则先建），用于“先锁计数、再批量改已读、最后清零”的路径"""
+    UnreadCounter.objects.get_or_create(user_id=user_id)
+    return UnreadCounter.objects.select_for_update().get(user_id=user_id)
+
+
+def reset(user_id, fields):
+    """清零某用户的若干计数；调用方需在同一事务里先 lock()，再做批量已读"""
+    UnreadCounter.objects.filter(user_id=user_id).update(**dict.fromkeys(fields, 0))
+    _invalidate([user_id])
+    realtime.publish_unread_reset(user_id, fields)
+
+
+def counts(user_id) -> dict:
+    """{"notifications": 总数, "by_type": {...}, "messages": n, "system_messages": n}"""
+    timeout = _cache_timeout()
+    key = CACHE_KEY.format(user_id)
+    if timeout:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    row = UnreadCounter.objects.filter(user_id=user_id).values(*ALL_FIELDS).first() or dict.fromkeys(ALL_FIELDS, 0)
+    # 计数只会因并发边界短暂偏离，展示时不出现负数
+    row = {k: max(0, v) for k, v in row.items()}
+    by_type = {f: row[f] for f in NOTIFICATION_FIELDS}
+    result = {
+        "notifications": sum(by_type.values()),
+        "by_type": by_type,
+        "messages": row["messages"],
+        "system_messages": row["system_messages"],
+    }
+    if timeout:
+        cache.set(key, result, timeout)
+    return result
+
+
+def actual_counts(user_ids=None, notification_model=None, message_model=None) -> dict:
+    """按通知/私信表实际统计的未读数：{user_id: {字段: n}}（只含有未读的字段）"""
+    from django.db.models import Count
+    from .models import Notification, PrivateMessage
+
+    result = defaultdict(lambda: defaultdict(int))
+    notes = (notification_model or Notification).objects.filter(is_read=False)
+    messages = (message_model or PrivateMessage).objects.filter(is_read=False)
+    if user_ids is not None:
+        notes = notes.filter(user_id__in=user_ids)
+        messages = messages.filter(recipient_id__in=user_ids)
+    for row in notes.order_by().values("user_id", "notification_type").annotate(n=Count("id")):
+        result[row["user_id"]][notification_field(row["notification_type"])] += row["n"]
+    for row in messages.order_by().values("recipient_id", "is_system").annotate(n=Count("id")):
+        result[row["recipient_id"]][message_field(row["is_system"])] += row["n"]
+    return result
+
+
+def reconcile(user_ids=None, dry_run=False, lock=True, counter_model=None, notification_model=None, message_model=None):
+    """
+    用实际统计覆盖计数表中有偏差的行（含应为 0 的行），返回 [(user_id, {字段: (记录值, 实际值)})]。
+    lock=True 时每个受影响用户先锁计数行再重新统计，避免覆盖掉并发写入的增量；
+    lock=False（迁移回填等无并发场景）一次批量 upsert
+    """
+    counter_model = counter_model or UnreadCounter
+    actual = actual_counts(user_ids, notification_model, message_model)
+    stored = counter_model.objects.all()
+    if user_ids is not None:
+        stored = stored.filter(user_id__in=user_ids)
+    stored = {row["user_id"]: row for row in stored.values("user_id", *ALL_FIELDS)}
+
+    drift = []
+    for user_id in sorted(set(actual) | set(stored)):
+        want = {f: actual.get(user_id, {}).get(f, 0) for f in ALL_FIELDS}
+        have = stored.get(user_id) or dict.fromkeys(ALL_FIELDS, 0)
+        diff = {f: (have[f], want[f]) for f in ALL_FIELDS if have[f] != want[f]}
+        if diff:
+            drift.append((user_id, diff))
+    if dry_run or not drift:
+        return drift
+    if not lock:
+        counter_model.objects.bulk_create(
+            [counter_model(user_id=uid, **{f: want for f, (_, want) in diff.items()}) for uid, diff in drift],
+            update_conflicts=True, unique_fields=["user"], update_fields=ALL_FIELDS, batch_size=1000,
+        )
+        return drift
+
+    fixed = []
+    for user_id, _ in drift:
+        with transaction.atomic():
+            counter_model.objects.get_or_create(user_id=user_id)
+            counter_model.objects.select_for_update().filter(user_id=user_id).first()
+            want = {f: actual_counts([user_id], notification_model, message_model).get(user_id, {}).get(f, 0)
+                    for f in ALL_FIELDS}
+            counter_model.objects.filter(user_id=user_id).update(**want)
+            _invalidate([user_id])
+        fixed.append(user_id)
+    return [(uid, diff) for uid, diff in drift if uid in fixed]
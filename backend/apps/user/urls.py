@@ -7,7 +7,7 @@ from rest_framework_simplejwt.views import (
 )
 from collections import OrderedDict
 from rest_framework.reverse import reverse
-from . import views
+from . import realtime, views
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -124,6 +124,17 @@ urlpatterns = [
         views.UserMeView.as_view(),
         name='user-me'
     ),
+    # 服务端推送（SSE / 长轮询），异步视图
+    path(
+        'events/',
+        realtime.event_stream,
+        name='events'
+    ),
+    path(
+        'events/ticket/',
+        realtime.StreamTicketView.as_view(),
+        name='events-ticket'
+    ),
     # 测试端点 - 纯 Django View
     path(
         'test-notifications/',
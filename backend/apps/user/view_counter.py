@@ -0,0 +1,186 @@
+# apps/user/view_counter.py
+"""
+ViewStatistics 的写后缓冲（write-behind）。
+
+- 去重：每天一个布隆过滤器判断 (uid, 对象) 今天是否已计数，取代逐条 uid:日期:对象 的缓存键；
+  过滤器在进程内，同一访客落到不同 worker 时可能多计一次，假阳性（约 1%）会少计一次。
+  过滤器按天轮换；当天访客超过 BLOOM_CAPACITY 时自动扩容（ScalableBloomFilter），误判率不随之上升。
+- 累加：增量先在进程内按 (content_type, object_id, date) 合并，满 MAX_PENDING 个键时立即刷盘；
+  另有一个首次 record() 时懒启动的守护线程每 FLUSH_INTERVAL 秒刷一次，空闲 worker 的缓冲也不会滞留。
+  刷盘用一条 INSERT ... ON CONFLICT DO UPDATE count = count + EXCLUDED.count 批量写入，热门文章不再争同一行锁。
+- 同一事务里把增量也累加进每对象一行的 ViewTotal（total / last_7d / last_30d）；
+  窗口值的“滑出”由 rollup_view_totals（rollup_view_totals 命令，建议每天运行）按 ViewStatistics 重算。
+- 进程退出时 atexit 再刷一次；写库失败的增量并回缓冲，下次重试。
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from common.bloom import ScalableBloomFilter
+from common.db import upsert_increment
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    def __init__(self, flush_interval=None, max_pending=None, bloom_capacity=None, bloom_error_rate=0.01):
+        self.flush_interval = flush_interval if flush_interval is not None else getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 10)
+        self.max_pending = max_pending if max_pending is not None else getattr(settings, 'VIEW_COUNTER_MAX_PENDING', 1000)
+        self.bloom_capacity = bloom_capacity or getattr(settings, 'VIEW_COUNTER_BLOOM_CAPACITY', 200_000)
+        self.bloom_error_rate = bloom_error_rate
+        self.pending = {}  # (content_type_id, object_id, date) -> 增量
+        self.blooms = {}  # date -> BloomFilter
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """懒启动定时刷盘线程；VIEW_COUNTER_AUTOFLUSH=False 时不启动（测试/管理命令显式 flush）"""
+        if not getattr(settings, 'VIEW_COUNTER_AUTOFLUSH', True):
+            return
+        with self.lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._flush_forever, name='view-counter-flush', daemon=True)
+                self._thread.start()
+
+    def _flush_forever(self):
+        while True:
+            # 因 MAX_PENDING 刚刷过盘时顺延，两次刷盘至少间隔 flush_interval
+            wait = self.flush_interval - (time.monotonic() - self.last_flush)
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('View counter background flush failed')
+            finally:
+                close_old_connections()
+
+    def _bloom(self, date):
+        bloom = self.blooms.get(date)
+        if bloom is None:
+            bloom = self.blooms[date] = ScalableBloomFilter(self.bloom_capacity, self.bloom_error_rate)
+            # 只保留当天和前一天（跨零点的请求）
+            for old in sorted(self.blooms)[:-2]:
+                del self.blooms[old]
+        return bloom
+
+    def record(self, uid, content_type_id, object_id, date) -> bool:
+        """记录一次浏览；同一 uid 当天对同一对象只计一次。返回是否计数"""
+        if self._thread is None:
+            self.start()
+        with self.lock:
+            if not self._bloom(date).add(f'{uid}:{content_type_id}:{object_id}'):
+                return False
+            key = (content_type_id, object_id, date)
+            self.pending[key] = self.pending.get(key, 0) + 1
+            due = len(self.pending) >= self.max_pending
+        if due:
+            self.flush()
+        return True
+
+    def pending_count(self, content_type_id, object_id):
+        """尚未落库的增量，读浏览量时加上，保证自己刚看过的文章计数不“倒退”"""
+        with self.lock:
+            return sum(n for (ct, oid, _), n in self.pending.items() if ct == content_type_id and oid == object_id)
+
+    def flush(self) -> int:
+        """把缓冲写入数据库；返回写入的键数"""
+        from .models import ViewStatistics, ViewTotal
+
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+                self.last_flush = time.monotonic()
+            if not batch:
+                return 0
+            rows = [
+                {'content_type_id': ct, 'object_id': oid, 'date': date, 'count': n}
+                for (ct, oid, date), n in batch.items()
+            ]
+            totals = {}
+            for (ct, oid, _), n in batch.items():
+                totals[(ct, oid)] = totals.get((ct, oid), 0) + n
+            total_rows = [
+                {'content_type_id': ct, 'object_id': oid, 'total': n, 'last_7d': n, 'last_30d': n}
+                for (ct, oid), n in totals.items()
+            ]
+            try:
+                with transaction.atomic():
+                    upsert_increment(
+                        ViewStatistics, rows,
+                        key_fields=('content_type_id', 'object_id', 'date'), increment_fields=('count',),
+                    )
+                    upsert_increment(
+                        ViewTotal, total_rows,
+                        key_fields=('content_type_id', 'object_id'), increment_fields=('total', 'last_7d', 'last_30d'),
+                    )
+            except Exception:
+                logger.exception('Failed to flush %d view counter rows; will retry', len(rows))
+                with self.lock:
+                    for key, n in batch.items():
+                        self.pending[key] = self.pending.get(key, 0) + n
+                return 0
+            return len(rows)
+
+
+view_counter = ViewCounter()
+
+
+def rollup_view_totals(*, full=False, today=None, stats_model=None, totals_model=None):
+    """
+    按 ViewStatistics 重算 ViewTotal 的 7/30 天窗口（full=True 时连 total 一起重建）。
+    只扫描最近 30 天的统计行；迁移里传入历史模型。返回写入的行数。
+    """
+    if stats_model is None or totals_model is None:
+        from .models import ViewStatistics, ViewTotal
+        stats_model, totals_model = stats_model or ViewStatistics, totals_model or ViewTotal
+
+    today = today or timezone.now().date()
+    since_7 = today - timedelta(days=6)
+    since_30 = today - timedelta(days=29)
+    stats = stats_model.objects.all() if full else stats_model.objects.filter(date__gte=since_30)
+    agg = (
+        stats.values('content_type_id', 'object_id')
+        .annotate(
+            total=Sum('count'),
+            d7=Sum('count', filter=Q(date__gte=since_7)),
+            d30=Sum('count', filter=Q(date__gte=since_30)),
+        )
+        .order_by()
+    )
+    rows = [
+        totals_model(
+            content_type_id=r['content_type_id'], object_id=r['object_id'],
+            total=r['total'] or 0, last_7d=r['d7'] or 0, last_30d=r['d30'] or 0,
+        )
+        for r in agg.iterator(chunk_size=2000)
+    ]
+    update_fields = ['last_7d', 'last_30d'] + (['total'] if full else [])
+    with transaction.atomic():
+        if full:
+            totals_model.objects.all().delete()
+        else:
+            totals_model.objects.filter(Q(last_7d__gt=0) | Q(last_30d__gt=0)).update(last_7d=0, last_30d=0)
+        totals_model.objects.bulk_create(
+            rows, batch_size=2000, update_conflicts=True,
+            unique_fields=['content_type', 'object_id'], update_fields=update_fields,
+        )
+    return len(rows)
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        view_counter.flush()
+    except Exception:
+        pass
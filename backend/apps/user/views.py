@@ -4,7 +4,7 @@ import io
 import base64
 import uuid
 from datetime import date
-from django.core.cache import cache
+from common.cache import SubsystemCache
 from django.contrib.auth import get_user_model, logout
 from django.contrib.auth.models import User
 from django.db.models import Q
@@ -12,12 +12,14 @@ from rest_framework import viewsets, mixins, filters, permissions, authenticatio
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 from common import pagination
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.decorators import action
 from apps.user.serializer import RegisterSerializer, SendEmailCodeSerializer, VerifyEmailCodeSerializer, \
     UserInfoSerializer, UpdateEmailSerializer, ChangePasswordSerializer, UploadImageSerializer, \
     PasswordResetRequestSerializer, PasswordResetConfirmSerializer, UserMeSerializer, UserListSerializer, \
-    UserDetailSerializer, NotificationSerializer, FriendshipSerializer, PrivateMessageSerializer
+    UserDetailSerializer, NotificationSerializer, BroadcastSerializer, FriendshipSerializer, PrivateMessageSerializer
 from apps.user.models import Notification, Friendship, PrivateMessage
+from apps.user.avatar_utils import user_avatar_url
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from common.utils import generate_catcha_image
 from django.core.files.storage import default_storage
@@ -27,6 +29,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.authentication import SessionAuthentication
 User = get_user_model()
+# 验证码 / 邮箱验证码
+auth_cache = SubsystemCache('auth')
 
     
 class RegisterViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
@@ -48,7 +52,7 @@ class SendEmailCodeGenericAPIView(GenericAPIView):
 
         code = ''.join(random.sample(string.ascii_letters + string.digits, 4))
         email = serializer.validated_data['email']
-        cache.get_or_set(email, code, 60 * 5)
+        auth_cache.get_or_set(email, code, 60 * 5)
 
         from django.core.mail import send_mail
         send_mail(
@@ -67,7 +71,7 @@ class VerifyEmailCodeGenericAPIView(GenericAPIView):
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        cache.delete(serializer.data['email'])
+        auth_cache.delete(serializer.data['email'])
         return Response({'msg': 'Verification success!'})
 
 
@@ -241,7 +245,7 @@ class CaptchaGenericAPIView(GenericAPIView):
     def get(self, request, *args, **kwargs):
         image, text = generate_catcha_image()
         uid = uuid.uuid4().hex
-        cache.set(uid, text, 60 * 5)
+        auth_cache.set(uid, text, 60 * 5)
 
         buf = io.BytesIO()
         image.save(buf, format='PNG')  # 大写也行
@@ -284,7 +288,7 @@ class PasswordResetRequestAPIView(GenericAPIView):
         s.is_valid(raise_exception=True)
         email = s.validated_data["email"]
         code = ''.join(random.sample(string.ascii_letters + string.digits, 4))
-        cache.set(email, code, 300)
+        auth_cache.set(email, code, 300)
         send_mail("Password reset code", f"Your code is {code}", "admin@gmail.com", [email])
         return Response({"msg": "If the email exists, a reset code has been sent."})
 
@@ -299,7 +303,7 @@ class PasswordResetConfirmAPIView(GenericAPIView):
         user = s.validated_data["user"]
         user.set_password(s.validated_data["new_password"])
         user.save()
-        cache.delete(s.validated_data["email"])
+        auth_cache.delete(s.validated_data["email"])
         return Response({"msg": "Password has been reset."})
     
 class UserMeView(generics.RetrieveUpdateAPIView):
@@ -380,7 +384,8 @@ class NotificationViewSet(viewsets.ModelViewSet):
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]  # 需要认证
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
-    pagination_class = pagination.PageNumberPagination
+    pagination_class = pagination.PageOrKeysetPagination
+    cursor_ordering_field = 'created_at'
     
     def initial(self, request, *args, **kwargs):
         import logging
@@ -406,11 +411,29 @@ class NotificationViewSet(viewsets.ModelViewSet):
             raise PermissionDenied('You do not have permission to access this notification.')
         return obj
     
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def broadcast(self, request):
+        """管理员系统广播：给全部/筛选出的用户发 system 通知，提交后在后台分块批量写入"""
+        from apps.user.notifications import notify
+        serializer = BroadcastSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipients = serializer.recipients()
+        count = recipients.count()
+        notify(
+            recipients,
+            notification_type='system',
+            title=serializer.validated_data['title'],
+            content=serializer.validated_data['content'],
+            from_user=request.user,
+        )
+        return Response({'recipients': count}, status=status.HTTP_202_ACCEPTED)
+
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
-        """获取未读通知数"""
-        count = Notification.objects.filter(user=request.user, is_read=False).count()
-        return Response({'unread_count': count})
+        """获取未读通知数（按主键读计数行，附带分类型计数与未读私信数）"""
+        from apps.user import unread
+        counts = unread.counts(request.user.id)
+        return Response({'unread_count': counts['notifications'], **counts})
     
     @action(detail=False, methods=['get'])
     def unread(self, request):
@@ -422,11 +445,17 @@ class NotificationViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def mark_all_as_read(self, request):
         """标记所有通知为已读"""
+        from django.db import transaction
         from django.utils import timezone
-        Notification.objects.filter(user=request.user, is_read=False).update(
-            is_read=True,
-            read_at=timezone.now()
-        )
+        from apps.user import unread
+        with transaction.atomic():
+            # 先锁计数行：并发写入的新通知要么在此之前提交（会被一起标记），要么在清零之后再累加
+            unread.lock(request.user.id)
+            Notification.objects.filter(user=request.user, is_read=False).update(
+                is_read=True,
+                read_at=timezone.now()
+            )
+            unread.reset(request.user.id, unread.NOTIFICATION_FIELDS)
         return Response({'message': 'All notifications marked as read'})
     
     @action(detail=True, methods=['post'])
@@ -443,7 +472,7 @@ class AvatarViewSet(viewsets.ViewSet):
     """
     User avatar management
     - GET  /user/avatars/{user_id}/          - Get user avatar
-    - GET  /user/avatars/{user_id}/default/  - Get default avatar (initials)
+    - GET  /user/avatars/{user_id}/default/  - Get default avatar (initials), ?size=
     - POST /user/avatars/upload/              - Upload custom avatar
     - DELETE /user/avatars/delete/            - Delete custom avatar (revert to default)
     """
@@ -515,25 +544,17 @@ class AvatarViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'], url_path='reset', url_name='reset-avatar')
     def reset_to_default(self, request):
-        """Reset to default avatar"""
+        """Reset to default avatar (served by the default endpoint, no per-user file)"""
         user = request.user
         
         try:
-            from .avatar_utils import generate_default_avatar
-            
             # Delete existing custom avatar
             if user.profile.avatar:
-                user.profile.avatar.delete()
-            
-            # Generate and save default avatar
-            default_avatar = generate_default_avatar(user.username)
-            user.profile.avatar.save(
-                f'{user.username}_avatar.png',
-                default_avatar,
-                save=True
-            )
+                user.profile.avatar.delete(save=False)
+                user.profile.avatar = None
+                user.profile.save(update_fields=['avatar'])
             
-            serializer = UserMeSerializer(user)
+            serializer = UserMeSerializer(user, context={'request': request})
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response(
@@ -541,6 +562,29 @@ class AvatarViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['get'], url_path='default', url_name='default',
+            permission_classes=[AllowAny], authentication_classes=[])
+    def default(self, request, pk=None):
+        """Default avatar (initials) PNG: ?size=32..512, rendered once per combination and cached"""
+        from django.http import Http404, HttpResponse
+        from django.utils.cache import get_conditional_response, patch_cache_control
+        from django.utils.http import quote_etag
+        from .avatar_utils import avatar_size, default_avatar_key, render_default_avatar
+
+        username = get_user_model().objects.filter(pk=pk).values_list('username', flat=True).first()
+        if not username:
+            raise Http404('User not found')
+        size = avatar_size(request.query_params.get('size'))
+        etag = quote_etag(default_avatar_key(username, size))
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(render_default_avatar(username, size), content_type='image/png')
+        response['ETag'] = etag
+        # 用户名变化会换图，所以不能 immutable；一天内直接用缓存，之后凭 ETag 再验证
+        patch_cache_control(response, public=True, max_age=60 * 60 * 24)
+        return response
+
 
 class FriendshipViewSet(viewsets.ModelViewSet):
     """好友管理 API"""
@@ -680,21 +724,13 @@ class FriendshipViewSet(viewsets.ModelViewSet):
         friends = []
         for friendship in friendships:
             friend = friendship.to_user if friendship.from_user == request.user else friendship.from_user
-            avatar_url = None
-            
-            # 获取 userprofile 和 avatar (使用 related_name 'profile')
-            if hasattr(friend, 'profile') and friend.profile.avatar:
-                avatar_url = friend.profile.avatar.url
-                # 转换相对路径为绝对URL
-                if avatar_url.startswith('/'):
-                    avatar_url = request.build_absolute_uri(avatar_url)
-            
             friends.append({
                 'id': friend.id,
                 'friendship_id': friendship.id,  # 添加friendship_id用于删除好友
                 'username': friend.username,
                 'email': friend.email,
-                'avatar': avatar_url,
+                # 没有自定义头像时回落到默认头像端点
+                'avatar': user_avatar_url(friend, request),
             })
         
         # 分页
@@ -718,6 +754,8 @@ class PrivateMessageViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     authentication_classes = [JWTAuthentication]
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
+    pagination_class = pagination.PageOrKeysetPagination
+    cursor_ordering_field = 'created_at'
     
     def get_queryset(self):
         user = self.request.user
@@ -767,37 +805,122 @@ class PrivateMessageViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    @action(detail=False, methods=['get'])
+    def inbox(self, request):
+        """
+        会话列表（每个对方一条：最后一条消息、时间、我的未读数），按最后消息时间倒序；
+        ?cursor= 取下一页，?page_size= 每页条数（默认 20，最多 100）
+        """
+        from apps.user import conversations
+        from apps.user.serializer import ConversationSerializer
+
+        paginator = pagination.KeysetPagination()
+        paginator.page_size = 20
+        limit = paginator.get_page_size(request)
+        token = request.query_params.get(paginator.cursor_query_param)
+        after = paginator.decode_cursor(token) if token else None
+        rows, has_next = conversations.inbox(request.user.id, after=after, limit=limit)
+
+        next_link = None
+        if has_next and rows:
+            last = rows[-1]
+            next_link = replace_query_param(
+                request.build_absolute_uri(), paginator.cursor_query_param,
+                paginator.encode_cursor(last.last_message_at, last.pk),
+            )
+        serializer = ConversationSerializer(rows, many=True, context={'request': request})
+        return Response({'next': next_link, 'results': serializer.data})
+
     @action(detail=False, methods=['get'])
     def conversation(self, request):
-        """获取与某用户的对话"""
+        """
+        获取与某用户的对话（升序，最新的消息在最后）。
+        ?pagination=cursor 或 ?cursor= 时只返回最新一页，next 为“加载更早消息”的链接；
+        不带时仍返回完整历史（兼容现有前端）
+        """
         user_id = request.query_params.get('user_id')
-        if not user_id:
+        if not user_id or not user_id.isdigit():
             return Response({'error': '缺少user_id参数'}, status=status.HTTP_400_BAD_REQUEST)
         
         messages = PrivateMessage.objects.filter(
             Q(sender=request.user, recipient_id=user_id) |
             Q(sender_id=user_id, recipient=request.user)
-        ).order_by('created_at')  # 按升序排列，最新的消息在最后
-        
-        serializer = self.get_serializer(messages, many=True, context={'request': request})
+        ).select_related('sender__profile', 'recipient__profile')
+
+        from apps.user import conversations
+        # 已读回执：对方已读到的消息 id，我发出的 id <= read_up_to 的消息即已读
+        read_receipt = conversations.read_receipt(request.user.id, int(user_id))
+
+        paginator = pagination.KeysetPagination()
+        if request.query_params.get('pagination') == 'cursor' or paginator.cursor_query_param in request.query_params:
+            # 游标按 (created_at, id) 倒序取更早的一页，页内再翻回升序
+            page = paginator.paginate_queryset(messages, request, view=self)
+            serializer = self.get_serializer(page[::-1], many=True, context={'request': request})
+            response = paginator.get_paginated_response(serializer.data)
+            response.data['peer_read_receipt'] = read_receipt
+            return response
+
+        serializer = self.get_serializer(messages.order_by('created_at'), many=True, context={'request': request})
         return Response({
-            'results': serializer.data
+            'results': serializer.data,
+            'peer_read_receipt': read_receipt,
         })
     
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        """未读私信数（与通知共用计数行）"""
+        from apps.user import unread
+        counts = unread.counts(request.user.id)
+        return Response({'unread_count': counts['messages'] + counts['system_messages'],
+                         'messages': counts['messages'], 'system_messages': counts['system_messages']})
+
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
-        """标记消息为已读"""
+        """标记消息为已读（与批量已读同一条路径：条件 UPDATE，计数在同一事务内扣减）"""
+        from apps.user import conversations
+
         message = self.get_object()
         if message.recipient != request.user:
             return Response({'error': '只有接收者能标记消息为已读'}, status=status.HTTP_403_FORBIDDEN)
         
-        from django.utils import timezone
-        message.is_read = True
-        message.read_at = timezone.now()
-        message.save()
+        conversations.mark_read(request.user.id, message.sender_id, message_ids=[message.pk])
+        message.refresh_from_db(fields=['is_read', 'read_at'])
         serializer = self.get_serializer(message)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'])
+    def mark_conversation_read(self, request):
+        """
+        把与 user_id 的会话标为已读，一条 UPDATE：
+        可选 up_to_id（已读到的消息 id，含）或 up_to（ISO 时间，含），都不给时全部已读。
+        返回本次标记条数、已读水位和新的未读数
+        """
+        from django.utils.dateparse import parse_datetime
+        from apps.user import conversations, unread
+
+        try:
+            peer_id = int(request.data.get('user_id'))
+            up_to_id = request.data.get('up_to_id')
+            up_to_id = int(up_to_id) if up_to_id not in (None, '') else None
+        except (TypeError, ValueError):
+            return Response({'error': '缺少或无效的user_id/up_to_id'}, status=status.HTTP_400_BAD_REQUEST)
+        up_to = request.data.get('up_to')
+        if up_to:
+            up_to = parse_datetime(str(up_to))
+            if up_to is None:
+                return Response({'error': 'up_to 需为 ISO 8601 时间'}, status=status.HTTP_400_BAD_REQUEST)
+
+        marked, read_up_to = conversations.mark_read(request.user.id, peer_id, up_to_id=up_to_id, up_to=up_to or None)
+        counts = unread.counts(request.user.id)
+        return Response({
+            'marked': marked,
+            'read_up_to': read_up_to,
+            'conversation_unread': conversations.unread_in(request.user.id, peer_id),
+            'unread_count': counts['messages'] + counts['system_messages'],
+            'messages': counts['messages'],
+            'system_messages': counts['system_messages'],
+        })
+
 
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
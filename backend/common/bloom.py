@@ -0,0 +1,91 @@
+"""
+布隆过滤器：用固定大小的位数组做“是否见过”的判重，只会误判“见过”（假阳性），不会漏判。
+
+按 capacity / error_rate 计算位数 m 与哈希个数 k；k 个位置由 blake2b 的两个 64 位值做双重哈希得到。
+10 万元素、1% 误判率约 117 KB，远小于逐条缓存键。
+
+固定大小的过滤器超过 capacity 后误判率迅速上升（真实的新元素被当成“见过”）。
+ScalableBloomFilter 在当前过滤器装满时追加一个容量翻倍、误判率减半的新过滤器，
+总误判率不超过 error_rate，内存随实际元素数增长。
+"""
+import hashlib
+import math
+import threading
+
+
+class BloomFilter:
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.01):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be > 0 and 0 < error_rate < 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        data = item if isinstance(item, bytes) else str(item).encode("utf-8")
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, item) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def add(self, item) -> bool:
+        """加入元素；返回 True 表示此前（大概率）没见过，False 表示已存在或误判为已存在"""
+        positions = self._positions(item)
+        with self._lock:
+            bits = self.bits
+            new = False
+            for p in positions:
+                byte, mask = p >> 3, 1 << (p & 7)
+                if not bits[byte] & mask:
+                    bits[byte] |= mask
+                    new = True
+            if new:
+                self.count += 1
+            return new
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def is_full(self) -> bool:
+        return self.count >= self.capacity
+
+
+class ScalableBloomFilter:
+    """
+    一组 BloomFilter：判重查全部，只往最新的一个里加；最新的装满时追加一个
+    capacity * growth、error_rate * tightening 的新过滤器（误判率之和收敛于 error_rate）
+    """
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.01, growth: int = 2, tightening: float = 0.5):
+        if not 0 < tightening < 1:
+            raise ValueError("0 < tightening < 1")
+        self.growth = growth
+        self.tightening = tightening
+        self.error_rate = error_rate
+        self.filters = [BloomFilter(capacity, error_rate * (1 - tightening))]
+        self._lock = threading.Lock()
+
+    def __contains__(self, item) -> bool:
+        return any(item in f for f in self.filters)
+
+    def add(self, item) -> bool:
+        with self._lock:
+            if item in self:
+                return False
+            current = self.filters[-1]
+            if current.is_full:
+                current = BloomFilter(current.capacity * self.growth, current.error_rate * self.tightening)
+                self.filters.append(current)
+            return current.add(item)
+
+    def __len__(self):
+        return sum(len(f) for f in self.filters)
@@ -0,0 +1,250 @@
+"""
+两级缓存后端：进程内 LRU（L1）+ 共享的网络缓存（L2，通常是 Redis）。
+
+- L1 按 LOCATION 在进程内共享（与 LocMemCache 相同的做法，Django 每个线程各有一个后端实例），
+  条目的存活时间不超过 L1_TIMEOUT 秒，用来限制其他进程写入后本进程读到旧值的窗口；
+  对一致性敏感的子系统（验证码、邮箱验证码）把 L1_MAX_ENTRIES 设为 0 即只走 L2。
+- L2 是任意 Django 缓存后端，配置放在 OPTIONS["L2"]；键已由本后端加好 KEY_PREFIX/版本，L2 原样使用。
+- 每个 LOCATION 记录 l1_hits / l2_hits / misses / sets / deletes，cache_stats() 汇总供监控。
+
+配置示例：
+    CACHES = {
+        "geocode": {
+            "BACKEND": "common.cache.TieredCache",
+            "LOCATION": "geocode",
+            "KEY_PREFIX": "gc",
+            "OPTIONS": {
+                "L1_MAX_ENTRIES": 2000, "L1_TIMEOUT": 60,
+                "L2": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://redis:6379/1"},
+            },
+        },
+    }
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache, InvalidCacheBackendError
+from django.utils.module_loading import import_string
+
+_MISSING = object()
+
+# LOCATION -> _LocalStore，进程内共享
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def raw_key(key, key_prefix, version):
+    """L2 的 KEY_FUNCTION：键在 TieredCache 里已处理过，不再加前缀"""
+    return key
+
+
+class _LocalStore:
+    """线程安全的 LRU：key -> (过期时间戳, pickle 后的值)；存 pickle 是为了调用方修改返回值时不污染缓存"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "sets": 0, "deletes": 0}
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return _MISSING
+            expires, payload = item
+            if expires <= time.monotonic():
+                del self.data[key]
+                return _MISSING
+            self.data.move_to_end(key)
+        return pickle.loads(payload)
+
+    def set(self, key, value, ttl):
+        if self.max_entries <= 0 or ttl <= 0:
+            return
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.data[key] = (time.monotonic() + ttl, payload)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.stats[name] += n
+
+
+def _get_store(name, max_entries):
+    with _stores_lock:
+        store = _stores.get(name)
+        if store is None:
+            store = _stores[name] = _LocalStore(max_entries)
+        return store
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = dict(params.get("OPTIONS") or {})
+        l2 = dict(options.pop("L2", None) or {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"})
+        backend = l2.pop("BACKEND")
+        l2_location = l2.pop("LOCATION", location or "")
+        l2.update(KEY_FUNCTION=raw_key, KEY_PREFIX="", VERSION=1)
+        l2.setdefault("TIMEOUT", params.get("TIMEOUT", 300))
+        try:
+            self.l2 = import_string(backend)(l2_location, l2)
+        except ImportError as e:
+            raise InvalidCacheBackendError(f"Could not load L2 cache backend '{backend}': {e}") from e
+        self.name = location or "default"
+        self.l1_timeout = float(options.get("L1_TIMEOUT", 5))
+        self.l1 = _get_store(self.name, int(options.get("L1_MAX_ENTRIES", 1000)))
+
+    def _l1_ttl(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return self.l1_timeout
+        return min(self.l1_timeout, timeout - time.time())
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        added = self.l2.add(key, value, timeout)
+        if added:
+            self.l1.count("sets")
+            self.l1.set(key, value, self._l1_ttl(timeout))
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        value = self.l1.get(key)
+        if value is not _MISSING:
+            self.l1.count("l1_hits")
+            return value
+        value = self.l2.get(key, _MISSING)
+        if value is _MISSING:
+            self.l1.count("misses")
+            return default
+        self.l1.count("l2_hits")
+        self.l1.set(key, value, self.l1_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.l2.set(key, value, timeout)
+        self.l1.count("sets")
+        self.l1.set(key, value, self._l1_ttl(timeout))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self.l2.touch(key, timeout)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.l1.delete(key)
+        self.l1.count("deletes")
+        return self.l2.delete(key)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self.l1.get(key) is not _MISSING or self.l2.has_key(key)
+
+    def get_many(self, keys, version=None):
+        found, pending = {}, {}
+        for k in keys:
+            key = self.make_and_validate_key(k, version=version)
+            value = self.l1.get(key)
+            if value is _MISSING:
+                pending[key] = k
+            else:
+                found[k] = value
+        self.l1.count("l1_hits", len(found))
+        if pending:
+            fetched = self.l2.get_many(list(pending))
+            for key, value in fetched.items():
+                found[pending[key]] = value
+                self.l1.set(key, value, self.l1_timeout)
+            self.l1.count("l2_hits", len(fetched))
+            self.l1.count("misses", len(pending) - len(fetched))
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        made = {self.make_and_validate_key(k, version=version): v for k, v in data.items()}
+        failed = set(self.l2.set_many(made, timeout) or ())
+        ttl = self._l1_ttl(timeout)
+        for key, value in made.items():
+            if key not in failed:
+                self.l1.set(key, value, ttl)
+        self.l1.count("sets", len(made) - len(failed))
+        return [k for k in data if self.make_and_validate_key(k, version=version) in failed]
+
+    def delete_many(self, keys, version=None):
+        made = [self.make_and_validate_key(k, version=version) for k in keys]
+        for key in made:
+            self.l1.delete(key)
+        self.l1.count("deletes", len(made))
+        self.l2.delete_many(made)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.l1.delete(key)
+        try:
+            return self.l2.incr(key, delta)
+        except ValueError:
+            raise ValueError("Key '%s' not found" % key)
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+
+def cache_for(subsystem: str):
+    """子系统专用的缓存（CACHES 中同名别名）；未配置时退回 default，便于测试里只覆盖 default"""
+    try:
+        return caches[subsystem]
+    except InvalidCacheBackendError:
+        return caches["default"]
+
+
+class SubsystemCache:
+    """
+    模块级可用的惰性代理（同 django.core.cache.cache）：每次访问时才解析别名，
+    因此按线程取后端、override_settings(CACHES=...) 都照常生效。
+        auth_cache = SubsystemCache("auth")
+    """
+
+    def __init__(self, subsystem: str):
+        self.subsystem = subsystem
+
+    def __getattr__(self, name):
+        return getattr(cache_for(self.subsystem), name)
+
+    def __repr__(self):
+        return f"<SubsystemCache {self.subsystem}>"
+
+
+def cache_stats():
+    """进程内各 TieredCache 的计数快照：{LOCATION: {l1_hits, l2_hits, misses, sets, deletes, l1_entries, hit_rate}}"""
+    out = {}
+    with _stores_lock:
+        stores = dict(_stores)
+    for name, store in stores.items():
+        with store.lock:
+            stats = dict(store.stats)
+            stats["l1_entries"] = len(store.data)
+        lookups = stats["l1_hits"] + stats["l2_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["l1_hits"] + stats["l2_hits"]) / lookups, 4) if lookups else None
+        out[name] = stats
+    return out
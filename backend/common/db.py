@@ -0,0 +1,42 @@
+"""
+数据库小工具：PostgreSQL 的原子累加 upsert。
+
+Django 的 bulk_create(update_conflicts=True) 只能用 EXCLUDED 覆盖旧值，不能做 `col = col + EXCLUDED.col`，
+计数器类的表（聚类计数、浏览量等）用这里的 upsert_increment，一条语句完成插入或累加，并发安全。
+"""
+from django.db import connection
+
+
+def upsert_increment(model, rows, *, key_fields, increment_fields, insert_only_fields=()):
+    """
+    rows: dict 列表，每个 dict 必须包含 key_fields + increment_fields（以及可选的 insert_only_fields）。
+    冲突（key_fields 唯一约束）时 increment_fields 做累加，insert_only_fields 只在首次插入时写入。
+    同一批里相同 key 的行需由调用方先合并（PostgreSQL 不允许一条 ON CONFLICT 语句里同一行被更新两次）。
+    返回受影响的行数。
+    """
+    if not rows:
+        return 0
+    qn = connection.ops.quote_name
+    meta = model._meta
+    table = qn(meta.db_table)
+    fields = list(key_fields) + list(increment_fields) + list(insert_only_fields)
+    columns = [meta.get_field(f).column for f in fields]
+
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    values_sql = ", ".join([placeholders] * len(rows))
+    params = []
+    for row in rows:
+        params.extend(row[f] for f in fields)
+
+    conflict = ", ".join(qn(meta.get_field(f).column) for f in key_fields)
+    updates = ", ".join(
+        f"{qn(col)} = {table}.{qn(col)} + EXCLUDED.{qn(col)}"
+        for col in (meta.get_field(f).column for f in increment_fields)
+    )
+    sql = (
+        f"INSERT INTO {table} ({', '.join(qn(c) for c in columns)}) VALUES {values_sql} "
+        f"ON CONFLICT ({conflict}) DO UPDATE SET {updates}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
@@ -0,0 +1,346 @@
+"""
+服务端推送的事件总线：进程内 pub/sub + 可插拔的跨进程后端。
+
+- subscribe(user_id) 返回 Subscription（asyncio 队列，async for 逐条取事件）；
+  一个空闲连接只占一个队列和一个挂起的协程，ASGI 下可同时挂住大量连接。
+- publish([(user_ids, event), ...]) 可在任意线程调用；默认在当前事务提交后发出（回滚则不发）。
+- 后端由 EVENT_BACKEND 指定：
+  - LocalBackend：直接投递给本进程的订阅者（单 worker / 开发 / 测试）；
+  - PostgresBackend：pg_notify 广播到所有 worker，每个进程一个监听线程
+    （独立连接 LISTEN，首次 subscribe 时启动）收到后投递给本进程订阅者。
+    NOTIFY 单条负载上限 8000 字节，publish 会把消息打包/拆分成多条。
+- 订阅者队列满（客户端太慢）时丢弃后续事件并投递一条 {"type": "resync"}，
+  客户端收到后重新拉取列表和未读数；监听连接断线重连后同样通知所有订阅者 resync。
+- 长轮询在两次请求之间没有订阅者：backlog(user_id) 为该用户在本进程保留最近的事件
+  （带递增序号，EVENT_LONG_POLL_BACKLOG_TTL 秒没有轮询即丢弃），下一次轮询凭游标补发。
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+RESYNC = {"type": "resync"}
+
+
+class Subscription:
+    def __init__(self, broker, user_id, maxsize):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def _put(self, event):
+        # 只在订阅者所在的事件循环线程里执行
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            # 腾出一个位置放 resync，之前排队的事件客户端重新拉取时会一并拿到
+            self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self, timeout=None):
+        """取下一条事件；超时返回 None"""
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is RESYNC:
+            self.overflowed = False
+        return event
+
+    async def get_batch(self, timeout=None, linger=0.05):
+        """等到第一条事件后再收集 linger 秒内陆续到达的事件（同一次写入的多条事件一起返回）"""
+        event = await self.get(timeout)
+        if event is None:
+            return []
+        batch = [event]
+        while True:
+            event = await self.get(linger)
+            if event is None:
+                return batch
+            batch.append(event)
+
+    def drain(self):
+        """取出已排队的全部事件（不等待）"""
+        events = []
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        self.overflowed = False
+        return events
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+
+class Backlog:
+    """一个长轮询用户最近的事件 (序号, 事件)；token 区分进程和代次，游标为 token:序号"""
+
+    def __init__(self, maxlen, ttl):
+        self.token = uuid.uuid4().hex[:12]
+        self.events = deque(maxlen=maxlen)
+        self.seq = 0
+        self.ttl = ttl
+        self.touch()
+
+    def touch(self):
+        self.expires_at = time.monotonic() + self.ttl
+
+    @property
+    def expired(self):
+        return self.expires_at <= time.monotonic()
+
+    def append(self, event):
+        self.seq += 1
+        self.events.append((self.seq, event))
+
+    def since(self, seq):
+        """序号大于 seq 的事件；其中有事件已被挤出队列时返回 None"""
+        if self.events and self.events[0][0] > seq + 1:
+            return None
+        return [(n, event) for n, event in self.events if n > seq]
+
+
+class Broker:
+    """进程内订阅表：user_id -> {Subscription}；长轮询用户另有 user_id -> Backlog"""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.backlogs = {}
+        self.lock = threading.Lock()
+
+    def backlog(self, user_id, maxlen, ttl):
+        """取（或新建）user_id 的 Backlog 并续期；顺带清掉过期的"""
+        with self.lock:
+            backlog = self.backlogs.get(user_id)
+            if backlog is None or backlog.expired:
+                for uid in [uid for uid, b in self.backlogs.items() if b.expired]:
+                    del self.backlogs[uid]
+                backlog = self.backlogs[user_id] = Backlog(maxlen, ttl)
+            backlog.touch()
+            return backlog
+
+    def since(self, backlog, seq):
+        with self.lock:
+            return backlog.since(seq)
+
+    def subscribe(self, user_id, maxsize=100):
+        sub = Subscription(self, user_id, maxsize)
+        with self.lock:
+            self.subscribers[user_id].add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            subs = self.subscribers.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self.subscribers[sub.user_id]
+
+    def dispatch(self, messages):
+        """messages: [(user_ids, event)]；按事件循环分组，每个循环只唤醒一次"""
+        by_loop = defaultdict(list)
+        with self.lock:
+            for user_ids, event in messages:
+                for user_id in user_ids:
+                    backlog = self.backlogs.get(user_id)
+                    if backlog is not None:
+                        backlog.append(event)
+                    for sub in self.subscribers.get(user_id, ()):
+                        by_loop[sub.loop].append((sub, event))
+        for loop, items in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, items)
+            except RuntimeError:
+                # 循环已关闭（连接刚断开），忽略
+                pass
+
+    def broadcast(self, event):
+        with self.lock:
+            user_ids = list(set(self.subscribers) | set(self.backlogs))
+        self.dispatch([(user_ids, event)])
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(subs) for subs in self.subscribers.values())
+
+
+def _deliver(items):
+    for sub, event in items:
+        sub._put(event)
+
+
+broker = Broker()
+
+
+# ============== 后端 ==============
+class LocalBackend:
+    """只投递给本进程：多 worker 部署时其他进程的订阅者收不到"""
+
+    def publish(self, messages):
+        broker.dispatch(messages)
+
+    def start(self):
+        pass
+
+
+class PostgresBackend:
+    """pg_notify 跨进程广播；负载为 JSON 数组 [[user_ids, event], ...]"""
+
+    CHANNEL = "straypet_events"
+    MAX_PAYLOAD = 7900
+    RECONNECT_DELAY = (1, 30)
+
+    def __init__(self, using="default"):
+        self.using = using
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def pack(self, messages):
+        """把消息打包成若干不超过 MAX_PAYLOAD 的负载；单条消息过大时拆分 user_ids"""
+        payloads, batch, size = [], [], 2
+        for user_ids, event in messages:
+            user_ids = list(user_ids)
+            body = json.dumps(event, ensure_ascii=False, separators=(",", ":"), default=str)
+            while user_ids:
+                # 单个用户 id 最多 11 字节，按剩余空间能放下的数量切分
+                room = (self.MAX_PAYLOAD - len(body.encode()) - 8) // 12
+                if room < 1:
+                    logger.warning("Event too large for NOTIFY, dropped: %s", event.get("type"))
+                    break
+                ids, user_ids = user_ids[:room], user_ids[room:]
+                item = f"[{json.dumps(ids, separators=(',', ':'))},{body}]"
+                item_size = len(item.encode()) + 1
+                if batch and size + item_size > self.MAX_PAYLOAD:
+                    payloads.append("[" + ",".join(batch) + "]")
+                    batch, size = [], 2
+                batch.append(item)
+                size += item_size
+        if batch:
+            payloads.append("[" + ",".join(batch) + "]")
+        return payloads
+
+    def publish(self, messages):
+        payloads = self.pack(messages)
+        if not payloads:
+            return
+        with connections[self.using].cursor() as cursor:
+            for payload in payloads:
+                cursor.execute("SELECT pg_notify(%s, %s)", [self.CHANNEL, payload])
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen_forever, name="event-listener", daemon=True)
+                self._thread.start()
+
+    def _connect(self):
+        import psycopg2
+        params = connections[self.using].get_connection_params()
+        params.pop("cursor_factory", None)
+        conn = psycopg2.connect(**params)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.CHANNEL}")
+        return conn
+
+    def _listen_forever(self):
+        delay, max_delay = self.RECONNECT_DELAY
+        reconnect = False
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                if reconnect:
+                    # 断线期间的事件已丢失
+                    broker.broadcast(RESYNC)
+                delay = self.RECONNECT_DELAY[0]
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    messages = []
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            messages.extend(json.loads(notify.payload))
+                        except ValueError:
+                            logger.warning("Malformed event payload ignored")
+                    if messages:
+                        broker.dispatch(messages)
+            except Exception:
+                logger.exception("Event listener connection lost, retrying in %ss", delay)
+                reconnect = True
+                time.sleep(delay)
+                delay = min(delay * 2, max_delay)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend():
+    path = getattr(settings, "EVENT_BACKEND", "common.events.LocalBackend")
+    with _backends_lock:
+        if path not in _backends:
+            _backends[path] = import_string(path)()
+        return _backends[path]
+
+
+def subscribe(user_id, maxsize=None):
+    """在事件循环内调用；用完调用 Subscription.close()"""
+    get_backend().start()
+    maxsize = maxsize or getattr(settings, "EVENT_QUEUE_SIZE", 100)
+    return broker.subscribe(user_id, maxsize)
+
+
+def backlog(user_id):
+    """长轮询用：user_id 在本进程的事件缓冲（存活 EVENT_LONG_POLL_BACKLOG_TTL 秒，每次轮询续期）"""
+    get_backend().start()
+    maxlen = getattr(settings, "EVENT_QUEUE_SIZE", 100)
+    return broker.backlog(user_id, maxlen, getattr(settings, "EVENT_LONG_POLL_BACKLOG_TTL", 60))
+
+
+def publish(messages, on_commit=True):
+    """messages: [(user_ids, event)]；event 为可 JSON 序列化的 dict，带 "type" 字段"""
+    messages = [(list(user_ids), event) for user_ids, event in messages if user_ids]
+    if not messages:
+        return
+
+    def send():
+        try:
+            get_backend().publish(messages)
+        except Exception:
+            # 推送失败不影响业务写入，客户端仍可通过接口拉取
+            logger.exception("Event publish failed")
+
+    if on_commit:
+        transaction.on_commit(send)
+    else:
+        send()
@@ -0,0 +1,128 @@
+"""
+轻量地理工具：geohash 编码、半径包围盒、Haversine 距离表达式。
+
+生产库没有 PostGIS 时用它们配合 Address(latitude, longitude) 上的 B-tree 索引：
+先用包围盒做索引范围扫描，再用 Haversine 精确过滤/排序。
+"""
+import math
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lon: float, precision: int = 9) -> str:
+    """标准 geohash（precision=9 约 5m 精度）"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                bits = (bits << 1) | 1
+                lon_lo = mid
+            else:
+                bits <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def geohash_decode(value: str):
+    """geohash -> (lat, lon) 格子中心点"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for ch in value:
+        idx = _BASE32.index(ch)
+        for shift in range(4, -1, -1):
+            bit = (idx >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                if bit:
+                    lon_lo = mid
+                else:
+                    lon_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return (lat_lo + lat_hi) / 2, (lon_lo + lon_hi) / 2
+
+
+def bounding_box(lat: float, lon: float, radius_km: float):
+    """
+    半径 radius_km 的外接经纬度矩形 (min_lat, min_lon, max_lat, max_lon)。
+    靠近极点或跨 180° 经线时经度范围退化为全范围。
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    cos_lat = math.cos(math.radians(lat))
+    if cos_lat < 1e-6 or max_lat >= 90.0 or min_lat <= -90.0:
+        return min_lat, -180.0, max_lat, 180.0
+    dlon = math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if min_lon < -180.0 or max_lon > 180.0:
+        return min_lat, -180.0, max_lat, 180.0
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def distance_km_expression(lat_field: str, lon_field: str, lat: float, lon: float):
+    """数据库侧的 Haversine 距离（公里），lat_field/lon_field 可以是跨关系的字段路径"""
+    lat1 = Radians(Cast(F(lat_field), FloatField()))
+    lon1 = Radians(Cast(F(lon_field), FloatField()))
+    lat2 = Radians(Value(float(lat)))
+    lon2 = Radians(Value(float(lon)))
+    a = (
+        Power(Sin((lat2 - lat1) / 2), 2)
+        + Cos(lat1) * Cos(lat2) * Power(Sin((lon2 - lon1) / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(a))
+
+
+def parse_point(value: str):
+    """'lat,lon' -> (lat, lon)；格式或范围不对抛 ValueError"""
+    parts = [p.strip() for p in (value or "").split(",")]
+    if len(parts) != 2:
+        raise ValueError("expected 'lat,lon'")
+    lat, lon = float(parts[0]), float(parts[1])
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("coordinates out of range")
+    return lat, lon
+
+
+def parse_bbox(value: str):
+    """'min_lon,min_lat,max_lon,max_lat'（与 GeoJSON/Mapbox 一致）-> (min_lat, min_lon, max_lat, max_lon)"""
+    parts = [p.strip() for p in (value or "").split(",")]
+    if len(parts) != 4:
+        raise ValueError("expected 'min_lon,min_lat,max_lon,max_lat'")
+    min_lon, min_lat, max_lon, max_lat = (float(p) for p in parts)
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180):
+        raise ValueError("invalid bbox")
+    return min_lat, min_lon, max_lat, max_lon
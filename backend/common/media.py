@@ -0,0 +1,129 @@
+"""
+媒体文件服务（替代 DEBUG 下无缓存的 FileResponse）。
+
+- URL 带 ?v=<版本指纹>（common.storage.ContentAddressedStorage.url 生成）且与当前文件一致时，
+  返回 `public, max-age=31536000, immutable`：浏览器永久缓存，换头像/换图后 URL 变化立即可见；
+  不带或版本不符时返回 `no-cache`，每次用 ETag 再验证（命中 304，不传输内容）。
+- 条件请求：If-None-Match / If-Modified-Since -> 304，If-Match / If-Unmodified-Since -> 412。
+- 单段 Range -> 206（视频、大图断点续传）；多段 Range 按整文件返回，非法范围 -> 416。
+- 设置 MEDIA_ACCEL_REDIRECT（如 "/protected-media/"）时，只返回头部并用 X-Accel-Redirect
+  交给 nginx（internal location 指向 MEDIA_ROOT）发送文件体；否则整文件走 FileResponse，
+  在 uvicorn ASGI worker 下由 Django 按块读出再发送（没有 sendfile），生产环境建议配置 MEDIA_ACCEL_REDIRECT。
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .storage import BLOB_DIR, file_version
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """
+    解析 Range 头，返回 (start, end)（含 end）；
+    无 Range/多段/格式不支持时返回 None（按整文件处理），范围不可满足时返回 False
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N：最后 N 个字节
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _iter_range(path, start, length):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except Exception:
+        raise Http404("File not found")
+    # 按规范化后的路径判断：pets/../.blobs/... 经 safe_join 后同样落在 blob 目录
+    relative = os.path.relpath(full_path, os.path.abspath(settings.MEDIA_ROOT))
+    if relative.split(os.sep, 1)[0] == BLOB_DIR:
+        raise Http404("File not found")
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        raise Http404(f"File not found: {path}")
+    if not os.path.isfile(full_path):
+        raise Http404(f"File not found: {path}")
+
+    version = file_version(st)
+    etag = quote_etag(version)
+    last_modified = int(st.st_mtime)
+
+    def headers(response):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["Cache-Control"] = IMMUTABLE if request.GET.get("v") == version else REVALIDATE
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return headers(conditional)
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or "application/octet-stream"
+    size = st.st_size
+
+    # If-Range 不匹配时忽略 Range，返回整文件
+    if_range = request.headers.get("If-Range")
+    byte_range = parse_range(request.headers.get("Range"), size) if not if_range or if_range == etag else None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return headers(response)
+
+    accel = getattr(settings, "MEDIA_ACCEL_REDIRECT", None)
+    if accel:
+        # nginx 负责发送文件体与 Range；这里已完成 304/412/416 判断
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = accel.rstrip("/") + "/" + relative.replace(os.sep, "/")
+        return headers(response)
+
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(_iter_range(full_path, start, length), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(length)
+    else:
+        response = FileResponse(open(full_path, "rb"), content_type=content_type)
+    if encoding:
+        response["Content-Encoding"] = encoding
+    return headers(response)
@@ -0,0 +1,135 @@
+"""
+最小的 Mapbox Vector Tile (v2.1) 点要素编码器，纯 Python、无额外依赖。
+
+只实现地图上用到的 POINT 几何；坐标换算（Web Mercator -> 瓦片像素）也在这里。
+协议定义见 https://github.com/mapbox/vector-tile-spec/blob/master/2.1/vector_tile.proto
+"""
+import math
+import struct
+
+EXTENT = 4096
+
+_POINT = 1
+_CMD_MOVE_TO = 1
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field: int, payload: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _varint_field(field: int, value: int) -> bytes:
+    return _key(field, 0) + _varint(value)
+
+
+def _packed(field: int, values) -> bytes:
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def _encode_value(value) -> bytes:
+    # Value 消息：1=string 3=double 4=int64 6=sint64 7=bool
+    if isinstance(value, bool):
+        return _varint_field(7, int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _varint_field(4, value)
+        return _varint_field(6, _zigzag(value))
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack("<d", value)
+    return _bytes_field(1, str(value).encode("utf-8"))
+
+
+def _mercator(lon: float, lat: float, n: int):
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    fx = (lon + 180.0) / 360.0 * n
+    fy = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return fx, fy
+
+
+def lonlat_to_tile_pixel(lon: float, lat: float, z: int, x: int, y: int, extent: int = EXTENT):
+    """经纬度 -> 瓦片 (z, x, y) 内的像素坐标（0..extent，超出即在瓦片外）"""
+    fx, fy = _mercator(lon, lat, 1 << z)
+    return int(round((fx - x) * extent)), int(round((fy - y) * extent))
+
+
+def lonlat_to_tile(lon: float, lat: float, z: int):
+    """经纬度所在的瓦片 (x, y)"""
+    n = 1 << z
+    fx, fy = _mercator(lon, lat, n)
+    return min(max(int(fx), 0), n - 1), min(max(int(fy), 0), n - 1)
+
+
+def tile_bounds(z: int, x: int, y: int):
+    """瓦片的经纬度范围 (min_lat, min_lon, max_lat, max_lon)"""
+    n = 1 << z
+
+    def lat_of(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return lat_of(y + 1), x / n * 360.0 - 180.0, lat_of(y), (x + 1) / n * 360.0 - 180.0
+
+
+def encode_layer(name: str, features, extent: int = EXTENT) -> bytes:
+    """
+    features: [(id 或 None, (px, py), {属性})]，坐标已是瓦片像素。
+    键/值按图层去重后写入 keys/values 表，要素的 tags 引用其下标。
+    """
+    keys, key_index = [], {}
+    values, value_index = [], {}
+    body = bytearray()
+    for fid, (px, py), props in features:
+        tags = []
+        for k, v in props.items():
+            if v is None:
+                continue
+            if k not in key_index:
+                key_index[k] = len(keys)
+                keys.append(k)
+            vk = (type(v).__name__, v)
+            if vk not in value_index:
+                value_index[vk] = len(values)
+                values.append(v)
+            tags += [key_index[k], value_index[vk]]
+        feature = bytearray()
+        if fid is not None:
+            feature += _varint_field(1, int(fid))
+        if tags:
+            feature += _packed(2, tags)
+        feature += _varint_field(3, _POINT)
+        feature += _packed(4, [(_CMD_MOVE_TO & 0x7) | (1 << 3), _zigzag(px), _zigzag(py)])
+        body += _bytes_field(2, bytes(feature))
+
+    layer = bytearray()
+    layer += _varint_field(15, 2)
+    layer += _bytes_field(1, name.encode("utf-8"))
+    layer += body
+    for k in keys:
+        layer += _bytes_field(3, k.encode("utf-8"))
+    for v in values:
+        layer += _bytes_field(4, _encode_value(v))
+    layer += _varint_field(5, extent)
+    return _bytes_field(3, bytes(layer))
+
+
+def encode_tile(layers) -> bytes:
+    """layers: {图层名: features}；返回 Tile 消息的字节"""
+    return b"".join(encode_layer(name, features) for name, features in layers.items())
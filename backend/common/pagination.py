@@ -1,6 +1,174 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 
 
 class PageNumberPagination(pagination.PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
+
+
+def approximate_count(model):
+    """
+    用 pg_class.reltuples 估算整表行数（ANALYZE/autovacuum 后更新），不做 COUNT(*)。
+    注意是整表估计，不考虑过滤条件；从未分析过的表返回 None。
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if not row or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    基于 (时间戳, id) 的游标分页：WHERE (ts, id) < (上一页最后一条) ORDER BY ts DESC, id DESC LIMIT n。
+    翻到多深都是一次索引范围扫描，也不需要 COUNT(*)。
+
+    视图通过 cursor_ordering_field 指定时间戳字段（默认 created_at）。
+    ?total=approx 时附带 pg_class.reltuples 的整表估计值。
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE or 10
+    max_page_size = 100
+    total_query_param = 'total'
+    ordering_field = 'created_at'
+
+    def get_ordering_field(self, view):
+        return getattr(view, 'cursor_ordering_field', None) or self.ordering_field
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    @staticmethod
+    def encode_cursor(value, pk):
+        raw = json.dumps([value.isoformat(), pk]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            ts = parse_datetime(value)
+            if ts is None:
+                raise ValueError(value)
+            return ts, int(pk)
+        except (TypeError, ValueError, json.JSONDecodeError):
+            raise NotFound('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.field = self.get_ordering_field(view)
+        self.page_size = self.get_page_size(request)
+        field = self.field
+
+        queryset = queryset.order_by(f'-{field}', '-pk')
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            ts, pk = self.decode_cursor(token)
+            # 额外的 field__lte 让 PostgreSQL 能直接在 (field, id) 索引上做范围扫描
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': ts}) | Q(**{field: ts, 'pk__lt': pk}),
+                **{f'{field}__lte': ts},
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+
+        self.total = None
+        if request.query_params.get(self.total_query_param) == 'approx':
+            self.total = approximate_count(queryset.model)
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(getattr(last, self.field), last.pk))
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ])
+        if self.total is not None:
+            payload['count'] = self.total
+            payload['count_is_approximate'] = True
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer', 'nullable': True},
+                'count_is_approximate': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+
+class PageOrKeysetPagination(pagination.BasePagination):
+    """
+    默认仍是页码分页（兼容现有前端）；带 ?pagination=cursor 或 ?cursor= 时切换到 KeysetPagination。
+    带 ?ordering= / ?search= / ?near=（按距离排序）时排序不再是 (ts, id)，始终用页码分页。
+    """
+    mode_query_param = 'pagination'
+    page_number_only_params = ('near',)
+
+    def __init__(self):
+        self.page_number = PageNumberPagination()
+        self.keyset = KeysetPagination()
+        self.active = self.page_number
+
+    def use_keyset(self, request):
+        params = request.query_params
+        if params.get(api_settings.ORDERING_PARAM) or params.get(api_settings.SEARCH_PARAM):
+            return False
+        if any(params.get(p) for p in self.page_number_only_params):
+            return False
+        return params.get(self.mode_query_param) == 'cursor' or self.keyset.cursor_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.active = self.keyset if self.use_keyset(request) else self.page_number
+        return self.active.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.active.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number.get_paginated_response_schema(schema)
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.active, 'display_page_controls', False)
+
+    def to_html(self):
+        return self.active.to_html() if self.active is self.page_number else ''
+
+    def get_results(self, data):
+        return data['results']
@@ -0,0 +1,196 @@
+"""
+媒体存储。
+
+ContentAddressedStorage：按内容去重的本地存储。文件内容只在 MEDIA_ROOT/.blobs/ab/cd/<sha256>
+存一份，业务文件名（pets/xxx.jpg 等，URL 不变）是指向该 blob 的硬链接；引用计数即文件系统的
+链接数（st_nlink - 1），最后一个业务文件删除时一并删掉 blob。copy_file 的硬链接同样计入引用。
+已有文件用 dedupe_media 命令迁移。
+
+url() 带上版本号（?v=<指纹>，由 inode/mtime/大小算出）：文件内容变化（同名重传也会换 inode）
+URL 随之变化，common.media.serve_media 对带正确版本号的请求返回一年的 immutable 缓存。
+
+copy_file：存储层文件复制，不经过 Python 内存搬运字节。
+
+- 本地文件存储（有 path()）：优先硬链接（同一文件系统，零拷贝、不占额外空间），
+  跨设备等不能硬链接时退回 shutil.copyfile（Linux 上走 sendfile/copy_file_range，内核内复制）；
+  目标名在 get_available_name() 之后被并发占用时换名重试，从不覆盖已有文件；
+- 提供 copy(src, dest) 的远端存储（部分对象存储后端）：服务端复制；
+- 其他存储：分块流式读写（File 按 chunk 迭代，不会 read() 整个文件）。
+"""
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = ".blobs"
+CHUNK_SIZE = 1024 * 1024
+# 这些错误表示“此处不能硬链接”（跨设备、文件系统不支持、链接数已满），copy_file 退回复制
+LINK_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP}
+
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as fh:
+        return hashlib.file_digest(fh, "sha256").hexdigest()
+
+
+def file_version(st: os.stat_result) -> str:
+    """文件版本指纹：只用 stat，不读内容；去重存储下内容不同必然是不同 inode"""
+    raw = f"{st.st_ino}:{st.st_mtime_ns}:{st.st_size}".encode()
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+@deconstructible(path="common.storage.ContentAddressedStorage")
+class ContentAddressedStorage(FileSystemStorage):
+    def blob_root(self):
+        return os.path.join(self.location, BLOB_DIR)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_root(), digest[:2], digest[2:4], digest)
+
+    def store_blob(self, content):
+        """把内容流式写入临时文件并计算 SHA-256，已有相同 blob 则丢弃临时文件；返回 (digest, blob 路径)"""
+        tmp_dir = os.path.join(self.blob_root(), "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        sha = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    sha.update(chunk)
+                    out.write(chunk)
+            digest = sha.hexdigest()
+            blob = self.blob_path(digest)
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            try:
+                # link 是原子的“不存在才创建”，并发写入同一内容时只有一个成为 blob
+                os.link(tmp_path, blob)
+            except FileExistsError:
+                pass
+        finally:
+            os.unlink(tmp_path)
+        return digest, blob
+
+    def _save(self, name, content):
+        _, blob = self.store_blob(content)
+        while True:
+            full_path = self.path(name)
+            directory = os.path.dirname(full_path)
+            if self.directory_permissions_mode is not None:
+                old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+                try:
+                    os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+                finally:
+                    os.umask(old_umask)
+            else:
+                os.makedirs(directory, exist_ok=True)
+            try:
+                if getattr(self, "_allow_overwrite", False) and os.path.lexists(full_path):
+                    tmp = f"{full_path}.{os.getpid()}.tmp"
+                    os.link(blob, tmp)
+                    self._unlink(full_path)
+                    os.replace(tmp, full_path)
+                else:
+                    os.link(blob, full_path)
+                break
+            except FileExistsError:
+                name = self.get_available_name(name)
+            except FileNotFoundError:
+                # blob 恰好被并发的最后一次删除移除：重新写入
+                _, blob = self.store_blob(content)
+        return str(name).replace("\\", "/")
+
+    def _unlink(self, full_path):
+        """删除业务文件；若它是 blob 的最后一个引用，同时删除 blob"""
+        try:
+            st = os.stat(full_path)
+        except FileNotFoundError:
+            return
+        blob = None
+        if st.st_nlink == 2:
+            # 只剩本文件 + blob 本身：按内容定位 blob（仅最后一次删除时需要读文件）
+            candidate = self.blob_path(file_digest(full_path))
+            if os.path.exists(candidate) and os.path.samefile(candidate, full_path):
+                blob = candidate
+        os.remove(full_path)
+        if blob:
+            try:
+                os.remove(blob)
+            except FileNotFoundError:
+                pass
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        full_path = self.path(name)
+        if os.path.isdir(full_path):
+            os.rmdir(full_path)
+        else:
+            self._unlink(full_path)
+
+    def references(self, name) -> int:
+        """name 所在 blob 被多少个业务文件引用（未去重的旧文件返回 1）"""
+        st = os.stat(self.path(name))
+        candidate = self.blob_path(file_digest(self.path(name)))
+        if os.path.exists(candidate) and os.path.samefile(candidate, self.path(name)):
+            return st.st_nlink - 1
+        return st.st_nlink
+
+    def url(self, name):
+        url = super().url(name)
+        try:
+            st = os.stat(self.path(name))
+        except (OSError, ValueError):
+            return url
+        return f"{url}?v={file_version(st)}"
+
+    def listdir(self, path):
+        directories, files = super().listdir(path)
+        if not path.strip("/"):
+            directories = [d for d in directories if d != BLOB_DIR]
+        return directories, files
+
+
+def copy_file(src_name: str, dest_name: str, storage=None) -> str:
+    """把存储内的 src_name 复制为 dest_name（重名时按存储规则改名），返回实际文件名"""
+    storage = storage or default_storage
+    dest_name = storage.get_available_name(dest_name)
+    try:
+        src_path = storage.path(src_name)
+        dest_path = storage.path(dest_name)
+    except NotImplementedError:
+        src_path = dest_path = None
+
+    if src_path is not None:
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        link = True
+        while True:
+            try:
+                if link:
+                    os.link(src_path, dest_path)
+                else:
+                    # 先独占创建目标再复制，不会覆盖（以及经硬链接改写）别人刚占用的文件
+                    os.close(os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+                    shutil.copyfile(src_path, dest_path)
+                return dest_name
+            except FileExistsError:
+                # get_available_name 之后被并发写入者占用：换个名字重试（同 ContentAddressedStorage._save）
+                dest_name = storage.get_available_name(dest_name)
+                dest_path = storage.path(dest_name)
+            except OSError as exc:
+                if not link or exc.errno not in LINK_UNSUPPORTED:
+                    raise
+                link = False
+
+    if hasattr(storage, "copy"):
+        storage.copy(src_name, dest_name)
+        return dest_name
+
+    with storage.open(src_name, "rb") as fh:
+        return storage.save(dest_name, File(fh))
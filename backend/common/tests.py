@@ -0,0 +1,67 @@
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from django.contrib.auth import get_user_model
+
+from common.cache import cache_for, cache_stats
+
+L2 = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiered-l2'}
+TIERED = {
+    'default': {
+        'BACKEND': 'common.cache.TieredCache', 'LOCATION': 'tiered-test', 'KEY_PREFIX': 'sp',
+        'OPTIONS': {'L1_MAX_ENTRIES': 2, 'L1_TIMEOUT': 60, 'L2': L2},
+    },
+    'auth': {
+        'BACKEND': 'common.cache.TieredCache', 'LOCATION': 'tiered-auth', 'KEY_PREFIX': 'auth',
+        'OPTIONS': {'L1_MAX_ENTRIES': 0, 'L2': L2},
+    },
+}
+
+
+@override_settings(CACHES=TIERED)
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_l1_then_l2_and_namespaces(self):
+        cache = caches['default']
+        cache.set('k', {'v': 1})
+        before = cache_stats()['tiered-test']['l1_hits']
+        self.assertEqual(cache.get('k'), {'v': 1})
+        self.assertEqual(cache_stats()['tiered-test']['l1_hits'], before + 1)
+
+        # 同名键在不同子系统互不影响
+        cache_for('auth').set('k', 'code')
+        self.assertEqual(cache.get('k'), {'v': 1})
+        self.assertEqual(cache_for('auth').get('k'), 'code')
+        # 未配置的子系统退回 default
+        self.assertIs(cache_for('geocode'), caches['default'])
+
+    def test_l1_eviction_falls_back_to_l2(self):
+        cache = caches['default']
+        cache.set_many({'a': 1, 'b': 2, 'c': 3})  # L1 只保留 2 条
+        before = cache_stats()['tiered-test']['l2_hits']
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(cache_stats()['tiered-test']['l2_hits'], before + 1)
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+    def test_returned_values_are_copies(self):
+        cache = caches['default']
+        cache.set('lst', [1])
+        cache.get('lst').append(2)
+        self.assertEqual(cache.get('lst'), [1])
+
+
+@override_settings(CACHES=TIERED)
+class CacheStatsEndpointTest(APITestCase):
+    def test_staff_only(self):
+        url = reverse('cache-stats')
+        self.assertIn(self.client.get(url).status_code, (401, 403))
+        admin = get_user_model().objects.create_user(username='ops', password='pass', is_staff=True)
+        self.client.force_authenticate(admin)
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsInstance(resp.data, dict)
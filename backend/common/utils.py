@@ -5,7 +5,7 @@ import logging
 from typing import Optional, Tuple, Dict, Any
 import requests
 from django.conf import settings
-from django.core.cache import cache
+from common.cache import SubsystemCache
 
 
 def random_string(length=4):
@@ -48,16 +48,17 @@ if __name__ == '__main__':
 
 # ============== Geocoding helpers ==============
 logger = logging.getLogger(__name__)
+geocode_cache = SubsystemCache('geocode')
 
 def _cache_get(key: str):
     try:
-        return cache.get(key)
+        return geocode_cache.get(key)
     except Exception:
         return None
 
 def _cache_set(key: str, value, timeout: int = 24*3600):
     try:
-        cache.set(key, value, timeout=timeout)
+        geocode_cache.set(key, value, timeout=timeout)
     except Exception:
         pass
 
@@ -69,41 +70,30 @@ def _mk_cache_key(prefix: str, payload: Dict[str, Any]) -> str:
     except Exception:
         return prefix
 
-def geocode_address(address: str, *, context: Optional[Dict[str, Any]] = None) -> Optional[Tuple[float, float]]:
-    """
-    Geocode a free-form address string to (lon, lat).
-    Prefers Mapbox when MAPBOX_TOKEN is configured; falls back to OSM Nominatim.
-    context may include: street, city, region, country, country_code, postal_code.
-    Caches results for 24 hours.
-    """
-    if not address or not isinstance(address, str):
-        return None
-    addr = address.strip()
-    if not addr:
-        return None
+class GeocodeError(Exception):
+    """服务商请求失败（网络错误、限流、5xx），区别于“查无此地址”的 None，调用方可据此重试"""
 
-    context = context or {}
-    cache_key = _mk_cache_key("geocode", {"addr": addr, **{k: v for k, v in context.items() if v}})
-    cached = _cache_get(cache_key)
-    if cached:
-        return cached
 
-    # When structured context is available, build a normalized address string
-    def _normalize_street(s: str) -> str:
-        s = str(s).strip()
-        # strip any trailing apartment/room info after a comma
-        if ',' in s:
-            s = s.split(',')[0].strip()
-        # reorder patterns like "12/16 Kopińska" -> "Kopińska 12/16"
-        try:
-            import re
-            m = re.match(r"^(\d+[\w\/-]*)\s+(.+)$", s)
-            if m:
-                return f"{m.group(2).strip()} {m.group(1).strip()}"
-        except Exception:
-            pass
-        return s
+def _normalize_street(s: str) -> str:
+    s = str(s).strip()
+    # strip any trailing apartment/room info after a comma
+    if ',' in s:
+        s = s.split(',')[0].strip()
+    # reorder patterns like "12/16 Kopińska" -> "Kopińska 12/16"
+    try:
+        import re
+        m = re.match(r"^(\d+[\w\/-]*)\s+(.+)$", s)
+        if m:
+            return f"{m.group(2).strip()} {m.group(1).strip()}"
+    except Exception:
+        pass
+    return s
+
 
+def build_geocode_query(address: str, context: Optional[Dict[str, Any]] = None) -> str:
+    """When structured context is available, build a normalized address string"""
+    addr = (address or '').strip()
+    context = context or {}
     if context:
         street = context.get('street')
         city = context.get('city')
@@ -120,92 +110,141 @@ def geocode_address(address: str, *, context: Optional[Dict[str, Any]] = None) -
             parts.append(str(country).strip())
         if parts:
             addr = ", ".join([p for p in parts if p])
+    return addr
 
-    # Try Mapbox Geocoding API
-    token = getattr(settings, 'MAPBOX_TOKEN', None) or getattr(settings, 'MAPBOX_ACCESS_TOKEN', None)
-    if token:
-        try:
-            params = {
-                "access_token": token,
-                "limit": 1,
-                "autocomplete": "false",
-                "types": "address,poi",
-                "language": "pl",
-            }
-            if context.get('country_code'):
-                params['country'] = str(context['country_code']).lower()
-            url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{requests.utils.quote(addr)}.json"
-            resp = requests.get(url, params=params, timeout=6)
-            if resp.ok:
-                data = resp.json()
-                feats = (data or {}).get('features', [])
-                if feats:
-                    feat0 = feats[0]
-                    # 要求足够相关且类型为 address/poi 才接受（略微放宽阈值以适配复杂门牌）
-                    if feat0.get('relevance', 0) >= 0.7 and any(t in ('address','poi') for t in feat0.get('place_type', [])):
-                        center = feat0.get('center')
-                        if isinstance(center, list) and len(center) >= 2:
-                            lon, lat = float(center[0]), float(center[1])
-                            _cache_set(cache_key, (lon, lat))
-                            return lon, lat
-            # 额外尝试将 “12/16” 简化为 “12”，并确保街道名在前
-            if context.get('street'):
-                s = _normalize_street(context['street'])
-                simple_s = s
-                if '/' in s:
-                    # reduce 12/16 -> 12
-                    try:
-                        simple_s = s.replace('/', ' ').split()[-1]
-                    except Exception:
-                        simple_s = s.split('/')[0]
-                # build alt address with city/postal
-                alt_addr = simple_s
-                if context.get('city'):
-                    alt_addr += f", {context['city']}"
-                if context.get('postal_code'):
-                    alt_addr += f", {context['postal_code']}"
-                params2 = dict(params)
-                url2 = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{requests.utils.quote(alt_addr)}.json"
-                resp2 = requests.get(url2, params=params2, timeout=6)
-                if resp2.ok:
-                    data2 = resp2.json()
-                    feats2 = (data2 or {}).get('features', [])
-                    if feats2:
-                        f0 = feats2[0]
-                        if f0.get('relevance', 0) >= 0.7 and any(t in ('address','poi') for t in f0.get('place_type', [])):
-                            center = f0.get('center')
-                            if isinstance(center, list) and len(center) >= 2:
-                                lon, lat = float(center[0]), float(center[1])
-                                _cache_set(cache_key, (lon, lat))
-                                return lon, lat
-        except Exception as e:
-            logger.debug('Mapbox geocoding failed: %s', e)
 
-    # Fallback to OSM Nominatim
+def _raise_for_status(resp):
+    if resp.status_code == 429 or resp.status_code >= 500:
+        raise GeocodeError(f'HTTP {resp.status_code}')
+
+
+def _mapbox_pick(resp) -> Optional[Tuple[float, float]]:
+    if not resp.ok:
+        return None
+    feats = (resp.json() or {}).get('features', [])
+    if feats:
+        feat0 = feats[0]
+        # 要求足够相关且类型为 address/poi 才接受（略微放宽阈值以适配复杂门牌）
+        if feat0.get('relevance', 0) >= 0.7 and any(t in ('address','poi') for t in feat0.get('place_type', [])):
+            center = feat0.get('center')
+            if isinstance(center, list) and len(center) >= 2:
+                return float(center[0]), float(center[1])
+    return None
+
+
+def geocode_mapbox(addr: str, context: Optional[Dict[str, Any]] = None, *, token: Optional[str] = None):
+    """Mapbox 查询（含门牌简化的第二次尝试）；查不到返回 None，请求失败抛 GeocodeError"""
+    context = context or {}
+    token = token or getattr(settings, 'MAPBOX_TOKEN', None) or getattr(settings, 'MAPBOX_ACCESS_TOKEN', None)
+    if not token:
+        return None
+    params = {
+        "access_token": token,
+        "limit": 1,
+        "autocomplete": "false",
+        "types": "address,poi",
+        "language": "pl",
+    }
+    if context.get('country_code'):
+        params['country'] = str(context['country_code']).lower()
     try:
-        url = "https://nominatim.openstreetmap.org/search"
-        headers = {"User-Agent": "straypet/1.0 (geocoder)"}
-        params: Dict[str, Any] = {"format": "jsonv2", "limit": 1, "addressdetails": 1, "accept-language": "pl"}
-        # 尽量使用结构化查询提升精度
-        if any(context.get(k) for k in ('street','city','country','postal_code')):
-            if context.get('street'):
-                params['street'] = context['street']
+        url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{requests.utils.quote(addr)}.json"
+        resp = requests.get(url, params=params, timeout=6)
+        _raise_for_status(resp)
+        coords = _mapbox_pick(resp)
+        if coords:
+            return coords
+        # 额外尝试将 “12/16” 简化为 “12”，并确保街道名在前
+        if context.get('street'):
+            s = _normalize_street(context['street'])
+            simple_s = s
+            if '/' in s:
+                # reduce 12/16 -> 12
+                try:
+                    simple_s = s.replace('/', ' ').split()[-1]
+                except Exception:
+                    simple_s = s.split('/')[0]
+            # build alt address with city/postal
+            alt_addr = simple_s
             if context.get('city'):
-                params['city'] = context['city']
+                alt_addr += f", {context['city']}"
             if context.get('postal_code'):
-                params['postalcode'] = context['postal_code']
-            if context.get('country'):
-                params['country'] = context['country']
-        else:
-            params['q'] = addr
+                alt_addr += f", {context['postal_code']}"
+            url2 = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{requests.utils.quote(alt_addr)}.json"
+            resp2 = requests.get(url2, params=dict(params), timeout=6)
+            _raise_for_status(resp2)
+            return _mapbox_pick(resp2)
+    except requests.RequestException as e:
+        raise GeocodeError(str(e)) from e
+    return None
+
+
+def geocode_nominatim(addr: str, context: Optional[Dict[str, Any]] = None):
+    """OSM Nominatim 查询；查不到返回 None，请求失败抛 GeocodeError"""
+    context = context or {}
+    url = "https://nominatim.openstreetmap.org/search"
+    headers = {"User-Agent": "straypet/1.0 (geocoder)"}
+    params: Dict[str, Any] = {"format": "jsonv2", "limit": 1, "addressdetails": 1, "accept-language": "pl"}
+    # 尽量使用结构化查询提升精度
+    if any(context.get(k) for k in ('street','city','country','postal_code')):
+        if context.get('street'):
+            params['street'] = context['street']
+        if context.get('city'):
+            params['city'] = context['city']
+        if context.get('postal_code'):
+            params['postalcode'] = context['postal_code']
+        if context.get('country'):
+            params['country'] = context['country']
+    else:
+        params['q'] = addr
+    try:
         resp = requests.get(url, params=params, headers=headers, timeout=8)
-        if resp.ok:
-            arr = resp.json() or []
-            if arr:
-                lat = float(arr[0].get('lat'))
-                lon = float(arr[0].get('lon'))
-                _cache_set(cache_key, (lon, lat))
-                return lon, lat
+    except requests.RequestException as e:
+        raise GeocodeError(str(e)) from e
+    _raise_for_status(resp)
+    if resp.ok:
+        arr = resp.json() or []
+        if arr:
+            return float(arr[0].get('lon')), float(arr[0].get('lat'))
+    return None
+
+
+def geocode_address(address: str, *, context: Optional[Dict[str, Any]] = None) -> Optional[Tuple[float, float]]:
+    """
+    Geocode a free-form address string to (lon, lat).
+    Prefers Mapbox when MAPBOX_TOKEN is configured; falls back to OSM Nominatim.
+    context may include: street, city, region, country, country_code, postal_code.
+    Caches results for 24 hours.
+    """
+    if not address or not isinstance(address, str):
+        return None
+    addr = address.strip()
+    if not addr:
+        return None
+
+    context = context or {}
+    cache_key = _mk_cache_key("geocode", {"addr": addr, **{k: v for k, v in context.items() if v}})
+    cached = _cache_get(cache_key)
+    if cached:
+        return cached
+
+    addr = build_geocode_query(addr, context)
+
+    # Try Mapbox Geocoding API
+    try:
+        coords = geocode_mapbox(addr, context)
+        if coords:
+            _cache_set(cache_key, coords)
+            return coords
+    except Exception as e:
+        logger.debug('Mapbox geocoding failed: %s', e)
+
+    # Fallback to OSM Nominatim
+    try:
+        coords = geocode_nominatim(addr, context)
+        if coords:
+            _cache_set(cache_key, coords)
+            return coords
     except Exception as e:
         logger.debug('Nominatim geocoding failed: %s', e)
 
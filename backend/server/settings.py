@@ -34,6 +34,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'apps.blog',
     'apps.user',
@@ -59,7 +60,11 @@ MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware'
 ]
 
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+STORAGES = {
+    # 媒体文件按 SHA-256 去重存放（common/storage.py），已有文件用 dedupe_media 迁移
+    "default": {"BACKEND": "common.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
 
 ROOT_URLCONF = 'server.urls'
 
@@ -118,13 +123,68 @@ DATABASES = {
     }
 }
 
-CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
-        "LOCATION": BASE_DIR / "django_cache",   # 确保这个目录存在/可写
-        "TIMEOUT": 300,                          # 可选：默认 300s
-        "OPTIONS": {"MAX_ENTRIES": 10000},       # 可选
+# 评论树（apps/comment/tree.py）：一次最多展开的回复层数 / 回复条数；回复允许的最大嵌套深度
+COMMENT_TREE_MAX_DEPTH = 3
+COMMENT_TREE_MAX_NODES = 500
+COMMENT_MAX_DEPTH = 30
+
+# 浏览量写后缓冲（apps/user/view_counter.py）：最多缓冲这么久 / 这么多个键再批量写库
+VIEW_COUNTER_FLUSH_INTERVAL = 10
+VIEW_COUNTER_MAX_PENDING = 1000
+# 每个进程懒启动一个守护线程按 FLUSH_INTERVAL 定时刷盘；False 则只在满 MAX_PENDING、退出或显式 flush() 时写库
+VIEW_COUNTER_AUTOFLUSH = True
+
+# 通知扇出（apps/user/notifications.py）：事务提交后交给后台线程批量写入；False 则在提交回调里同步写
+NOTIFICATION_FANOUT_ASYNC = True
+# 未读计数（apps/user/unread.py）的缓存镜像秒数；0 = 每次按主键读计数表
+UNREAD_COUNTER_CACHE_TIMEOUT = 0
+# 服务端推送（common/events.py, apps/user/realtime.py）：多 worker 用 PostgreSQL LISTEN/NOTIFY
+# 在进程间广播；单进程开发可设 EVENT_BACKEND=common.events.LocalBackend
+EVENT_BACKEND = os.environ.get("EVENT_BACKEND", "common.events.PostgresBackend")
+EVENT_STREAM_HEARTBEAT = 25
+EVENT_LONG_POLL_TIMEOUT = 25
+# 长轮询两次请求之间在本进程保留事件的秒数（凭 cursor 补发）
+EVENT_LONG_POLL_BACKLOG_TTL = 60
+# EventSource 用的一次性连接票据（POST /user/events/ticket/）有效秒数
+EVENT_STREAM_TICKET_TTL = 30
+# 每个连接最多排队的事件数，超出后推 resync 让客户端重新拉取
+EVENT_QUEUE_SIZE = 100
+
+# 两级缓存：进程内 LRU（L1）+ 共享 L2。设置 REDIS_URL 时 L2 为 Redis（多主机共享），
+# 否则退回本地文件缓存（单机开发）。各子系统用独立别名/前缀，见 common.cache.cache_for
+REDIS_URL = os.environ.get("REDIS_URL")
+
+
+def _tiered_cache(name, *, prefix, l1_entries=1000, l1_timeout=5, timeout=300, redis_db=0):
+    if REDIS_URL:
+        l2 = {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": f"{REDIS_URL.rstrip('/')}/{redis_db}",
+        }
+    else:
+        l2 = {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / "django_cache" / name,  # 确保这个目录存在/可写
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    return {
+        "BACKEND": "common.cache.TieredCache",
+        "LOCATION": name,
+        "KEY_PREFIX": prefix,
+        "TIMEOUT": timeout,
+        "OPTIONS": {"L1_MAX_ENTRIES": l1_entries, "L1_TIMEOUT": l1_timeout, "L2": l2},
     }
+
+
+CACHES = {
+    "default": _tiered_cache("default", prefix="sp"),
+    # 验证码/邮箱验证码：删除后必须立即失效，不走 L1
+    "auth": _tiered_cache("auth", prefix="auth", l1_entries=0),
+    "geocode": _tiered_cache("geocode", prefix="gc", l1_entries=2000, l1_timeout=300, timeout=60 * 60 * 24),
+    # 矢量瓦片按坐标精确失效，L1 只能短时间保留
+    "tiles": _tiered_cache("tiles", prefix="mvt", l1_entries=500, l1_timeout=2, timeout=60 * 60 * 24),
+    # 默认头像 PNG：按（首字母, 颜色, 尺寸）缓存，内容不变，长期保留
+    "avatars": _tiered_cache("avatars", prefix="av", l1_entries=2000, l1_timeout=60 * 60, timeout=None),
 }
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -163,6 +223,13 @@ STATIC_ROOT = BASE_DIR / 'static'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# 前面有 nginx 时设为其 internal location（指向 MEDIA_ROOT），媒体文件体由 nginx 发送（common/media.py）
+MEDIA_ACCEL_REDIRECT = os.environ.get("MEDIA_ACCEL_REDIRECT")
+
+# 上传图片的 thumb/card/full 派生图（apps/pet/images.py）：保存后由进程内线程池生成；
+# 设为 False 则在事务提交时同步生成
+IMAGE_DERIVATIVES_ASYNC = True
+IMAGE_DERIVATIVE_WORKERS = 2
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field